@@ -16,25 +16,54 @@ You should have received a copy of the GNU General Public License
 along with this program; if not, write to the Free Software
 Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
+import os
+import time
 import webbrowser
 from PyQt4.QtCore import QCoreApplication
+from PyQt4.QtCore import QTimer
 from PyQt4.QtGui import QAction
 from PyQt4.QtGui import QApplication
 from PyQt4.QtGui import QIcon
 from PyQt4.QtGui import QLabel
 from PyQt4.QtGui import QMessageBox
+from qgis.core import QgsMapLayerRegistry
+from qgis.core import QgsMessageLog
 from qgis.gui import QgsMessageBar
-from plugin import more_dialog
+from plugin import catalog_cache
+from plugin import circuit_breaker
+from plugin import error_summary
+from plugin import http_pool
+from plugin import metadata_cache
+from plugin import metrics
 from plugin import oauth2_utils
-from plugin import search_gme_dialog
 from plugin import settings
-from plugin import signin_dialog
-from plugin import upload_dialog
-from plugin import wms_dialog
+from plugin import upload_jobs
+from plugin import upload_session
 from plugin.datamodel import gme_layer
 from plugin.datamodel import gme_map
-# Initialize Qt resources
-import resources_rc
+
+# Directory holding the toolbar icons.
+IMAGES_DIR = os.path.join(os.path.dirname(__file__), 'images')
+
+
+def loadIcon(fileName):
+  """Loads a toolbar icon from the images directory.
+
+  The icons are read from disk so that the Qt resources, which only the
+  dialogs need, are not loaded when QGIS starts.
+
+  Args:
+    fileName: str, name of the image file.
+  Returns:
+    QIcon instance.
+  """
+  return QIcon(os.path.join(IMAGES_DIR, fileName))
+
+
+def loadResources():
+  """Registers the Qt resources used by the dialogs, on first use."""
+  # Importing the module registers the resources with Qt.
+  import resources_rc
 
 
 class GoogleMapsEngineConnector:
@@ -51,9 +80,10 @@ class GoogleMapsEngineConnector:
 
   def initGui(self):
     """Gui initialization procedure (for QGIS plugin api)."""
+    initStart = time.time()
     # Create action for sign-in icon
     self.signIn = QAction(
-        QIcon(':/plugins/googlemapsengineconnector/images/private-16.png'),
+        loadIcon('private-16.png'),
         QCoreApplication.translate(
             'GMEConnector',
             'Sign in or out of your Google Maps Engine account'),
@@ -67,7 +97,7 @@ class GoogleMapsEngineConnector:
 
     # Create action for search in GME icon
     self.searchGme = QAction(
-        QIcon(':/plugins/googlemapsengineconnector/images/search-16.png'),
+        loadIcon('search-16.png'),
         QCoreApplication.translate(
             'GMEConnector', 'Search for a Google Maps Engine asset'),
         self.iface.mainWindow())
@@ -77,7 +107,7 @@ class GoogleMapsEngineConnector:
 
     # Create action for search in gallery icon
     self.searchGallery = QAction(
-        QIcon(':/plugins/googlemapsengineconnector/images/gallery-16.png'),
+        loadIcon('gallery-16.png'),
         QCoreApplication.translate(
             'GMEConnector',
             'Search for a Google Maps Engine map in Google Earth Gallery'),
@@ -89,7 +119,7 @@ class GoogleMapsEngineConnector:
 
     # Create action for WMS overlay icon
     self.addWms = QAction(
-        QIcon(':/plugins/googlemapsengineconnector/images/overlay-16.png'),
+        loadIcon('overlay-16.png'),
         QCoreApplication.translate(
             'GMEConnector',
             'Add your selected Google Maps Engine service to your map'),
@@ -100,7 +130,7 @@ class GoogleMapsEngineConnector:
 
     # Create action for view in GME icon
     self.viewInGme = QAction(
-        QIcon(':/plugins/googlemapsengineconnector/images/maps_engine-16.png'),
+        loadIcon('maps_engine-16.png'),
         QCoreApplication.translate(
             'GMEConnector',
             'Open selected Google Maps Engine service in '
@@ -112,7 +142,7 @@ class GoogleMapsEngineConnector:
 
     # Create action for view in Google Maps icon
     self.viewInGoogleMaps = QAction(
-        QIcon(':/plugins/googlemapsengineconnector/images/maps-16.png'),
+        loadIcon('maps-16.png'),
         QCoreApplication.translate(
             'GMEConnector',
             'Open selected Google Maps Engine service in Google Maps'),
@@ -124,7 +154,7 @@ class GoogleMapsEngineConnector:
 
     # Create action for share secure link icon
     self.shareSecureLink = QAction(
-        QIcon(':/plugins/googlemapsengineconnector/images/link-16.png'),
+        loadIcon('link-16.png'),
         QCoreApplication.translate(
             'GMEConnector',
             'Generate a hyperlink to share the selected '
@@ -137,7 +167,7 @@ class GoogleMapsEngineConnector:
 
     # Create action for upload icon
     self.upload = QAction(
-        QIcon(':/plugins/googlemapsengineconnector/images/upload_item-16.png'),
+        loadIcon('upload_item-16.png'),
         QCoreApplication.translate(
             'GMEConnector',
             'Upload selected data to your Google Maps Engine account'),
@@ -187,15 +217,61 @@ class GoogleMapsEngineConnector:
     self.toolBar.addSeparator()
     self.toolBar.addAction(self.showMore)
 
-    # Hook up a slot when selection is changed
-    self.iface.mapCanvas().selectionChanged.connect(self.handleSelectionChange)
-    self.iface.mapCanvas().layersChanged.connect(self.handleSelectionChange)
-    self.iface.currentLayerChanged.connect(self.handleSelectionChange)
-    self.iface.legendInterface().itemRemoved.connect(self.handleSelectionChange)
+    # Layer id -> whether the layer was created by the connector.
+    self.connectorLayerCache = {}
+    # (layer id, selected_only) -> assets found by getAssetsFromLayer.
+    self.assetCache = {}
+    # Layer id -> (layer, slot) forgetting its assets when its features are
+    # edited.
+    self.editWatches = {}
+
+    # Hook up a slot when selection is changed. Signals often arrive in
+    # bursts, so the tools are updated once the burst has been processed.
+    self.selectionTimer = QTimer()
+    self.selectionTimer.setSingleShot(True)
+    self.selectionTimer.setInterval(0)
+    self.selectionTimer.timeout.connect(self.handleSelectionChange)
+    self.iface.mapCanvas().selectionChanged.connect(
+        self.handleLayerSelectionChange)
+    self.iface.mapCanvas().layersChanged.connect(self.scheduleSelectionChange)
+    self.iface.currentLayerChanged.connect(self.scheduleSelectionChange)
+    self.iface.legendInterface().itemRemoved.connect(
+        self.scheduleSelectionChange)
+    QgsMapLayerRegistry.instance().layersWillBeRemoved.connect(
+        self.forgetLayers)
+
+    # The sign-in dialog, with its web view, is created on first use.
+    self.signInDlg = None
+    # Time the sign-in button was clicked, to measure how long sign-in takes.
+    self.signInStarted = None
+
+    # Uploads run in the background. The dock listing them is created when
+    # the first upload starts.
+    self.uploadJobManager = upload_jobs.UploadJobManager(self.iface)
+    self.uploadJobsDock = None
+
+    # Failed requests are shown together rather than one message each.
+    error_summary.install(self.iface)
+
+    elapsed = time.time() - initStart
+    metrics.recordTime('plugin.initGui', elapsed)
+    QgsMessageLog.logMessage(
+        'Plugin interface initialized in %.3fs' % elapsed, 'GMEConnector',
+        QgsMessageLog.INFO)
+
+  def getSignInDialog(self):
+    """Returns the sign-in dialog, creating it on first use.
 
-    # Hook up slots for signals from the sign-in dialog.
-    self.signInDlg = signin_dialog.Dialog(self.iface)
-    self.signInDlg.authStateChange.connect(self.handleAuthChange)
+    Returns:
+      signin_dialog.Dialog instance.
+    """
+    if not self.signInDlg:
+      from plugin import signin_dialog
+      self.signInDlg = signin_dialog.Dialog(self.iface)
+      # Hook up slots for signals from the sign-in dialog.
+      self.signInDlg.authStateChange.connect(self.handleAuthChange)
+      self.signInDlg.userNameChanged.connect(self.handleUserNameChange)
+    return self.signInDlg
 
   def unload(self):
     """Unloads the plugin and cleans up the GUI."""
@@ -222,10 +298,41 @@ class GoogleMapsEngineConnector:
     # Remove the toolbar
     del self.toolBar
 
+    # Stop following the selection
+    self.selectionTimer.stop()
+    self.iface.mapCanvas().selectionChanged.disconnect(
+        self.handleLayerSelectionChange)
+    self.iface.mapCanvas().layersChanged.disconnect(
+        self.scheduleSelectionChange)
+    self.iface.currentLayerChanged.disconnect(self.scheduleSelectionChange)
+    self.iface.legendInterface().itemRemoved.disconnect(
+        self.scheduleSelectionChange)
+    QgsMapLayerRegistry.instance().layersWillBeRemoved.disconnect(
+        self.forgetLayers)
+    for layerId in self.editWatches.keys():
+      self.unwatchLayerEdits(layerId)
+
+    # Stop warming and refreshing the map listings
+    catalog_cache.stopAll()
+    if self.signInDlg:
+      self.signInDlg.stop()
+
+    # Stop running uploads and remove their dock
+    self.uploadJobManager.cancelAll()
+    if self.uploadJobsDock:
+      self.iface.removeDockWidget(self.uploadJobsDock)
+      self.uploadJobsDock = None
+
+    # Drop request errors not shown yet
+    error_summary.uninstall()
+
     # Revoke the token on exit
     oauth2_utils.revokeToken()
     # Remove the access credientials from settings
     settings.clear()
+    # Close the persistent connections to the Google servers
+    http_pool.closeAll()
+    metadata_cache.close()
 
   def handleAuthChange(self, success, token, userName):
     """Enable or disable tools in response to an authStateChange event.
@@ -249,6 +356,16 @@ class GoogleMapsEngineConnector:
       self.searchGallery.setEnabled(True)
       self.signIn.setChecked(True)
       self.handleSelectionChange()
+      if self.signInStarted:
+        elapsed = time.time() - self.signInStarted
+        metrics.recordTime('signin.total', elapsed)
+        QgsMessageLog.logMessage(
+            'Tools enabled %.2fs after clicking sign-in' % elapsed,
+            'GMEConnector', QgsMessageLog.INFO)
+        self.signInStarted = None
+      # Warm the map listings so that the search dialog opens with data.
+      catalog_cache.prefetchInBackground(self.iface)
+      self.offerToResumeUploads()
     else:
       self.iface.messageBar().pushMessage(
           'Google Maps Engine Connector',
@@ -257,6 +374,91 @@ class GoogleMapsEngineConnector:
       self.signIn.setChecked(False)
       self.disableAllTools()
 
+  def handleUserNameChange(self, userName):
+    """Shows the name of the user once it is known.
+
+    Args:
+      userName: str, name of the user who has logged-in.
+    """
+    if self.signIn.isChecked():
+      self.signIn.setText('Logged in as %s.' % userName)
+
+  def offerToResumeUploads(self):
+    """Asks the user whether to resume uploads that were interrupted."""
+    assetIds = set(x['assetId'] for x in upload_session.pendingJobs())
+    assetIds.update(x.assetId for x in upload_session.pending())
+    if not assetIds:
+      return
+    question = ('%d upload(s) to Google Maps Engine were interrupted. '
+                'Resume them now?') % len(assetIds)
+    answer = QMessageBox.question(
+        self.iface.mainWindow(), 'Resume uploads', question,
+        QMessageBox.Yes | QMessageBox.No | QMessageBox.Discard,
+        QMessageBox.Yes)
+    if answer == QMessageBox.Yes:
+      self.showUploadJobs()
+      self.uploadJobManager.resumePendingUploads()
+    elif answer == QMessageBox.Discard:
+      upload_jobs.discardPendingUploads()
+
+  def scheduleSelectionChange(self, *unused_args):
+    """Updates the tools once the pending events have been processed."""
+    self.selectionTimer.start()
+
+  def handleLayerSelectionChange(self, layer):
+    """Forgets the assets selected in a layer whose selection changed.
+
+    Args:
+      layer: QgsMapLayer whose selection changed.
+    """
+    self.assetCache.pop((layer.id(), True), None)
+    self.scheduleSelectionChange()
+
+  def forgetLayers(self, layerIds):
+    """Drops the cached state of layers that are being removed.
+
+    Args:
+      layerIds: list, of ids of the removed layers.
+    """
+    for layerId in layerIds:
+      layerId = unicode(layerId)
+      self.connectorLayerCache.pop(layerId, None)
+      self.assetCache.pop((layerId, True), None)
+      self.assetCache.pop((layerId, False), None)
+      self.unwatchLayerEdits(layerId)
+
+  def watchLayerEdits(self, layer):
+    """Forgets the assets of a vector layer whenever its features change.
+
+    Args:
+      layer: QgsMapLayer whose assets are cached.
+    """
+    layerId = unicode(layer.id())
+    if layer.type() != 0 or layerId in self.editWatches:
+      return
+
+    def forgetAssets(*unused_args):
+      self.assetCache.pop((layerId, True), None)
+      self.assetCache.pop((layerId, False), None)
+      self.scheduleSelectionChange()
+
+    layer.editingStopped.connect(forgetAssets)
+    layer.committedFeaturesAdded.connect(forgetAssets)
+    layer.committedFeaturesRemoved.connect(forgetAssets)
+    self.editWatches[layerId] = (layer, forgetAssets)
+
+  def unwatchLayerEdits(self, layerId):
+    """Disconnects the slot connected by watchLayerEdits.
+
+    Args:
+      layerId: str, id of the layer.
+    """
+    layer, forgetAssets = self.editWatches.pop(layerId, (None, None))
+    if layer:
+      layer.editingStopped.disconnect(forgetAssets)
+      layer.committedFeaturesAdded.disconnect(forgetAssets)
+      layer.committedFeaturesRemoved.disconnect(forgetAssets)
+
   def handleSelectionChange(self):
     """Enables or disables tools in response to changes in selection."""
     # Disable all the tools first.
@@ -299,11 +501,15 @@ class GoogleMapsEngineConnector:
     Returns:
       True if the layer was created by Google Maps Engine Connector.
     """
-    provider = layer.dataProvider()
-    if provider.name() == 'memory' and layer.type() == 0:
-      if layer.dataProvider().fieldNameIndex('Resource Type') != -1:
-        return True
-    return False
+    layerId = unicode(layer.id())
+    if layerId not in self.connectorLayerCache:
+      isConnectorLayer = False
+      provider = layer.dataProvider()
+      if provider.name() == 'memory' and layer.type() == 0:
+        if layer.dataProvider().fieldNameIndex('Resource Type') != -1:
+          isConnectorLayer = True
+      self.connectorLayerCache[layerId] = isConnectorLayer
+    return self.connectorLayerCache[layerId]
 
   def getFeatures(self, layer, selected=True):
     """Return the features from the given layer.
@@ -323,6 +529,25 @@ class GoogleMapsEngineConnector:
   def getAssetsFromLayer(self, layer, selected_only=True):
     """Creates Google Maps Engine assets from vector layer.
 
+    The assets are cached until the selection or the features of the layer
+    change, or the layer is removed.
+
+    Args:
+      layer: QgsMapLayer
+      selected_only: bool, True if only selected feature are used.
+    Returns:
+      gme_map.Map and a list of gme_layer.Layer objects
+    """
+    key = (unicode(layer.id()), selected_only)
+    if key not in self.assetCache:
+      self.watchLayerEdits(layer)
+      self.assetCache[key] = self.readAssetsFromLayer(layer, selected_only)
+    gmeMap, gmeLayers = self.assetCache[key]
+    return gmeMap, list(gmeLayers)
+
+  def readAssetsFromLayer(self, layer, selected_only):
+    """Reads the assets from the features of a layer.
+
     Args:
       layer: QgsMapLayer
       selected_only: bool, True if only selected feature are used.
@@ -356,6 +581,7 @@ class GoogleMapsEngineConnector:
       checked: bool, whether the sign-in action was checked.
     """
     if checked:
+      self.signInStarted = time.time()
       # check if client_id and client_secret exist
       client_id = settings.read('gmeconnector/CLIENT_ID')
       client_secret = settings.read('gmeconnector/CLIENT_SECRET')
@@ -365,11 +591,12 @@ class GoogleMapsEngineConnector:
           self.token = token
           self.handleAuthChange(True, token, '')
         else:
-          # The sign-in dialog is initialized when the plugin is loaded.
-          # We need to have setInitialUrl outside the dialog constructor to make
-          # sure it's called everytime the sign-in button is clicked.
-          self.signInDlg.setInitialUrl()
-          result = self.signInDlg.exec_()
+          # The sign-in dialog is kept once created. We need to have
+          # setInitialUrl outside the dialog constructor to make sure it's
+          # called everytime the sign-in button is clicked.
+          signInDlg = self.getSignInDialog()
+          signInDlg.setInitialUrl()
+          result = signInDlg.exec_()
           if not result:
             self.handleAuthChange(False, None, '')
       else:
@@ -387,6 +614,12 @@ class GoogleMapsEngineConnector:
       oauth2_utils.revokeToken()
       # Remove the access credientials from settings
       settings.clear()
+      # Forget the map listings and metadata of this account
+      catalog_cache.stopAll()
+      catalog_cache.clear()
+      metadata_cache.clear()
+      # Let the next session try every endpoint again
+      circuit_breaker.reset()
 
   def doSearchGme(self):
     """Show the search dialog."""
@@ -394,6 +627,8 @@ class GoogleMapsEngineConnector:
         'Google Maps Engine Connector', 'Fetching maps. Please wait...',
         level=QgsMessageBar.INFO)
     QCoreApplication.processEvents()
+    loadResources()
+    from plugin import search_gme_dialog
     searchGmeDialog = search_gme_dialog.Dialog(self.iface)
     searchGmeDialog.exec_()
 
@@ -402,6 +637,7 @@ class GoogleMapsEngineConnector:
     currentLayer = self.iface.mapCanvas().currentLayer()
     gmeMap, gmeLayers = self.getAssetsFromLayer(
         currentLayer, selected_only=False)
+    from plugin import wms_dialog
     self.wmsDialog = wms_dialog.Dialog(self.iface)
     self.wmsDialog.populateLayers(gmeMap, gmeLayers)
     self.wmsDialog.loadCrsForIndex(0)
@@ -469,6 +705,8 @@ class GoogleMapsEngineConnector:
     # client_secret.
     pre_client_id = settings.read('gmeconnector/CLIENT_ID')
     pre_client_secret = settings.read('gmeconnector/CLIENT_SECRET')
+    loadResources()
+    from plugin import more_dialog
     self.moreDialog = more_dialog.Dialog(self.iface)
     if self.token:
       self.moreDialog.groupBoxAccount.setEnabled(True)
@@ -485,15 +723,29 @@ class GoogleMapsEngineConnector:
     if (post_client_id and post_client_secret and
         (post_client_id != pre_client_id or
          post_client_secret != pre_client_secret)):
-      self.signInDlg.setInitialUrl()
-      result = self.signInDlg.exec_()
+      signInDlg = self.getSignInDialog()
+      signInDlg.setInitialUrl()
+      result = signInDlg.exec_()
       if not result:
         self.handleAuthChange(False, None, '')
 
   def doUpload(self):
     """Show the upload dialog."""
-    self.uploadDialog = upload_dialog.Dialog(self.iface)
+    from plugin import upload_dialog
+    numJobs = len(self.uploadJobManager.jobs)
+    self.uploadDialog = upload_dialog.Dialog(
+        self.iface, self.uploadJobManager)
     self.uploadDialog.exec_()
+    if len(self.uploadJobManager.jobs) > numJobs:
+      self.showUploadJobs()
+
+  def showUploadJobs(self):
+    """Show the dock listing the background uploads."""
+    if not self.uploadJobsDock:
+      from plugin import upload_jobs_dock
+      self.uploadJobsDock = upload_jobs_dock.UploadJobsDock(
+          self.uploadJobManager)
+    self.uploadJobsDock.showAndRaise(self.iface)
 
   def disableAllTools(self):
     """Diable all the tools."""
@@ -0,0 +1,413 @@
+"""Local cache of the map listings of Maps Engine projects.
+
+The listings are kept in a SQLite database in the QGIS profile, so that the
+search dialog can show them immediately and refresh them in the background.
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import os
+import sqlite3
+import threading
+import time
+from PyQt4.QtCore import pyqtSignal
+from PyQt4.QtCore import QThread
+from datamodel import gme_map
+import gme_api
+import oauth2_utils
+import settings
+
+CATALOG_FILE = 'catalog.sqlite'
+# Listings older than this are refreshed in the background when shown.
+DEFAULT_REFRESH_AFTER = 5 * 60
+# Listings older than this are not shown at all and are evicted.
+DEFAULT_TTL = 7 * 24 * 3600
+# Maximum number of maps kept across all projects. The least recently used
+# projects are evicted first.
+DEFAULT_MAX_MAPS = 200000
+# Milliseconds to wait for background downloads to stop on sign-out or unload.
+STOP_TIMEOUT_MS = 3000
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS projects ('
+    '  project_id TEXT PRIMARY KEY,'
+    '  fetched_at REAL,'
+    '  accessed_at REAL,'
+    '  map_count INTEGER)',
+    'CREATE TABLE IF NOT EXISTS maps ('
+    '  project_id TEXT,'
+    '  position INTEGER,'
+    '  map_id TEXT,'
+    '  name TEXT,'
+    '  PRIMARY KEY (project_id, position))')
+
+_lock = threading.Lock()
+
+
+def _readSetting(key, default):
+  value = settings.read(key, object_type=int)
+  return value or default
+
+
+def refreshAfter():
+  """Returns the age in seconds after which a listing is refreshed."""
+  return _readSetting('gmeconnector/CATALOG_REFRESH_AFTER',
+                      DEFAULT_REFRESH_AFTER)
+
+
+def _connect():
+  """Opens the catalog database, creating it if needed."""
+  path = os.path.join(settings.dataDir(), CATALOG_FILE)
+  conn = sqlite3.connect(path)
+  for statement in SCHEMA:
+    conn.execute(statement)
+  return conn
+
+
+def load(projectId):
+  """Returns the cached maps of a project.
+
+  Args:
+    projectId: str, id of the maps engine project.
+  Returns:
+    tuple of (maps, fetchedAt). maps is a list of gme_map.Map objects with
+    only id and name set, and fetchedAt the time the listing was downloaded.
+    Both are None if the project is not cached or has expired.
+  """
+  ttl = _readSetting('gmeconnector/CATALOG_TTL', DEFAULT_TTL)
+  with _lock:
+    conn = _connect()
+    try:
+      row = conn.execute(
+          'SELECT fetched_at FROM projects WHERE project_id = ?',
+          (projectId,)).fetchone()
+      if not row or time.time() - row[0] > ttl:
+        return None, None
+      fetchedAt = row[0]
+      rows = conn.execute(
+          'SELECT map_id, name FROM maps WHERE project_id = ? '
+          'ORDER BY position', (projectId,)).fetchall()
+      conn.execute('UPDATE projects SET accessed_at = ? WHERE project_id = ?',
+                   (time.time(), projectId))
+      conn.commit()
+    finally:
+      conn.close()
+  return [gme_map.Map(id=mapId, name=name) for mapId, name in rows], fetchedAt
+
+
+def fetchedAt(projectId):
+  """Returns when the listing of a project was downloaded.
+
+  Args:
+    projectId: str, id of the maps engine project.
+  Returns:
+    float, time of the download, or None if the project is not cached.
+  """
+  with _lock:
+    conn = _connect()
+    try:
+      row = conn.execute(
+          'SELECT fetched_at FROM projects WHERE project_id = ?',
+          (projectId,)).fetchone()
+    finally:
+      conn.close()
+  return row and row[0] or None
+
+
+def isFresh(projectId):
+  """Returns True if a project's listing does not need to be refreshed."""
+  fetched = fetchedAt(projectId)
+  return fetched is not None and time.time() - fetched <= refreshAfter()
+
+
+def store(projectId, maps, cancelled=None):
+  """Replaces the cached maps of a project.
+
+  Args:
+    projectId: str, id of the maps engine project.
+    maps: list, of gme_map.Map objects.
+    cancelled: threading.Event, nothing is stored once it is set. It is
+        checked under the cache lock, so a clear() that follows setting it
+        is not undone.
+  """
+  now = time.time()
+  with _lock:
+    if cancelled and cancelled.is_set():
+      return
+    conn = _connect()
+    try:
+      conn.execute('DELETE FROM maps WHERE project_id = ?', (projectId,))
+      conn.executemany(
+          'INSERT INTO maps (project_id, position, map_id, name) '
+          'VALUES (?, ?, ?, ?)',
+          ((projectId, i, x.id, x.name) for i, x in enumerate(maps)))
+      conn.execute(
+          'INSERT OR REPLACE INTO projects '
+          '(project_id, fetched_at, accessed_at, map_count) '
+          'VALUES (?, ?, ?, ?)', (projectId, now, now, len(maps)))
+      _evict(conn)
+      conn.commit()
+    finally:
+      conn.close()
+
+
+def _evict(conn):
+  """Removes expired projects and keeps the total size under the limit."""
+  ttl = _readSetting('gmeconnector/CATALOG_TTL', DEFAULT_TTL)
+  maxMaps = _readSetting('gmeconnector/CATALOG_MAX_MAPS', DEFAULT_MAX_MAPS)
+  expired = [x[0] for x in conn.execute(
+      'SELECT project_id FROM projects WHERE fetched_at < ?',
+      (time.time() - ttl,))]
+  # Most recently used projects first.
+  rows = conn.execute(
+      'SELECT project_id, map_count FROM projects '
+      'WHERE fetched_at >= ? ORDER BY accessed_at DESC',
+      (time.time() - ttl,)).fetchall()
+  total = 0
+  for projectId, mapCount in rows:
+    total += mapCount
+    if total > maxMaps:
+      expired.append(projectId)
+  for projectId in expired:
+    conn.execute('DELETE FROM maps WHERE project_id = ?', (projectId,))
+    conn.execute('DELETE FROM projects WHERE project_id = ?', (projectId,))
+
+
+def clear():
+  """Removes all cached listings, e.g. after the user signs out."""
+  with _lock:
+    conn = _connect()
+    try:
+      conn.execute('DELETE FROM maps')
+      conn.execute('DELETE FROM projects')
+      conn.commit()
+    finally:
+      conn.close()
+
+
+def diff(oldMaps, newMaps):
+  """Compares two listings of the same project.
+
+  Args:
+    oldMaps: list, of gme_map.Map objects currently shown.
+    newMaps: list, of gme_map.Map objects freshly downloaded.
+  Returns:
+    tuple of (added, removed, renamed). added is a list of new gme_map.Map
+    objects, removed a set of map ids that no longer exist and renamed a dict
+    of map ids to their new names.
+  """
+  oldNames = dict((x.id, x.name) for x in oldMaps)
+  newIds = set()
+  added = []
+  renamed = {}
+  for gmeMap in newMaps:
+    newIds.add(gmeMap.id)
+    if gmeMap.id not in oldNames:
+      added.append(gmeMap)
+    elif oldNames[gmeMap.id] != gmeMap.name:
+      renamed[gmeMap.id] = gmeMap.name
+  removed = set(oldNames) - newIds
+  return added, removed, renamed
+
+
+class RefreshThread(QThread):
+  """Downloads the map listing of a project and stores it in the cache.
+
+  Signals:
+    refreshed(str, object): emitted with the project id and the list of
+        gme_map.Map objects, or None if the download failed.
+  """
+  refreshed = pyqtSignal(str, object)
+
+  def __init__(self, iface, projectId):
+    """Class constructor.
+
+    Args:
+      iface: QgsInterface instance.
+      projectId: str, id of the maps engine project.
+    """
+    QThread.__init__(self)
+    self.iface = iface
+    self.projectId = projectId
+    self.cancelled = threading.Event()
+
+  def run(self):
+    """Fetches the listing and updates the cache unless cancelled."""
+    api = gme_api.GoogleMapsEngineAPI(self.iface)
+    token = oauth2_utils.getToken()
+    maps = None
+    if token:
+      maps = api.getMapsByProjectId(self.projectId, token)
+    if self.cancelled.is_set():
+      # The user signed out, the listing belongs to the previous account.
+      maps = None
+    if maps is not None:
+      store(self.projectId, maps, self.cancelled)
+    self.refreshed.emit(self.projectId, maps)
+
+
+# Project id -> RefreshThread currently running. Keeps the threads alive
+# after the dialog that started them is closed.
+_refreshThreads = {}
+
+
+def refreshInBackground(iface, projectId):
+  """Starts a background refresh of a project's listing.
+
+  If a refresh of the project is already running, it is returned instead of
+  starting another one.
+
+  Args:
+    iface: QgsInterface instance.
+    projectId: str, id of the maps engine project.
+  Returns:
+    RefreshThread instance.
+  """
+  thread = _refreshThreads.get(projectId)
+  if thread:
+    return thread
+  thread = RefreshThread(iface, projectId)
+  thread.finished.connect(lambda: _forgetRefreshThread(projectId, thread))
+  _refreshThreads[projectId] = thread
+  thread.start(QThread.LowPriority)
+  return thread
+
+
+def _forgetRefreshThread(projectId, thread):
+  """Drops a finished refresh thread from _refreshThreads."""
+  # finished may arrive before run() has returned. The thread must not be
+  # destroyed while it is still running.
+  thread.wait()
+  if _refreshThreads.get(projectId) is thread:
+    del _refreshThreads[projectId]
+
+
+class PrefetchThread(QThread):
+  """Downloads the listings of several projects, one after another.
+
+  Projects with a fresh listing in the cache are skipped.
+  """
+
+  def __init__(self, iface, projectIds):
+    """Class constructor.
+
+    Args:
+      iface: QgsInterface instance.
+      projectIds: list, of project ids in the order to fetch them.
+    """
+    QThread.__init__(self)
+    self.iface = iface
+    self.projectIds = projectIds
+    self.cancelled = threading.Event()
+
+  def run(self):
+    """Fetches and stores the listings until done or cancelled."""
+    api = gme_api.GoogleMapsEngineAPI(self.iface)
+    for projectId in self.projectIds:
+      if self.cancelled.is_set():
+        return
+      if isFresh(projectId) or projectId in _refreshThreads:
+        continue
+      token = oauth2_utils.getToken()
+      if not token:
+        return
+      maps = api.getMapsByProjectId(projectId, token)
+      # The user may have signed out while the listing was downloading.
+      if maps is not None:
+        store(projectId, maps, self.cancelled)
+
+
+_prefetchThread = None
+
+
+def prefetchInBackground(iface):
+  """Warms the cache with the listings of the signed-in user's projects.
+
+  The default and last used projects are fetched first, since the search
+  dialog opens one of them, followed by the other projects.
+
+  Args:
+    iface: QgsInterface instance.
+  """
+  global _prefetchThread
+  stopPrefetch()
+  projectDict = settings.read('gmeconnector/PROJECTS') or {}
+  projectIds = []
+  for key in ('gmeconnector/DEFAULT_PROJECT',
+              'gmeconnector/LAST_USED_PROJECT'):
+    projectId = settings.read(key)
+    if projectId in projectDict and projectId not in projectIds:
+      projectIds.append(projectId)
+  projectIds.extend(x for x in projectDict if x not in projectIds)
+  if not projectIds:
+    return
+  _prefetchThread = PrefetchThread(iface, projectIds)
+  _prefetchThread.start(QThread.LowPriority)
+
+
+def stopPrefetch():
+  """Stops the background prefetch, e.g. before starting another one.
+
+  A listing that is being downloaded is not stored.
+  """
+  global _prefetchThread
+  thread = _prefetchThread
+  _prefetchThread = None
+  if thread:
+    _stopThreads([thread])
+
+
+def stopAll():
+  """Stops the background prefetch and refreshes.
+
+  Must be called before clear() when the user signs out, and when the plugin
+  is unloaded. Listings that are being downloaded are not stored.
+  """
+  stopPrefetch()
+  threads = _refreshThreads.values()
+  _refreshThreads.clear()
+  _stopThreads(threads)
+
+
+# Cancelled threads that were still running after STOP_TIMEOUT_MS. A QThread
+# must not be destroyed while it is running, so they are referenced until they
+# finish.
+_stoppingThreads = set()
+
+
+def _stopThreads(threads):
+  """Cancels threads and waits up to STOP_TIMEOUT_MS in total for them.
+
+  Args:
+    threads: list, of RefreshThread or PrefetchThread instances.
+  """
+  for thread in threads:
+    thread.cancelled.set()
+  deadline = time.time() + STOP_TIMEOUT_MS / 1000.0
+  for thread in threads:
+    remaining = int(max(0, deadline - time.time()) * 1000)
+    if thread.wait(remaining):
+      continue
+    _stoppingThreads.add(thread)
+    thread.finished.connect(lambda thread=thread: _forgetStoppingThread(thread))
+    if thread.isFinished():
+      _stoppingThreads.discard(thread)
+
+
+def _forgetStoppingThread(thread):
+  """Drops a finished thread from _stoppingThreads."""
+  thread.wait()
+  _stoppingThreads.discard(thread)
@@ -0,0 +1,186 @@
+"""Stops sending requests to Maps Engine endpoints that keep failing.
+
+Each family of endpoints, e.g. maps or layers, has its own breaker. After
+repeated server or network failures the breaker opens and requests fail
+immediately. When the cool-down period is over a single probe request is let
+through; the breaker closes again if it succeeds.
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import re
+import threading
+import time
+import urllib2
+import urlparse
+import settings
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# Consecutive failures after which the breaker opens.
+DEFAULT_FAILURE_THRESHOLD = 5
+# Seconds the breaker stays open before a probe request is let through.
+DEFAULT_COOL_DOWN = 30
+
+VERSION_RE = re.compile(r'^v\d+$')
+
+
+def endpointFamily(url):
+  """Returns the name of the endpoint family a request url belongs to.
+
+  Args:
+    url: str, url of a Maps Engine API request.
+  Returns:
+    str, the collection following the API version in the path, e.g. 'maps'.
+    Uploads are prefixed with 'upload/'.
+  """
+  path = urlparse.urlsplit(url).path
+  segments = [x for x in path.split('/') if x]
+  for i, segment in enumerate(segments[:-1]):
+    if VERSION_RE.match(segment):
+      family = segments[i + 1]
+      if 'upload' in segments[:i]:
+        return 'upload/%s' % family
+      return family
+  return path
+
+
+def isServiceFailure(error):
+  """Returns True if the error suggests the service itself is failing.
+
+  Errors about the request, such as a missing asset or an exceeded quota, do
+  not count against the breaker.
+
+  Args:
+    error: urllib2.URLError or urllib2.HTTPError.
+  """
+  if isinstance(error, urllib2.HTTPError):
+    return error.code >= 500 or error.code == 408
+  return True
+
+
+class CircuitBreaker(object):
+  """Tracks the failures of one endpoint family."""
+
+  def __init__(self, name, failureThreshold, coolDown):
+    """Class constructor.
+
+    Args:
+      name: str, name of the endpoint family.
+      failureThreshold: int, consecutive failures that open the breaker.
+      coolDown: float, seconds to stay open before probing.
+    """
+    self._lock = threading.Lock()
+    self.name = name
+    self.failureThreshold = failureThreshold
+    self.coolDown = coolDown
+    self.state = CLOSED
+    self.failures = 0
+    self.openedAt = None
+    self.probing = False
+
+  def allowRequest(self):
+    """Returns True if a request may be sent now.
+
+    While half open only one probe request is allowed at a time.
+    """
+    with self._lock:
+      if self.state == CLOSED:
+        return True
+      if self.state == OPEN:
+        if time.time() - self.openedAt < self.coolDown:
+          return False
+        self.state = HALF_OPEN
+        self.probing = False
+      if self.probing:
+        return False
+      self.probing = True
+      return True
+
+  def recordSuccess(self):
+    """Closes the breaker after a request succeeded."""
+    with self._lock:
+      self.state = CLOSED
+      self.failures = 0
+      self.probing = False
+
+  def recordFailure(self):
+    """Counts a failed request.
+
+    Returns:
+      bool, True if the failure opened the breaker.
+    """
+    with self._lock:
+      self.failures += 1
+      self.probing = False
+      if self.state == OPEN:
+        return False
+      if self.state == HALF_OPEN or self.failures >= self.failureThreshold:
+        self.state = OPEN
+        self.openedAt = time.time()
+        return True
+      return False
+
+  def releaseProbe(self):
+    """Lets another probe through after a request ended without an outcome.
+
+    Must be called when a request allowed by allowRequest ends neither in
+    recordSuccess nor in recordFailure, e.g. because it was cancelled.
+    """
+    with self._lock:
+      self.probing = False
+
+  def retryIn(self):
+    """Returns the seconds left until a probe is let through."""
+    with self._lock:
+      if self.state != OPEN:
+        return 0.0
+      return max(0.0, self.openedAt + self.coolDown - time.time())
+
+
+_lock = threading.Lock()
+# Endpoint family -> CircuitBreaker.
+_breakers = {}
+
+
+def getBreaker(url):
+  """Returns the breaker of the endpoint family of a url.
+
+  Args:
+    url: str, url of a Maps Engine API request.
+  Returns:
+    CircuitBreaker instance.
+  """
+  family = endpointFamily(url)
+  with _lock:
+    breaker = _breakers.get(family)
+    if not breaker:
+      threshold = (settings.read('gmeconnector/BREAKER_FAILURE_THRESHOLD',
+                                 object_type=int) or
+                   DEFAULT_FAILURE_THRESHOLD)
+      coolDown = (settings.read('gmeconnector/BREAKER_COOL_DOWN',
+                                object_type=int) or DEFAULT_COOL_DOWN)
+      breaker = CircuitBreaker(family, threshold, coolDown)
+      _breakers[family] = breaker
+    return breaker
+
+
+def reset():
+  """Closes all breakers, e.g. after the user signed in again."""
+  with _lock:
+    _breakers.clear()
@@ -23,9 +23,18 @@ class DataSource(object):
 
   Properties are documented at
   https://developers.google.com/maps-engine/documentation/reference/v1/
+
+  Properties other than the id are kept in the properties dict and can also
+  be read as attributes.
   """
+  __slots__ = ('id', 'properties')
 
   def __init__(self, id=None, **kwargs):
     self.id = id
-    for key in kwargs:
-      setattr(self, key, kwargs[key])
+    self.properties = kwargs
+
+  def __getattr__(self, name):
+    # Only called for names that are not slots.
+    if name != 'properties' and name in self.properties:
+      return self.properties[name]
+    raise AttributeError(name)
@@ -24,12 +24,18 @@ class Folder(object):
 
   Properties are documented at
   https://developers.google.com/maps-engine/documentation/reference/v1/
+
+  The contents are only converted to gme_item.Item objects when first used.
   """
+  __slots__ = ('name', 'key', '_rawContents', '_contents')
 
   def __init__(self, name=None, key=None, contents=None, **kwargs):
     self.name = name
     self.key = key
-    if contents:
-      self.contents = [gme_item.Item(**x) for x in contents]
-    else:
-      self.contents = []
+    self._rawContents = contents
+    self._contents = None
+
+  @property
+  def contents(self):
+    """list of gme_item.Item objects contained in this folder."""
+    return gme_item.lazyContents(self)
@@ -16,6 +16,47 @@ You should have received a copy of the GNU General Public License
 along with this program; if not, write to the Free Software
 Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
+import threading
+
+# Guards the lazy parsing of contents. Maps and layers are shared between
+# threads, see single_flight.
+_contentsLock = threading.Lock()
+
+
+def parseContents(contents):
+  """Creates Item objects from the JSON contents of a map or folder.
+
+  Args:
+    contents: list, of dicts decoded from JSON, or None.
+  Returns:
+    list of Item objects.
+  """
+  if contents:
+    return [Item(**x) for x in contents]
+  else:
+    return []
+
+
+def lazyContents(obj):
+  """Returns the parsed contents of an object, parsing them on first use.
+
+  Args:
+    obj: object with _rawContents and _contents attributes, such as a Map,
+        Folder or Item.
+  Returns:
+    list of Item objects.
+  """
+  contents = obj._contents
+  if contents is None:
+    with _contentsLock:
+      contents = obj._contents
+      if contents is None:
+        contents = parseContents(obj._rawContents)
+        # Readers check _contents without the lock, so it is set before the
+        # raw contents are dropped.
+        obj._contents = contents
+        obj._rawContents = None
+  return contents
 
 
 class Item(object):
@@ -23,7 +64,12 @@ class Item(object):
 
   Properties are documented at
   https://developers.google.com/maps-engine/documentation/reference/v1/
+
+  The nested contents are only converted to Item objects when first used.
   """
+  __slots__ = ('id', 'name', 'type', 'key', 'kmlUrl',
+               '_rawContents', '_contents')
+
   def __init__(self, id=None, name=None, type=None,
                key=None, contents=None, kmlUrl=None, **kwargs):
     self.id = id
@@ -31,7 +77,10 @@ class Item(object):
     self.type = type
     self.key = key
     self.kmlUrl = kmlUrl
-    if contents:
-      self.contents = [Item(**item) for item in contents]
-    else:
-      self.contents = []
+    self._rawContents = contents
+    self._contents = None
+
+  @property
+  def contents(self):
+    """list of Item objects contained in this item."""
+    return lazyContents(self)
@@ -26,6 +26,8 @@ class Layer(object):
   Properties are documented at
   https://developers.google.com/maps-engine/documentation/reference/v1/
   """
+  __slots__ = ('id', 'name', 'description', 'bbox', 'datasourceType',
+               'dataSources')
 
   def __init__(self, id=None, name=None, description=None,
                bbox=None, datasourceType=None, datasources=None, **kwargs):
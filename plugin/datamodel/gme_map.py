@@ -24,7 +24,12 @@ class Map(object):
 
   Properties are documented at
   https://developers.google.com/maps-engine/documentation/reference/v1/
+
+  Map listings hold many maps of which only the id and name are shown, so the
+  contents are only converted to gme_item.Item objects when first used.
   """
+  __slots__ = ('id', 'name', 'description', 'bbox', 'versions',
+               '_rawContents', '_contents')
 
   def __init__(self, id=None, name=None, description=None,
                bbox=None, contents=None, versions=None, **kwargs):
@@ -33,8 +38,10 @@ class Map(object):
     self.description = description
     self.bbox = bbox
     self.versions = versions
+    self._rawContents = contents
+    self._contents = None
 
-    if contents:
-      self.contents = [gme_item.Item(**x) for x in contents]
-    else:
-      self.contents = []
+  @property
+  def contents(self):
+    """list of gme_item.Item objects at the top level of the map."""
+    return gme_item.lazyContents(self)
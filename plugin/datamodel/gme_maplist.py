@@ -25,6 +25,7 @@ class MapList(object):
   Properties are documented at
   https://developers.google.com/maps-engine/documentation/reference/v1/
   """
+  __slots__ = ('maps', 'nextPageToken')
 
   def __init__(self, maps=None, nextPageToken=None, **kwargs):
     self.nextPageToken = nextPageToken
@@ -0,0 +1,129 @@
+"""Groups the errors shown to the user into a single message.
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import threading
+from PyQt4.QtCore import pyqtSignal
+from PyQt4.QtCore import QObject
+from PyQt4.QtCore import QTimer
+from qgis.gui import QgsMessageBar
+
+# Milliseconds to collect errors before showing them.
+FLUSH_DELAY_MS = 1000
+
+
+class ErrorSummary(QObject):
+  """Collects error messages from any thread and shows them together.
+
+  Must be created on the GUI thread. The first error starts a timer, and the
+  errors reported until it fires are shown as one message bar item.
+
+  Signals:
+    reported(): emitted when an error is added, to start the timer on the
+        GUI thread.
+  """
+  reported = pyqtSignal()
+
+  def __init__(self, iface):
+    """Class constructor.
+
+    Args:
+      iface: QgsInterface instance.
+    """
+    QObject.__init__(self)
+    self.iface = iface
+    self._lock = threading.Lock()
+    self.errors = []
+    self.timer = QTimer(self)
+    self.timer.setSingleShot(True)
+    self.timer.setInterval(FLUSH_DELAY_MS)
+    self.timer.timeout.connect(self.flush)
+    self.reported.connect(self.scheduleFlush)
+
+  def add(self, message):
+    """Adds an error to the next summary. May be called from any thread.
+
+    Args:
+      message: str, the error message.
+    """
+    with self._lock:
+      self.errors.append(message)
+    self.reported.emit()
+
+  def scheduleFlush(self):
+    """Starts the timer unless a summary is already pending."""
+    if not self.timer.isActive():
+      self.timer.start()
+
+  def flush(self):
+    """Shows the errors collected so far."""
+    with self._lock:
+      errors = self.errors
+      self.errors = []
+    if not errors:
+      return
+    if len(errors) == 1:
+      message = errors[0]
+    else:
+      message = ('%d requests failed, see the log for details. '
+                 'Last error: %s') % (len(errors), errors[-1])
+    self.iface.messageBar().pushMessage(
+        'Google Maps Engine Connector', message,
+        level=QgsMessageBar.CRITICAL, duration=3)
+
+  def stop(self):
+    """Drops pending errors, e.g. when the plugin is unloaded."""
+    self.timer.stop()
+    with self._lock:
+      self.errors = []
+
+
+_summary = None
+
+
+def install(iface):
+  """Creates the summary used by report(). Must be called on the GUI thread.
+
+  Args:
+    iface: QgsInterface instance.
+  """
+  global _summary
+  if not _summary:
+    _summary = ErrorSummary(iface)
+
+
+def uninstall():
+  """Removes the summary, dropping pending errors."""
+  global _summary
+  if _summary:
+    _summary.stop()
+    _summary = None
+
+
+def report(message):
+  """Adds an error to the summary shown to the user.
+
+  Args:
+    message: str, the error message.
+  Returns:
+    bool, False if no summary is installed and the message was not shown.
+  """
+  summary = _summary
+  if not summary:
+    return False
+  summary.add(message)
+  return True
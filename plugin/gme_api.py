@@ -17,17 +17,55 @@ along with this program; if not, write to the Free Software
 Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
 import json
+import os
+import threading
 import urllib
 import urllib2
+from PyQt4.QtCore import QCoreApplication
+from PyQt4.QtCore import QThread
 from qgis.core import QgsMessageLog
 from qgis.gui import QgsMessageBar
 from datamodel import gme_layer
 from datamodel import gme_map
 from datamodel import gme_maplist
+import circuit_breaker
+import error_summary
+import http_pool
+import metadata_cache
+import metrics
+import oauth2_utils
+import rate_limiter
+import retry_policy
+import single_flight
+import upload_session
 
 GME_API_VERSION = 'v1'
 GME_API_BASE_URI = 'https://www.googleapis.com/mapsengine'
 GME_API_UPLOAD_URI = 'https://www.googleapis.com/upload/mapsengine'
+# Number of times an interrupted resumable upload is continued before giving
+# up. The saved session still allows it to be resumed later.
+RESUMABLE_UPLOAD_ATTEMPTS = 5
+# Offset returned when the server could not tell the offset of an upload, e.g.
+# because of a network error. The session may still be resumed later.
+OFFSET_UNKNOWN = -1
+# Default partial response field masks. Only the fields the plugin uses are
+# requested, see
+# https://developers.google.com/maps-engine/documentation/partial-response
+# The map listing only feeds the search table.
+MAP_LIST_FIELDS = 'maps(id,name),nextPageToken'
+# Maps and layers are fetched to draw their extents.
+MAP_FIELDS = 'id,name,bbox,contents'
+LAYER_FIELDS = 'id,name,bbox,datasourceType'
+
+
+class UploadCancelled(Exception):
+  """Raised from a progress callback when an upload has been cancelled."""
+
+
+def isGuiThread():
+  """Returns True if called from the thread running the Qt event loop."""
+  app = QCoreApplication.instance()
+  return app is not None and QThread.currentThread() == app.thread()
 
 
 class GoogleMapsEngineAPI(object):
@@ -43,17 +81,36 @@ class GoogleMapsEngineAPI(object):
     self.iface = iface
 
   def makeGoogleMapsEngineRequest(self, requestUrl, access_token, data=None,
-                                  content_type=None):
+                                  content_type=None, progressCallback=None,
+                                  callType=None, headers=None):
     """Make a http request and fetch data from the requested url.
 
+    Failed requests are retried as allowed by the retry policy of the call
+    type, see retry_policy. Each attempt waits for the rate limiter of the
+    project the request belongs to, see rate_limiter. Requests to endpoints
+    that keep failing fail immediately, see circuit_breaker.
+
     Args:
       requestUrl: str, url to send the request.
       access_token: str, oauth2 access token.
-      data: str, data to send with the request.
+      data: str or file-like object, data to send with the request. File-like
+          objects are streamed from their current position.
       content_type: str, the MIME type of the request.
+      progressCallback: callable taking the number of bytes sent so far.
+      callType: str, retry_policy.READ or retry_policy.WRITE. By default
+          requests with data are writes.
+      headers: dict, extra headers to send, e.g. If-None-Match.
     Returns:
-      server response if successful, None if failed
+      server response if successful, None if failed. A 304 Not Modified
+      response to a conditional request counts as successful.
     """
+    if not callType:
+      callType = data and retry_policy.WRITE or retry_policy.READ
+    policy = retry_policy.getPolicy(callType)
+    projectId = rate_limiter.projectIdFromUrl(requestUrl)
+    breaker = circuit_breaker.getBreaker(requestUrl)
+    # Keep the interface responsive while waiting on the GUI thread.
+    waitCallback = isGuiThread() and QCoreApplication.processEvents or None
 
     if data:
       req = urllib2.Request(str(requestUrl), data=data)
@@ -66,23 +123,93 @@ class GoogleMapsEngineAPI(object):
       req.add_header('Content-Type', 'application/json')
     else:
       req.add_header('Content-Type', 'application/octet-stream')
-      req.add_header('Content-Length', len(data))
+      req.add_header('Content-Length', getContentLength(data))
+    for name, value in (headers or {}).iteritems():
+      req.add_header(name, value)
 
-    retries = 2
+    if hasattr(data, 'read'):
+      bodyStart = data.tell()
+
+    attempts = 0
+    tokenRefreshed = False
     # Make the request
-    while retries > 0:
+    while True:
+      if hasattr(data, 'read'):
+        # Send the whole body again on each attempt.
+        data.seek(bodyStart)
+      if not breaker.allowRequest():
+        metrics.increment('breaker.rejected')
+        errorMsg = ('Skipped %s: requests to %s are failing, trying again '
+                    'in %ds') % (requestUrl, breaker.name, breaker.retryIn())
+        QgsMessageLog.logMessage(
+            errorMsg, 'GMEConnector', QgsMessageLog.WARNING)
+        self.reportError(errorMsg)
+        return None
       try:
-        response = urllib2.urlopen(req)
+        rate_limiter.acquire(projectId, waitCallback)
+        response = http_pool.urlopen(req, progressCallback)
+        rate_limiter.reportResult(projectId)
+        breaker.recordSuccess()
         return response
       except (urllib2.HTTPError, urllib2.URLError) as e:
+        rate_limiter.reportResult(projectId, e)
+        if not circuit_breaker.isServiceFailure(e):
+          # The service answered, even if it refused the request.
+          breaker.recordSuccess()
+        elif breaker.recordFailure():
+          QgsMessageLog.logMessage(
+              'Requests to %s keep failing. Pausing them for %ds.' % (
+                  breaker.name, breaker.coolDown), 'GMEConnector',
+              QgsMessageLog.CRITICAL)
+        if isinstance(e, urllib2.HTTPError) and e.code == 304:
+          # The copy the caller has is up to date.
+          return e
+        if (isinstance(e, urllib2.HTTPError) and e.code == 401 and
+            not tokenRefreshed):
+          # The token was revoked or expired early. Refresh it once and try
+          # again without counting this attempt as a retry.
+          tokenRefreshed = True
+          token = oauth2_utils.refreshRejectedToken(access_token)
+          if token:
+            access_token = token.access_token
+            req.add_header('Authorization', 'Bearer %s' % access_token)
+            continue
+        attempts += 1
         errorMsg = 'Error while fetching %s: %s' % (requestUrl, e)
-        self.iface.messageBar().pushMessage(
-            'Google Maps Engine Connector', errorMsg,
-            level=QgsMessageBar.CRITICAL, duration=3)
+        if policy.shouldRetry(e, attempts):
+          delay = policy.getDelay(e, attempts)
+          QgsMessageLog.logMessage(
+              '%s. Retrying in %.1fs.' % (errorMsg, delay), 'GMEConnector',
+              QgsMessageLog.WARNING)
+          retry_policy.wait(delay, waitCallback)
+          continue
         QgsMessageLog.logMessage(
             errorMsg, 'GMEConnector', QgsMessageLog.CRITICAL)
-        retries -= 1
-    return None
+        self.reportError(errorMsg)
+        return None
+      except BaseException:
+        # E.g. UploadCancelled raised by the progress callback. This says
+        # nothing about the service, but a probe must not stay in flight,
+        # whatever ended the request.
+        breaker.releaseProbe()
+        raise
+
+  def reportError(self, errorMsg):
+    """Shows an error to the user.
+
+    Errors are grouped into one message by error_summary when it is
+    installed. Otherwise they are pushed to the message bar, which may only be
+    used from the GUI thread; errors of worker threads then stay in the log.
+
+    Args:
+      errorMsg: str, the error message.
+    """
+    if error_summary.report(errorMsg):
+      return
+    if isGuiThread():
+      self.iface.messageBar().pushMessage(
+          'Google Maps Engine Connector', errorMsg,
+          level=QgsMessageBar.CRITICAL, duration=3)
 
   def getProjects(self, token):
     """Get all projects readable by the user.
@@ -99,68 +226,158 @@ class GoogleMapsEngineAPI(object):
     else:
       return None
 
-  def getMapsByProjectId(self, projectId, token, nextPageToken=None):
+  def getMapsByProjectId(self, projectId, token, fields=MAP_LIST_FIELDS):
     """Get all maps readable by the user for the given project.
 
     Args:
       projectId: str, id of the maps engine project.
       token: OAuth2Token object, authentication token.
-      nextPageToken: str, next page token.
+      fields: str, partial response field mask, None for the full resources.
     Returns:
-      decoded response if successful, None if failed.
+      list of gme_map.Map objects if successful, None if any page failed.
+    """
+    maps = []
+    for page in self.iterMapPagesByProjectId(projectId, token, fields):
+      if page is None:
+        return None
+      maps.extend(page)
+    return maps
+
+  def iterMapPagesByProjectId(self, projectId, token, fields=MAP_LIST_FIELDS):
+    """Yields the maps of a project one page at a time.
+
+    Each page is yielded as soon as it is decoded. The request for the next
+    page is sent in the background while the current page is converted to
+    gme_map.Map objects and handled by the caller.
+
+    Args:
+      projectId: str, id of the maps engine project.
+      token: OAuth2Token object, authentication token.
+      fields: str, partial response field mask, None for the full resources.
+    Yields:
+      lists of gme_map.Map objects. If a page fails to load, None is yielded
+      and the iteration stops.
+    """
+    nextPage = self._fetchMapPage(projectId, token, None, fields)
+    while True:
+      response = nextPage()
+      if response is None:
+        yield None
+        return
+      nextPageToken = response.get('nextPageToken')
+      if nextPageToken:
+        nextPage = self._fetchMapPage(projectId, token, nextPageToken,
+                                      fields, background=True)
+      mapList = gme_maplist.MapList(**response)
+      yield mapList.maps
+      if not nextPageToken:
+        return
+
+  def _fetchMapPage(self, projectId, token, pageToken, fields,
+                    background=False):
+    """Fetches and decodes one page of a project's map listing.
+
+    Args:
+      projectId: str, id of the maps engine project.
+      token: OAuth2Token object, authentication token.
+      pageToken: str, token of the page to fetch, None for the first page.
+      fields: str, partial response field mask, None for the full resources.
+      background: bool, whether to fetch the page in a separate thread.
+    Returns:
+      callable returning the decoded response, or None if the request failed.
+      It blocks until the page has been fetched.
     """
     baseUrl = '%s/%s/%s' % (GME_API_BASE_URI, GME_API_VERSION, 'maps')
     params = {'projectId': projectId}
-    if nextPageToken:
-      params['pageToken'] = nextPageToken
+    if pageToken:
+      params['pageToken'] = pageToken
+    if fields:
+      params['fields'] = fields
     requestUrl = '%s?%s' % (baseUrl, urllib.urlencode(params))
-    results = self.makeGoogleMapsEngineRequest(requestUrl, token.access_token)
-    maps = []
-    if results:
-      mapList = gme_maplist.MapList(**json.load(results))
-      maps.extend(mapList.maps)
-      if mapList.nextPageToken:
-        # recursive fetch to get maps in subsequent pages
-        maps.extend(
-            self.getMapsByProjectId(projectId, token, mapList.nextPageToken))
+    result = []
 
-    return maps
+    def fetch():
+      results = self.makeGoogleMapsEngineRequest(
+          requestUrl, token.access_token)
+      if results:
+        result.append(json.load(results))
+      else:
+        result.append(None)
+
+    if not background:
+      fetch()
+      return lambda: result[0]
+    thread = threading.Thread(target=fetch)
+    thread.daemon = True
+    thread.start()
 
-  def getMapById(self, mapId, token):
+    def wait():
+      thread.join()
+      return result[0] if result else None
+    return wait
+
+  def getMapById(self, mapId, token, fields=MAP_FIELDS):
     """Get a map object for a particular map.
 
     Args:
       mapId: str, the id of the map.
       token: OAuth2Token object, authentication token.
+      fields: str, partial response field mask, None for the full resource.
     Returns:
       gme_map.Map object if successful, None if failed.
     """
-    requestUrl = '%s/%s/%s/%s' % (GME_API_BASE_URI, GME_API_VERSION,
-                                  'maps', mapId)
-    results = self.makeGoogleMapsEngineRequest(requestUrl, token.access_token)
-    if results:
-      gmeMap = gme_map.Map(**json.load(results))
-      return gmeMap
-    else:
-      return None
+    return self._getResource('maps', mapId, fields, token, gme_map.Map)
 
-  def getLayerById(self, layerId, token):
+  def getLayerById(self, layerId, token, fields=LAYER_FIELDS):
     """Get a layer object for a particular layer.
 
     Args:
       layerId: str, the id of the layer.
       token: OAuth2Token object, authentication token.
+      fields: str, partial response field mask, None for the full resource.
     Returns:
       gme_layer.Layer object if successful, None if failed.
     """
-    requestUrl = '%s/%s/%s/%s' % (GME_API_BASE_URI, GME_API_VERSION,
-                                  'layers', layerId)
-    results = self.makeGoogleMapsEngineRequest(requestUrl, token.access_token)
-    if results:
-      gmeLayer = gme_layer.Layer(**json.load(results))
-      return gmeLayer
-    else:
-      return None
+    return self._getResource('layers', layerId, fields, token,
+                             gme_layer.Layer)
+
+  def _getResource(self, collection, resourceId, fields, token,
+                   resourceClass):
+    """Fetches a single resource and builds its datamodel object.
+
+    Responses are kept in metadata_cache and revalidated with their ETag, so
+    unchanged resources are not downloaded again. Concurrent requests for the
+    same url share one request and the object built from its response.
+
+    Args:
+      collection: str, name of the collection, e.g. 'maps'.
+      resourceId: str, id of the resource.
+      fields: str, partial response field mask, None for the full resource.
+      token: OAuth2Token object, authentication token.
+      resourceClass: class of the object to build from the JSON response.
+    Returns:
+      resourceClass instance if successful, None if failed.
+    """
+    requestUrl = makeResourceUrl(collection, resourceId, fields)
+
+    def fetch():
+      etag, body = metadata_cache.load(resourceId, fields)
+      headers = etag and {'If-None-Match': etag} or None
+      results = self.makeGoogleMapsEngineRequest(
+          requestUrl, token.access_token, headers=headers)
+      if not results:
+        return None
+      if results.getcode() == 304:
+        metrics.increment('metadata.notModified')
+      else:
+        body = results.read()
+        etag = results.info().getheader('etag')
+        if etag:
+          metadata_cache.store(resourceId, fields, etag, body)
+      return resourceClass(**json.loads(body))
+
+    waitCallback = isGuiThread() and QCoreApplication.processEvents or None
+    return single_flight.call(requestUrl, fetch, waitCallback)
 
   def postCreateAsset(self, data_type, data, token):
     """Create a maps engine asset.
@@ -191,24 +408,362 @@ class GoogleMapsEngineAPI(object):
     else:
       return None
 
-  def postUploadFile(self, assetId, data_type, fileName, content, token):
+  def postUploadFile(self, assetId, data_type, fileName, content, token,
+                     progressCallback=None, cancelEvent=None):
     """Upload the given file to maps engine.
 
+    The file is streamed from disk, so memory use does not depend on its size.
+    Files given by path are sent through a resumable upload session, see
+    postUploadFileResumable().
+
     Args:
       assetId: str, id of the maps engine asset.
       data_type: str, type of file to upload, either 'tables' or 'rasters'.
       fileName: str, name of the file to upload.
-      content: str, content of the file to be uploaded.
+      content: str or file-like object, path of the file to be uploaded or an
+          open file positioned at the start of the content.
       token: OAuth2Token object, authentication token.
+      progressCallback: callable taking the number of bytes sent so far and
+          the total number of bytes.
+      cancelEvent: threading.Event, the upload stops as soon as it is set.
     Returns:
-      response from the server.
+      response from the server, None if failed or cancelled.
     """
+    if not hasattr(content, 'read'):
+      return self.postUploadFileResumable(
+          assetId, data_type, fileName, content, token, progressCallback,
+          cancelEvent)
+
     baseUrl = '%s/%s/%s/%s/files' % (GME_API_UPLOAD_URI, GME_API_VERSION,
                                   data_type, assetId)
     params = {'filename': fileName}
     requestUrl = '%s?%s' % (baseUrl, urllib.urlencode(params))
 
-    results = self.makeGoogleMapsEngineRequest(
-        requestUrl, token.access_token, data=content,
-        content_type='application/octet-stream')
-    return results
+    total = getContentLength(content)
+    callback = makeUploadCallback(progressCallback, cancelEvent, 0, total)
+    try:
+      return self.makeGoogleMapsEngineRequest(
+          requestUrl, token.access_token, data=content,
+          content_type='application/octet-stream', progressCallback=callback)
+    except UploadCancelled:
+      QgsMessageLog.logMessage('Upload of %s cancelled.' % fileName,
+                               'GMEConnector', QgsMessageLog.INFO)
+      return None
+
+  def postUploadFileResumable(self, assetId, data_type, fileName, filePath,
+                              token, progressCallback=None, cancelEvent=None):
+    """Upload the given file to maps engine using a resumable session.
+
+    The session is saved with upload_session, so an upload that was
+    interrupted, even in an earlier QGIS session, continues from the last byte
+    committed by the server instead of starting again.
+
+    Args:
+      assetId: str, id of the maps engine asset.
+      data_type: str, type of file to upload, either 'tables' or 'rasters'.
+      fileName: str, name of the file to upload.
+      filePath: str, path of the file to be uploaded.
+      token: OAuth2Token object, authentication token.
+      progressCallback: callable taking the number of bytes sent so far and
+          the total number of bytes.
+      cancelEvent: threading.Event, the upload stops as soon as it is set. The
+          session is kept so the upload can be resumed later.
+    Returns:
+      response from the server if successful, None if failed or cancelled.
+    """
+    try:
+      return self._uploadResumable(assetId, data_type, fileName, filePath,
+                                   token, progressCallback, cancelEvent)
+    except UploadCancelled:
+      QgsMessageLog.logMessage('Upload of %s cancelled.' % fileName,
+                               'GMEConnector', QgsMessageLog.INFO)
+      return None
+
+  def _uploadResumable(self, assetId, data_type, fileName, filePath, token,
+                       progressCallback, cancelEvent):
+    """Implements postUploadFileResumable, raising UploadCancelled."""
+    if cancelEvent and cancelEvent.is_set():
+      raise UploadCancelled()
+    total = os.path.getsize(filePath)
+    access_token = token.access_token
+
+    session = upload_session.find(assetId, fileName)
+    offset = None
+    if session:
+      offset, response = self._queryUploadOffset(
+          session.sessionUri, total, access_token, cancelEvent)
+      if response:
+        upload_session.remove(assetId, fileName)
+        return response
+      if offset == OFFSET_UNKNOWN:
+        # Keep the session, the upload can be resumed once the server can be
+        # reached again.
+        errorMsg = 'Could not resume upload of %s.' % fileName
+        QgsMessageLog.logMessage(
+            errorMsg, 'GMEConnector', QgsMessageLog.CRITICAL)
+        return None
+      if offset is None:
+        # The session expired, the file is uploaded again in a new one.
+        upload_session.remove(assetId, fileName)
+      else:
+        QgsMessageLog.logMessage(
+            'Resuming upload of %s at byte %d of %d' % (
+                fileName, offset, total),
+            'GMEConnector', QgsMessageLog.INFO)
+    if offset is None:
+      sessionUri = self._startResumableUpload(
+          assetId, data_type, fileName, total, access_token)
+      if not sessionUri:
+        return None
+      session = upload_session.save(
+          assetId, data_type, fileName, filePath, sessionUri)
+      offset = 0
+
+    policy = retry_policy.getPolicy(retry_policy.WRITE)
+    waitCallback = makeCancelCallback(cancelEvent)
+    attempts = RESUMABLE_UPLOAD_ATTEMPTS
+    with open(filePath, 'rb') as fileObj:
+      while True:
+        fileObj.seek(offset)
+        headers = {'Content-Type': 'application/octet-stream',
+                   'Content-Length': total - offset}
+        if total:
+          headers['Content-Range'] = 'bytes %d-%d/%d' % (
+              offset, total - 1, total)
+        callback = makeUploadCallback(
+            progressCallback, cancelEvent, offset, total)
+        if callback:
+          # Report the offset the upload continues from.
+          callback(0)
+        status, response = self._sendUploadRequest(
+            'PUT', session.sessionUri, access_token, headers, fileObj,
+            callback)
+        if status in (200, 201):
+          upload_session.remove(assetId, fileName)
+          return response
+
+        attempts -= 1
+        if attempts <= 0:
+          break
+        delay = policy.getDelay(
+            response, RESUMABLE_UPLOAD_ATTEMPTS - attempts)
+        if delay > retry_policy.MAX_RETRY_AFTER:
+          # The session is kept so that the upload can be resumed later.
+          break
+        errorMsg = 'Upload of %s interrupted (%s), resuming in %.1fs.' % (
+            fileName, status or response, delay)
+        QgsMessageLog.logMessage(
+            errorMsg, 'GMEConnector', QgsMessageLog.WARNING)
+        retry_policy.wait(delay, waitCallback)
+        offset, response = self._queryUploadOffset(
+            session.sessionUri, total, access_token, cancelEvent)
+        if response:
+          upload_session.remove(assetId, fileName)
+          return response
+        if offset is None:
+          # The session is gone, nothing more can be done with it.
+          upload_session.remove(assetId, fileName)
+          break
+        if offset == OFFSET_UNKNOWN:
+          # The session is kept so that the upload can be resumed later.
+          break
+
+    errorMsg = 'Upload of %s failed.' % fileName
+    QgsMessageLog.logMessage(errorMsg, 'GMEConnector', QgsMessageLog.CRITICAL)
+    return None
+
+  def _startResumableUpload(self, assetId, data_type, fileName, total,
+                            access_token):
+    """Starts a resumable upload session.
+
+    Args:
+      assetId: str, id of the maps engine asset.
+      data_type: str, type of file to upload, either 'tables' or 'rasters'.
+      fileName: str, name of the file to upload.
+      total: int, size of the file in bytes.
+      access_token: str, oauth2 access token.
+    Returns:
+      str, url of the upload session if successful, None if failed.
+    """
+    baseUrl = '%s/%s/%s/%s/files' % (GME_API_UPLOAD_URI, GME_API_VERSION,
+                                  data_type, assetId)
+    params = {'filename': fileName, 'uploadType': 'resumable'}
+    requestUrl = '%s?%s' % (baseUrl, urllib.urlencode(params))
+    headers = {'Content-Type': 'application/json',
+               'X-Upload-Content-Type': 'application/octet-stream',
+               'X-Upload-Content-Length': total}
+    status, response = self._sendUploadRequest(
+        'POST', requestUrl, access_token, headers, '')
+    if status == 200 and response.info().getheader('location'):
+      return response.info().getheader('location')
+    errorMsg = 'Could not start upload of %s: %s' % (
+        fileName, status or response)
+    QgsMessageLog.logMessage(errorMsg, 'GMEConnector', QgsMessageLog.CRITICAL)
+    return None
+
+  def _queryUploadOffset(self, sessionUri, total, access_token,
+                         cancelEvent=None):
+    """Asks the server how many bytes of an upload it has committed.
+
+    Network errors, server errors and rate limiting are retried with backoff.
+
+    Args:
+      sessionUri: str, url of the upload session.
+      total: int, size of the file in bytes.
+      access_token: str, oauth2 access token.
+      cancelEvent: threading.Event, set to cancel while backing off.
+    Returns:
+      tuple of (offset, response). offset is the number of committed bytes,
+      None if the session no longer exists, or OFFSET_UNKNOWN if the server
+      could not be asked. response is the final server response if the
+      upload is already complete, None otherwise.
+    """
+    headers = {'Content-Length': 0,
+               'Content-Range': 'bytes */%d' % total}
+    policy = retry_policy.getPolicy(retry_policy.READ)
+    attempts = 0
+    while True:
+      status, response = self._sendUploadRequest(
+          'PUT', sessionUri, access_token, headers, '')
+      if status in (200, 201, 308):
+        break
+      if status and 400 <= status < 500 and status not in (401, 408, 429):
+        # The session expired (404, 410) or was rejected.
+        return None, None
+      attempts += 1
+      delay = policy.getDelay(response, attempts)
+      if (attempts >= RESUMABLE_UPLOAD_ATTEMPTS or
+          delay > retry_policy.MAX_RETRY_AFTER):
+        return OFFSET_UNKNOWN, None
+      QgsMessageLog.logMessage(
+          'Could not query the upload offset (%s), retrying in %.1fs.' % (
+              status or response, delay),
+          'GMEConnector', QgsMessageLog.WARNING)
+      retry_policy.wait(delay, makeCancelCallback(cancelEvent))
+
+    if status in (200, 201):
+      return total, response
+    committed = response.info().getheader('range')
+    if not committed:
+      return 0, None
+    # The header has the form 'bytes=0-<last committed byte>'.
+    return int(committed.split('-')[-1]) + 1, None
+
+  def _sendUploadRequest(self, method, requestUrl, access_token, headers,
+                         data, progressCallback=None):
+    """Sends a single request of the resumable upload protocol.
+
+    Unlike makeGoogleMapsEngineRequest, this does not retry and returns error
+    responses, since the status codes drive the protocol.
+
+    Args:
+      method: str, http method.
+      requestUrl: str, url to send the request.
+      access_token: str, oauth2 access token.
+      headers: dict, extra headers to send.
+      data: str or file-like object, body of the request.
+      progressCallback: callable taking the number of bytes sent so far.
+    Returns:
+      tuple of (status, response). status is None and response the error if
+      the server could not be reached.
+    """
+    req = urllib2.Request(str(requestUrl), data=data)
+    req.get_method = lambda: method
+    for name, value in headers.iteritems():
+      req.add_header(name, value)
+    projectId = rate_limiter.projectIdFromUrl(requestUrl)
+
+    tokenRefreshed = False
+    while True:
+      req.add_header('Authorization', 'Bearer %s' % access_token)
+      rate_limiter.acquire(projectId)
+      try:
+        response = http_pool.urlopen(req, progressCallback)
+        rate_limiter.reportResult(projectId)
+        return response.getcode(), response
+      except urllib2.HTTPError as e:
+        rate_limiter.reportResult(projectId, e)
+        if e.code == 401 and not tokenRefreshed:
+          tokenRefreshed = True
+          token = oauth2_utils.refreshRejectedToken(access_token)
+          if token:
+            access_token = token.access_token
+            continue
+        return e.code, e
+      except urllib2.URLError as e:
+        return None, e
+
+
+def makeResourceUrl(collection, resourceId, fields=None):
+  """Returns the url of a single Maps Engine resource.
+
+  Args:
+    collection: str, name of the collection, e.g. 'maps'.
+    resourceId: str, id of the resource.
+    fields: str, partial response field mask, None for the full resource.
+  Returns:
+    str, url of the resource.
+  """
+  requestUrl = '%s/%s/%s/%s' % (GME_API_BASE_URI, GME_API_VERSION,
+                                collection, resourceId)
+  if fields:
+    requestUrl = '%s?%s' % (requestUrl, urllib.urlencode({'fields': fields}))
+  return requestUrl
+
+
+def makeUploadCallback(progressCallback, cancelEvent, offset, total):
+  """Creates the per-chunk callback passed to http_pool.urlopen.
+
+  Args:
+    progressCallback: callable taking the number of bytes sent so far and the
+        total number of bytes, or None.
+    cancelEvent: threading.Event or None.
+    offset: int, number of bytes of the file sent by earlier requests.
+    total: int, size of the file in bytes.
+  Returns:
+    callable taking the number of bytes sent by the current request, or None
+    if there is nothing to report or check.
+  """
+  if not progressCallback and not cancelEvent:
+    return None
+
+  def callback(sent):
+    if cancelEvent and cancelEvent.is_set():
+      raise UploadCancelled()
+    if progressCallback:
+      progressCallback(offset + sent, total)
+  return callback
+
+
+def makeCancelCallback(cancelEvent):
+  """Returns a wait callback that stops waiting once an upload is cancelled.
+
+  Args:
+    cancelEvent: threading.Event or None.
+  Returns:
+    callable raising UploadCancelled when cancelEvent is set, or None.
+  """
+  if not cancelEvent:
+    return None
+
+  def callback():
+    if cancelEvent.is_set():
+      raise UploadCancelled()
+  return callback
+
+
+def getContentLength(data):
+  """Returns the number of bytes left to send in a request body.
+
+  Args:
+    data: str or file-like object.
+  Returns:
+    int, size of the body in bytes.
+  """
+  if not hasattr(data, 'read'):
+    return len(data)
+  position = data.tell()
+  data.seek(0, os.SEEK_END)
+  end = data.tell()
+  data.seek(position)
+  return end - position
@@ -0,0 +1,427 @@
+"""Keep-alive HTTP transport shared by the Maps Engine and OAuth2 helpers.
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import collections
+import cStringIO
+import httplib
+import socket
+import threading
+import time
+import urllib
+import urllib2
+import urlparse
+import zlib
+import metrics
+
+# Maximum number of idle connections kept open for a single host.
+MAX_IDLE_CONNECTIONS_PER_HOST = 8
+# Idle connections older than this (in seconds) are closed instead of reused.
+# Google front ends drop idle connections after a few minutes.
+IDLE_TIMEOUT = 120
+SOCKET_TIMEOUT = 60
+MAX_REDIRECTS = 5
+# Size of the blocks in which file-like request bodies are sent.
+UPLOAD_CHUNK_SIZE = 256 * 1024
+REDIRECT_CODES = (301, 302, 303, 307)
+# Size of the blocks in which response bodies are read and decompressed.
+READ_CHUNK_SIZE = 64 * 1024
+# Google APIs only compress responses for user agents that mention gzip.
+USER_AGENT = 'GoogleMapsEngineConnector (gzip)'
+
+
+class ConnectionPool(object):
+  """Thread-safe pool of persistent HTTP(S) connections, keyed by host."""
+
+  def __init__(self, maxIdlePerHost=MAX_IDLE_CONNECTIONS_PER_HOST):
+    """Class constructor.
+
+    Args:
+      maxIdlePerHost: int, number of idle connections to keep for each host.
+    """
+    self.maxIdlePerHost = maxIdlePerHost
+    self._lock = threading.Lock()
+    # (scheme, host, port) -> list of (connection, time of last use)
+    self._idle = {}
+
+  def acquire(self, scheme, host, port):
+    """Returns a connection for the given host.
+
+    Args:
+      scheme: str, either 'http' or 'https'.
+      host: str, host name.
+      port: int, port number.
+    Returns:
+      tuple of (connection, reused) where reused is True if the connection
+      was taken from the pool.
+    """
+    key = (scheme, host, port)
+    now = time.time()
+    with self._lock:
+      idle = self._idle.get(key, [])
+      while idle:
+        conn, lastUsed = idle.pop()
+        if now - lastUsed < IDLE_TIMEOUT:
+          return conn, True
+        conn.close()
+
+    if scheme == 'https':
+      conn = httplib.HTTPSConnection(host, port, timeout=SOCKET_TIMEOUT)
+    else:
+      conn = httplib.HTTPConnection(host, port, timeout=SOCKET_TIMEOUT)
+    # Connect explicitly so that the cost of the TCP and TLS handshakes can be
+    # measured separately from the request itself.
+    start = time.time()
+    conn.connect()
+    metrics.recordTime('http.connect', time.time() - start)
+    metrics.increment('http.connections.opened')
+    return conn, False
+
+  def release(self, scheme, host, port, conn):
+    """Returns a connection to the pool so it can be reused.
+
+    Args:
+      scheme: str, either 'http' or 'https'.
+      host: str, host name.
+      port: int, port number.
+      conn: httplib.HTTPConnection, connection to return.
+    """
+    key = (scheme, host, port)
+    with self._lock:
+      idle = self._idle.setdefault(key, [])
+      if len(idle) < self.maxIdlePerHost:
+        idle.append((conn, time.time()))
+        return
+    conn.close()
+
+  def closeAll(self):
+    """Closes every idle connection in the pool."""
+    with self._lock:
+      for idle in self._idle.itervalues():
+        for conn, unused_lastUsed in idle:
+          conn.close()
+      self._idle.clear()
+
+
+_pool = ConnectionPool()
+
+
+def closeAll():
+  """Closes all idle connections held by the shared pool."""
+  _pool.closeAll()
+
+
+def _usesProxy(host):
+  """Returns True if requests to the given host must go through a proxy."""
+  proxies = urllib.getproxies()
+  if not proxies:
+    return False
+  return not urllib.proxy_bypass(host)
+
+
+def _sendBody(conn, data, progressCallback):
+  """Writes a file-like request body to the connection in fixed-size chunks.
+
+  Args:
+    conn: httplib.HTTPConnection, connection to write to.
+    data: file-like object positioned at the start of the body.
+    progressCallback: callable taking the number of bytes sent so far.
+  """
+  sent = 0
+  while True:
+    chunk = data.read(UPLOAD_CHUNK_SIZE)
+    if not chunk:
+      break
+    conn.send(chunk)
+    sent += len(chunk)
+    if progressCallback:
+      progressCallback(sent)
+
+
+class GzipBody(object):
+  """File-like gzip response body, decompressed as it is read.
+
+  Only the compressed data is held in memory, together with the decoded data
+  that was decompressed but not read yet.
+  """
+
+  def __init__(self, chunks):
+    """Class constructor.
+
+    Args:
+      chunks: list, of str blocks of compressed data.
+    """
+    self._chunks = collections.deque(chunks)
+    # The offset tells zlib to expect a gzip header and trailer.
+    self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    self._buffer = ''
+    self._eof = False
+
+  def _fill(self):
+    """Decompresses the next block into the buffer."""
+    try:
+      if self._chunks:
+        data = self._decoder.decompress(self._chunks.popleft())
+      else:
+        data = self._decoder.flush()
+        self._eof = True
+    except zlib.error as e:
+      self._chunks.clear()
+      self._eof = True
+      raise IOError('Invalid gzip response body: %s' % e)
+    metrics.increment('http.bytes.decoded', len(data))
+    self._buffer += data
+
+  def read(self, size=-1):
+    """Reads up to size bytes, or everything left if size is negative."""
+    while (size < 0 or len(self._buffer) < size) and not self._eof:
+      self._fill()
+    if size < 0:
+      size = len(self._buffer)
+    data = self._buffer[:size]
+    self._buffer = self._buffer[size:]
+    return data
+
+  def readline(self, size=-1):
+    """Reads up to and including the next newline."""
+    while '\n' not in self._buffer and not self._eof:
+      if 0 <= size <= len(self._buffer):
+        break
+      self._fill()
+    end = self._buffer.find('\n') + 1 or len(self._buffer)
+    if size >= 0:
+      end = min(end, size)
+    data = self._buffer[:end]
+    self._buffer = self._buffer[end:]
+    return data
+
+  def readlines(self):
+    """Reads the remaining lines."""
+    return list(self)
+
+  def __iter__(self):
+    return iter(self.readline, '')
+
+  def close(self):
+    """Drops the data not read yet."""
+    self._chunks.clear()
+    self._buffer = ''
+    self._eof = True
+
+
+def _readBody(response):
+  """Reads a response body.
+
+  gzip encoded bodies are kept compressed and decompressed as they are read,
+  so that a large response is never held in memory twice.
+
+  Args:
+    response: httplib.HTTPResponse, response to read.
+  Returns:
+    str, or GzipBody if the body was gzip encoded. In that case the
+    Content-Encoding and Content-Length headers are removed from
+    response.msg.
+  """
+  chunks = []
+  received = 0
+  while True:
+    chunk = response.read(READ_CHUNK_SIZE)
+    if not chunk:
+      break
+    received += len(chunk)
+    chunks.append(chunk)
+  metrics.increment('http.bytes.received', received)
+  if (response.getheader('content-encoding') or '').lower() != 'gzip':
+    body = ''.join(chunks)
+    metrics.increment('http.bytes.decoded', len(body))
+    return body
+  del response.msg['content-encoding']
+  if 'content-length' in response.msg:
+    del response.msg['content-length']
+  return GzipBody(chunks)
+
+
+def _sendRequest(method, url, headers, data, progressCallback=None):
+  """Sends a single request over a pooled connection.
+
+  Args:
+    method: str, http method.
+    url: str, full url of the request.
+    headers: list, of (name, value) tuples.
+    data: str or file-like object, request body or None. File-like bodies
+        need a Content-Length header and are streamed from their current
+        position.
+    progressCallback: callable taking the number of bytes sent so far.
+  Returns:
+    tuple of (status, reason, httplib.HTTPMessage, body). body is a str, or
+    a GzipBody if the server compressed it.
+  """
+  parts = urlparse.urlsplit(url)
+  scheme = parts.scheme
+  host = parts.hostname
+  if parts.port:
+    port = parts.port
+  elif scheme == 'https':
+    port = httplib.HTTPS_PORT
+  else:
+    port = httplib.HTTP_PORT
+  selector = parts.path or '/'
+  if parts.query:
+    selector = '%s?%s' % (selector, parts.query)
+
+  streaming = hasattr(data, 'read')
+  if streaming:
+    bodyStart = data.tell()
+
+  # A pooled connection may have been closed by the server while idle. In that
+  # case the request is retried once on a fresh connection.
+  attempts = 2
+  while True:
+    attempts -= 1
+    conn, reused = _pool.acquire(scheme, host, port)
+    try:
+      conn.putrequest(method, selector, skip_accept_encoding=True)
+      for name, value in headers:
+        conn.putheader(name, value)
+      headerNames = set(x.lower() for x, unused_value in headers)
+      if 'accept-encoding' not in headerNames:
+        conn.putheader('Accept-Encoding', 'gzip')
+      if 'user-agent' not in headerNames:
+        conn.putheader('User-Agent', USER_AGENT)
+      if data is not None and 'Content-length' not in dict(headers):
+        conn.putheader('Content-Length', str(len(data)))
+      conn.endheaders()
+      if streaming:
+        data.seek(bodyStart)
+        _sendBody(conn, data, progressCallback)
+      elif data is not None:
+        conn.send(data)
+        if progressCallback:
+          progressCallback(len(data))
+      response = conn.getresponse()
+      body = _readBody(response)
+    except (httplib.HTTPException, socket.error):
+      conn.close()
+      # Streamed bodies are only sent again if none of it was sent yet.
+      if reused and attempts > 0 and (
+          not streaming or data.tell() == bodyStart):
+        metrics.increment('http.connections.stale')
+        continue
+      raise
+    except BaseException:
+      # E.g. the progress callback aborted the request. The connection is in
+      # an unknown state and can not be reused, whatever interrupted it, so
+      # this includes KeyboardInterrupt and SystemExit.
+      conn.close()
+      raise
+
+    if reused:
+      metrics.increment('http.connections.reused')
+    metrics.increment('http.requests')
+    if response.will_close:
+      conn.close()
+    else:
+      _pool.release(scheme, host, port, conn)
+    return response.status, response.reason, response.msg, body
+
+
+def urlopen(request, progressCallback=None):
+  """Opens the given request using a persistent connection.
+
+  Behaves like urllib2.urlopen: redirects are followed, a urllib2.HTTPError is
+  raised for error responses and a urllib2.URLError for network failures.
+  Requests that must go through a proxy are handed over to urllib2.
+
+  Responses are requested with gzip compression and decompressed as the
+  caller reads them. The request data may be a file-like object, in which
+  case it is streamed from disk in UPLOAD_CHUNK_SIZE blocks and the request
+  must carry a Content-Length header.
+
+  Args:
+    request: urllib2.Request
+    progressCallback: callable taking the number of body bytes sent so far.
+  Returns:
+    file-like response object with info(), geturl() and getcode() methods.
+  """
+  url = request.get_full_url()
+  host = request.get_host()
+  if request.get_type() not in ('http', 'https') or _usesProxy(host):
+    return urllib2.urlopen(request)
+
+  method = request.get_method()
+  data = request.get_data()
+  headers = request.header_items()
+  if data is not None and 'Content-type' not in dict(headers):
+    headers.append(('Content-Type', 'application/x-www-form-urlencoded'))
+
+  try:
+    for unused_i in range(MAX_REDIRECTS + 1):
+      status, reason, msg, body = _sendRequest(
+          method, url, headers, data, progressCallback)
+      location = msg.getheader('location')
+      if status not in REDIRECT_CODES or not location:
+        break
+      url = urlparse.urljoin(url, location)
+      if status != 307 and method == 'POST':
+        method = 'GET'
+        data = None
+        headers = [(k, v) for k, v in headers
+                   if k.lower() not in ('content-type', 'content-length')]
+  except (httplib.HTTPException, socket.error) as e:
+    raise urllib2.URLError(e)
+
+  if isinstance(body, GzipBody):
+    fp = body
+  else:
+    fp = cStringIO.StringIO(body)
+  if status >= 300:
+    raise urllib2.HTTPError(url, status, reason, msg, fp)
+  return urllib.addinfourl(fp, msg, url, status)
+
+
+def describeStats(since=None):
+  """Summarises how often pooled connections were reused and data received.
+
+  Args:
+    since: dict, an earlier metrics.snapshot() to report the difference from.
+  Returns:
+    str, human readable summary.
+  """
+  if since:
+    stats = metrics.delta(since)
+  else:
+    stats = metrics.snapshot()
+  counters = stats['counters']
+  requests = counters.get('http.requests', 0)
+  reused = counters.get('http.connections.reused', 0)
+  opened = counters.get('http.connections.opened', 0)
+  received = counters.get('http.bytes.received', 0)
+  decoded = counters.get('http.bytes.decoded', 0)
+  count, total = stats['timings'].get('http.connect', (0, 0.0))
+  if count:
+    average = total / count
+  else:
+    average = 0.0
+  if requests:
+    ratio = 100.0 * reused / requests
+  else:
+    ratio = 0.0
+  return ('%d requests, %d new connections, %d reused (%.0f%%), '
+          'about %.2fs of handshakes saved, %d KB received, '
+          '%d KB decoded' % (
+              requests, opened, reused, ratio, reused * average,
+              received / 1024, decoded / 1024))
@@ -0,0 +1,199 @@
+"""Table model showing the maps of a project in the search dialog.
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+from PyQt4.QtCore import QAbstractTableModel
+from PyQt4.QtCore import QModelIndex
+from PyQt4.QtCore import Qt
+from PyQt4.QtGui import QSortFilterProxyModel
+
+COLUMNS = ('Map Identifier', 'Name', 'Project')
+PROJECT_COLUMN = 2
+
+
+class MapTableModel(QAbstractTableModel):
+  """Exposes a list of gme_map.Map objects to a QTableView.
+
+  Cells are produced on demand from the list, so only the rows on screen cost
+  anything to display.
+  """
+
+  def __init__(self, parent=None):
+    """Class constructor.
+
+    Args:
+      parent: QObject, parent object.
+    """
+    QAbstractTableModel.__init__(self, parent)
+    self.maps = []
+    # Project id -> project name, for the project column.
+    self.projectNames = {}
+    # Column and order of the last sort, reapplied when rows are added.
+    self.sortColumn = None
+    self.sortOrder = Qt.AscendingOrder
+
+  def rowCount(self, parent=QModelIndex()):
+    if parent.isValid():
+      return 0
+    return len(self.maps)
+
+  def columnCount(self, parent=QModelIndex()):
+    if parent.isValid():
+      return 0
+    return len(COLUMNS)
+
+  def data(self, index, role=Qt.DisplayRole):
+    if not index.isValid() or role != Qt.DisplayRole:
+      return None
+    gmeMap = self.maps[index.row()]
+    if index.column() == 0:
+      return gmeMap.id
+    if index.column() == PROJECT_COLUMN:
+      return self.projectName(gmeMap)
+    return gmeMap.name
+
+  def headerData(self, section, orientation, role=Qt.DisplayRole):
+    if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+      return COLUMNS[section]
+    return None
+
+  def mapAt(self, row):
+    """Returns the gme_map.Map object shown in the given row."""
+    return self.maps[row]
+
+  def projectName(self, gmeMap):
+    """Returns the name of the project the given map belongs to."""
+    # Map ids start with the id of their project.
+    projectId = gmeMap.id.split('-')[0]
+    return self.projectNames.get(projectId, projectId)
+
+  def setMaps(self, maps):
+    """Replaces the maps shown.
+
+    Args:
+      maps: list, of gme_map.Map objects.
+    """
+    self.beginResetModel()
+    self.maps = list(maps)
+    self.endResetModel()
+    if self.sortColumn is not None:
+      self.sort(self.sortColumn, self.sortOrder)
+
+  def appendMaps(self, maps):
+    """Adds maps below the ones already shown.
+
+    Args:
+      maps: list, of gme_map.Map objects.
+    """
+    if not maps:
+      return
+    first = len(self.maps)
+    self.beginInsertRows(QModelIndex(), first, first + len(maps) - 1)
+    self.maps.extend(maps)
+    self.endInsertRows()
+    if self.sortColumn is not None:
+      self.sort(self.sortColumn, self.sortOrder)
+
+  def removeMaps(self, mapIds):
+    """Removes the maps with the given ids.
+
+    Args:
+      mapIds: set, of map ids.
+    """
+    for row in reversed(range(len(self.maps))):
+      if self.maps[row].id in mapIds:
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.maps[row]
+        self.endRemoveRows()
+
+  def replaceMaps(self, mapsById):
+    """Replaces maps in place, e.g. after they were renamed.
+
+    Args:
+      mapsById: dict, of map ids to the gme_map.Map objects to show instead.
+    """
+    for row, gmeMap in enumerate(self.maps):
+      if gmeMap.id in mapsById:
+        self.maps[row] = mapsById[gmeMap.id]
+        self.dataChanged.emit(self.index(row, 0),
+                              self.index(row, len(COLUMNS) - 1))
+    if self.sortColumn is not None:
+      self.sort(self.sortColumn, self.sortOrder)
+
+  def sort(self, column, order=Qt.AscendingOrder):
+    """Sorts the list of maps in place by the given column."""
+    self.sortColumn = column
+    self.sortOrder = order
+    if column == 0:
+      key = lambda x: x.id
+    elif column == PROJECT_COLUMN:
+      key = lambda x: self.projectName(x).lower()
+    else:
+      key = lambda x: (x.name or '').lower()
+    self.layoutAboutToBeChanged.emit()
+    oldIndexes = self.persistentIndexList()
+    oldMaps = [self.maps[x.row()] for x in oldIndexes]
+    self.maps.sort(key=key, reverse=(order == Qt.DescendingOrder))
+    if oldIndexes:
+      rows = dict((id(x), row) for row, x in enumerate(self.maps))
+      self.changePersistentIndexList(
+          oldIndexes,
+          [self.index(rows[id(x)], y.column())
+           for x, y in zip(oldMaps, oldIndexes)])
+    self.layoutChanged.emit()
+
+
+class MapFilterProxyModel(QSortFilterProxyModel):
+  """Hides the maps that do not match the current search.
+
+  Sorting is passed on to the MapTableModel, which sorts its list in place.
+  """
+
+  def __init__(self, parent=None):
+    """Class constructor.
+
+    Args:
+      parent: QObject, parent object.
+    """
+    QSortFilterProxyModel.__init__(self, parent)
+    # Ids of the maps to show, or None to show every map.
+    self.visibleIds = None
+
+  def setFilterMaps(self, maps):
+    """Shows only the given maps.
+
+    Args:
+      maps: list, of gme_map.Map objects, or None to show every map.
+    """
+    if maps is None:
+      self.visibleIds = None
+    else:
+      self.visibleIds = set(x.id for x in maps)
+    self.invalidateFilter()
+
+  def filterAcceptsRow(self, sourceRow, sourceParent):
+    if self.visibleIds is None:
+      return True
+    return self.sourceModel().mapAt(sourceRow).id in self.visibleIds
+
+  def sort(self, column, order=Qt.AscendingOrder):
+    self.sourceModel().sort(column, order)
+
+  def mapAt(self, row):
+    """Returns the gme_map.Map object shown in the given row of the proxy."""
+    sourceIndex = self.mapToSource(self.index(row, 0))
+    return self.sourceModel().mapAt(sourceIndex.row())
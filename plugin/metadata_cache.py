@@ -0,0 +1,162 @@
+"""Local cache of the metadata of Maps Engine maps and layers.
+
+Responses are kept with their ETag in a SQLite database in the QGIS profile,
+so that they can be revalidated with a conditional request instead of being
+downloaded again.
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import os
+import sqlite3
+import threading
+import time
+import settings
+
+METADATA_FILE = 'metadata.sqlite'
+# Maximum size in bytes of the cached responses. The least recently used
+# responses are evicted first.
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+# Access times are kept in memory and written with the next store, or once
+# this many are pending.
+ACCESS_FLUSH_COUNT = 100
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS resources ('
+    '  asset_id TEXT,'
+    '  fields TEXT,'
+    '  etag TEXT,'
+    '  body BLOB,'
+    '  size INTEGER,'
+    '  accessed_at REAL,'
+    '  PRIMARY KEY (asset_id, fields))',
+    'CREATE INDEX IF NOT EXISTS resources_accessed_at '
+    '  ON resources (accessed_at)')
+
+_lock = threading.Lock()
+_conn = None
+# (asset id, fields) -> access time not written to the database yet.
+_accessTimes = {}
+
+
+def _connect():
+  """Returns the metadata database, opening it on first use.
+
+  The connection is shared by all threads and must be used with _lock held.
+  """
+  global _conn
+  if _conn is None:
+    path = os.path.join(settings.dataDir(), METADATA_FILE)
+    _conn = sqlite3.connect(path, check_same_thread=False)
+    for statement in SCHEMA:
+      _conn.execute(statement)
+    _conn.commit()
+  return _conn
+
+
+def _writeAccessTimes(conn):
+  """Writes the pending access times. Must be called with _lock held."""
+  conn.executemany(
+      'UPDATE resources SET accessed_at = ? '
+      'WHERE asset_id = ? AND fields = ?',
+      ((accessedAt, assetId, fields)
+       for (assetId, fields), accessedAt in _accessTimes.iteritems()))
+  _accessTimes.clear()
+
+
+def load(assetId, fields):
+  """Returns the cached response for an asset.
+
+  Args:
+    assetId: str, id of the map or layer.
+    fields: str, partial response field mask of the request, or None.
+  Returns:
+    tuple of (etag, body), both None if the response is not cached.
+  """
+  with _lock:
+    conn = _connect()
+    row = conn.execute(
+        'SELECT etag, body FROM resources '
+        'WHERE asset_id = ? AND fields = ?',
+        (assetId, fields or '')).fetchone()
+    if not row:
+      return None, None
+    _accessTimes[(assetId, fields or '')] = time.time()
+    if len(_accessTimes) >= ACCESS_FLUSH_COUNT:
+      _writeAccessTimes(conn)
+      conn.commit()
+  return row[0], str(row[1])
+
+
+def store(assetId, fields, etag, body):
+  """Caches the response for an asset.
+
+  Args:
+    assetId: str, id of the map or layer.
+    fields: str, partial response field mask of the request, or None.
+    etag: str, ETag header of the response.
+    body: str, JSON body of the response.
+  """
+  with _lock:
+    conn = _connect()
+    _accessTimes.pop((assetId, fields or ''), None)
+    _writeAccessTimes(conn)
+    conn.execute(
+        'INSERT OR REPLACE INTO resources '
+        '(asset_id, fields, etag, body, size, accessed_at) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        (assetId, fields or '', etag, sqlite3.Binary(body), len(body),
+         time.time()))
+    _evict(conn)
+    conn.commit()
+
+
+def _evict(conn):
+  """Removes the least recently used responses above the size limit."""
+  maxBytes = (settings.read('gmeconnector/METADATA_CACHE_MAX_BYTES',
+                            object_type=int) or DEFAULT_MAX_BYTES)
+  total = 0
+  expired = []
+  # Most recently used responses first.
+  for assetId, fields, size in conn.execute(
+      'SELECT asset_id, fields, size FROM resources '
+      'ORDER BY accessed_at DESC'):
+    total += size
+    if total > maxBytes:
+      expired.append((assetId, fields))
+  conn.executemany(
+      'DELETE FROM resources WHERE asset_id = ? AND fields = ?', expired)
+
+
+def clear():
+  """Removes all cached responses, e.g. after the user signs out."""
+  with _lock:
+    conn = _connect()
+    _accessTimes.clear()
+    conn.execute('DELETE FROM resources')
+    conn.commit()
+
+
+def close():
+  """Writes the pending access times and closes the database."""
+  global _conn
+  with _lock:
+    if _conn is None:
+      return
+    _writeAccessTimes(_conn)
+    _conn.commit()
+    _conn.close()
+    _conn = None
@@ -0,0 +1,110 @@
+"""Lightweight counters and timers for measuring connector performance.
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import threading
+import time
+
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+
+
+def increment(name, value=1):
+  """Adds the given value to a named counter.
+
+  Args:
+    name: str, name of the counter.
+    value: int, amount to add.
+  """
+  with _lock:
+    _counters[name] = _counters.get(name, 0) + value
+
+
+def recordTime(name, seconds):
+  """Records a duration against a named timer.
+
+  Args:
+    name: str, name of the timer.
+    seconds: float, duration to record.
+  """
+  with _lock:
+    count, total = _timings.get(name, (0, 0.0))
+    _timings[name] = (count + 1, total + seconds)
+
+
+class timed(object):
+  """Context manager that records the duration of its block.
+
+  Example:
+    with metrics.timed('search.filter'):
+      ...
+  """
+
+  def __init__(self, name):
+    self.name = name
+    self.start = None
+
+  def __enter__(self):
+    self.start = time.time()
+    return self
+
+  def __exit__(self, *unused_excInfo):
+    recordTime(self.name, time.time() - self.start)
+    return False
+
+
+def snapshot():
+  """Returns a copy of the current counters and timers.
+
+  Returns:
+    dict with 'counters' mapping names to values and 'timings' mapping names
+    to (count, total_seconds) tuples.
+  """
+  with _lock:
+    return {'counters': dict(_counters), 'timings': dict(_timings)}
+
+
+def delta(before, after=None):
+  """Computes the difference between two snapshots.
+
+  Args:
+    before: dict, an earlier value returned by snapshot().
+    after: dict, a later snapshot. Defaults to the current values.
+  Returns:
+    dict in the same format as snapshot() containing only the changes.
+  """
+  if after is None:
+    after = snapshot()
+  counters = {}
+  for name, value in after['counters'].iteritems():
+    diff = value - before['counters'].get(name, 0)
+    if diff:
+      counters[name] = diff
+  timings = {}
+  for name, (count, total) in after['timings'].iteritems():
+    oldCount, oldTotal = before['timings'].get(name, (0, 0.0))
+    if count != oldCount:
+      timings[name] = (count - oldCount, total - oldTotal)
+  return {'counters': counters, 'timings': timings}
+
+
+def reset():
+  """Clears all counters and timers."""
+  with _lock:
+    _counters.clear()
+    _timings.clear()
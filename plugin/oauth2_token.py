@@ -25,6 +25,7 @@ class OAuth2Token(object):
     self.access_token = access_token
     self.refresh_token = refresh_token
     self.expires_in = expires_in
+    self.expires_at = expires_at
     if self.expires_in:
       now = datetime.now()
       self.expires_at = str(now + timedelta(seconds=self.expires_in))
@@ -17,10 +17,17 @@ along with this program; if not, write to the Free Software
 Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
 import json
+import threading
 import urllib
 import urllib2
+from datetime import datetime
+from datetime import timedelta
+from PyQt4.QtCore import QCoreApplication
+from PyQt4.QtCore import QThread
 from qgis.core import QgsMessageLog
+import http_pool
 from oauth2_token import OAuth2Token
+import retry_policy
 import settings
 
 OAUTH2_TOKEN_URL = 'https://accounts.google.com/o/oauth2/token'
@@ -31,33 +38,174 @@ OAUTH2_TOKENINFO_URL = 'https://www.googleapis.com/oauth2/v1/tokeninfo'
 OAUTH2_USERINFO_URL = 'https://www.googleapis.com/oauth2/v1/userinfo'
 OAUTH2_AUTH_SCOPES = ('https://www.googleapis.com/auth/mapsengine '
                       'https://www.googleapis.com/auth/userinfo.profile')
+# Tokens are refreshed this long before they expire, so that a request started
+# just before the expiry time does not fail.
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+# Process-wide copy of the current token. Access is guarded by _tokenLock.
+# The lock is never held over a network request: requests on the GUI thread
+# process events while backing off, which can run code asking for a token.
+_tokenLock = threading.RLock()
+_cachedToken = None
+# _Refresh in progress, shared by all callers that need a new token.
+_refreshing = None
+
+
+class _Refresh(object):
+  """A token refresh in progress and its result."""
+
+  def __init__(self):
+    self.thread = threading.current_thread()
+    self.done = threading.Event()
+    self.result = None
 
 
 def getToken():
-  """Read the token parameters from settings and return a token object.
+  """Return the current token, refreshing it if it is about to expire.
+
+  The token is kept in memory after the first call, and its expiry time is
+  trusted instead of asking the tokeninfo endpoint on every call. Use
+  refreshRejectedToken() when the server rejects a token before then.
 
   Returns:
     OAuth2Token instance is succcessful, None if the token is not available.
   """
+  global _cachedToken
+  with _tokenLock:
+    token = _cachedToken or readToken()
+  if not token:
+    return None
+
+  expiresAt = parseExpiresAt(token.expires_at)
+  if expiresAt is None:
+    # Unknown expiry time, ask the server.
+    if not isTokenValid(token):
+      return _refresh(token)
+  elif expiresAt - TOKEN_REFRESH_MARGIN <= datetime.now():
+    # The token can still be used by a caller that can not wait for the
+    # refresh, as long as it has not expired yet.
+    fallback = token if expiresAt > datetime.now() else None
+    return _refresh(token, fallback)
+  with _tokenLock:
+    if _cachedToken is None:
+      _cachedToken = token
+  return token
+
+
+def readToken():
+  """Read the token parameters from settings.
+
+  Returns:
+    OAuth2Token instance if all parameters are set, None otherwise.
+  """
   token = OAuth2Token()
   token.access_token = settings.read('gmeconnector/ACCESS_TOKEN', object_type=str)
   token.refresh_token = settings.read('gmeconnector/REFRESH_TOKEN', object_type=str)
   token.expires_at = settings.read('gmeconnector/EXPIRES_AT', object_type=str)
 
   if token.access_token and token.refresh_token and token.expires_at:
-    if isTokenValid(token):
-      return token
-    else:
-      return refreshToken(token)
+    return token
   else:
     return None
 
 
 def setToken(token):
   """Write the token parameters to settings."""
-  settings.write('gmeconnector/ACCESS_TOKEN', token.access_token)
-  settings.write('gmeconnector/REFRESH_TOKEN', token.refresh_token)
-  settings.write('gmeconnector/EXPIRES_AT', token.expires_at)
+  global _cachedToken
+  with _tokenLock:
+    _cachedToken = token
+    settings.write('gmeconnector/ACCESS_TOKEN', token.access_token)
+    settings.write('gmeconnector/REFRESH_TOKEN', token.refresh_token)
+    settings.write('gmeconnector/EXPIRES_AT', token.expires_at)
+
+
+def clearCachedToken():
+  """Forget the in-memory token, e.g. after signing out."""
+  global _cachedToken
+  with _tokenLock:
+    _cachedToken = None
+
+
+def refreshRejectedToken(access_token):
+  """Refresh the token after the server rejected the given access token.
+
+  If another caller has already refreshed the token in the meantime, the
+  current token is returned without contacting the server again.
+
+  Args:
+    access_token: str, the access token that was rejected.
+  Returns:
+    a new OAuth2Token instance if successful, None if failed.
+  """
+  with _tokenLock:
+    token = _cachedToken or readToken()
+  if not token:
+    return None
+  if token.access_token != access_token:
+    return token
+  return _refresh(token)
+
+
+def _refresh(token, fallback=None):
+  """Refreshes the token, sharing the request with concurrent callers.
+
+  Args:
+    token: OAuth2Token instance to refresh.
+    fallback: OAuth2Token instance, returned when the refresh can not be
+        waited for because it is in progress on the calling thread.
+  Returns:
+    a new OAuth2Token instance if successful, None if failed.
+  """
+  global _refreshing
+  with _tokenLock:
+    current = _cachedToken
+    if current and current.access_token != token.access_token:
+      # Refreshed by another caller since the token was read.
+      return current
+    refresh = _refreshing
+    leader = refresh is None
+    if leader:
+      refresh = _Refresh()
+      _refreshing = refresh
+
+  if leader:
+    try:
+      refresh.result = refreshToken(token)
+    finally:
+      with _tokenLock:
+        _refreshing = None
+      refresh.done.set()
+    return refresh.result
+
+  if refresh.thread is threading.current_thread():
+    # Reentered from the events processed while the refresh backs off, which
+    # can not finish before this call returns.
+    return fallback
+  waitCallback = _getWaitCallback()
+  if waitCallback:
+    while not refresh.done.wait(retry_policy.WAIT_INTERVAL):
+      waitCallback()
+  else:
+    refresh.done.wait()
+  return refresh.result
+
+
+def parseExpiresAt(expires_at):
+  """Parse the expiry time stored with a token.
+
+  Args:
+    expires_at: str, expiry time as written by OAuth2Token.
+  Returns:
+    datetime if the value could be parsed, None otherwise.
+  """
+  if not expires_at:
+    return None
+  for fmt in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S'):
+    try:
+      return datetime.strptime(expires_at, fmt)
+    except ValueError:
+      pass
+  return None
 
 
 def isTokenValid(token):
@@ -73,7 +221,6 @@ def isTokenValid(token):
   # Make a GET request
   response = makeHttpRequest(req)
   if response:
-    response = urllib2.urlopen(req)
     results = json.load(response)
     if results['audience'] == settings.read('gmeconnector/CLIENT_ID'):
       return True
@@ -93,6 +240,7 @@ def revokeToken():
     # Make a GET request
     req = urllib2.Request(revokeUrl)
     makeHttpRequest(req)
+  clearCachedToken()
 
 
 def getUserName(token):
@@ -186,6 +334,7 @@ def refreshToken(token):
       setToken(token)
       return token
     else:
+      clearCachedToken()
       return None
 
 
@@ -222,6 +371,15 @@ def buildAuthenticationUri():
   return authUrl
 
 
+def _getWaitCallback():
+  """Returns the callback to run while waiting, None off the GUI thread."""
+  app = QCoreApplication.instance()
+  if app is not None and QThread.currentThread() == app.thread():
+    # Keep the interface responsive while waiting on the GUI thread.
+    return QCoreApplication.processEvents
+  return None
+
+
 def makeHttpRequest(request):
   """Make a http request.
 
@@ -230,15 +388,23 @@ def makeHttpRequest(request):
   Returns:
     server response if successful, None if failed.
   """
-  retries = 2
+  policy = retry_policy.getPolicy(retry_policy.OAUTH)
+  waitCallback = _getWaitCallback()
+  attempts = 0
   # Make the request
-  while retries > 0:
+  while True:
     try:
-      response = urllib2.urlopen(request)
+      response = http_pool.urlopen(request)
       return response
     except (urllib2.HTTPError, urllib2.URLError) as e:
+      attempts += 1
       errorMsg = 'Error while fetching %s: %s' % (request.get_full_url(), e)
+      if not policy.shouldRetry(e, attempts):
+        QgsMessageLog.logMessage(
+            errorMsg, 'GMEConnector', QgsMessageLog.CRITICAL)
+        return None
+      delay = policy.getDelay(e, attempts)
       QgsMessageLog.logMessage(
-          errorMsg, 'GMEConnector', QgsMessageLog.CRITICAL)
-      retries -= 1
-  return None
+          '%s. Retrying in %.1fs.' % (errorMsg, delay), 'GMEConnector',
+          QgsMessageLog.WARNING)
+      retry_policy.wait(delay, waitCallback)
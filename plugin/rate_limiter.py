@@ -0,0 +1,173 @@
+"""Keeps the rate of requests to each Maps Engine project under its quota.
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import re
+import threading
+import time
+import urlparse
+import metrics
+import retry_policy
+import settings
+
+# Requests per second allowed for each project. The API quota is set per
+# project in the developer console, so this is sized for the plugin's own
+# request pools instead: up to 8 layer requests of one map at a time
+# (search_gme_dialog.DEFAULT_FETCH_WORKERS), each taking a few hundred
+# milliseconds. Quota errors lower the rate, see TokenBucket.
+DEFAULT_MAX_QPS = 10.0
+# Number of requests that may be sent at once after an idle period. Matches
+# search_gme_dialog.DEFAULT_FETCH_WORKERS, the largest pool, so that all of its
+# workers can start at once.
+DEFAULT_BURST = 8
+# The rate is never lowered below this, so that requests keep flowing.
+MIN_QPS = 0.5
+# Requests per second given back after each successful request.
+RATE_INCREASE = 0.1
+# Seconds after lowering the rate during which further quota errors are
+# attributed to requests already sent at the old rate.
+DECREASE_INTERVAL = 1.0
+
+# Asset ids have the form <project id>-<asset number>.
+ASSET_ID_RE = re.compile(r'^(\d+)-\d+$')
+
+
+def projectIdFromUrl(url):
+  """Returns the id of the project a request url refers to.
+
+  Args:
+    url: str, url of a Maps Engine API request.
+  Returns:
+    str, the projectId parameter or the prefix of the first asset id in the
+    path, None if the request does not belong to a project.
+  """
+  parts = urlparse.urlsplit(url)
+  query = urlparse.parse_qs(parts.query)
+  if 'projectId' in query:
+    return query['projectId'][0]
+  for segment in parts.path.split('/'):
+    match = ASSET_ID_RE.match(segment)
+    if match:
+      return match.group(1)
+  return None
+
+
+class TokenBucket(object):
+  """Token bucket whose rate adapts to quota errors.
+
+  The rate is halved when the server reports that the quota is exceeded and
+  grows back by RATE_INCREASE with every successful request, up to maxRate.
+  """
+
+  def __init__(self, maxRate, burst):
+    """Class constructor.
+
+    Args:
+      maxRate: float, requests per second allowed when no errors occur.
+      burst: int, size of the bucket.
+    """
+    self._lock = threading.Lock()
+    self.maxRate = maxRate
+    self.rate = maxRate
+    self.burst = burst
+    self.tokens = float(burst)
+    self.updatedAt = time.time()
+    self.decreasedAt = 0.0
+
+  def reserve(self):
+    """Takes a token from the bucket.
+
+    The bucket may go into debt, so that waiting callers are served in the
+    order they arrived.
+
+    Returns:
+      float, seconds to wait before sending the request.
+    """
+    with self._lock:
+      now = time.time()
+      self.tokens = min(self.burst,
+                        self.tokens + (now - self.updatedAt) * self.rate)
+      self.updatedAt = now
+      self.tokens -= 1
+      if self.tokens >= 0:
+        return 0.0
+      return -self.tokens / self.rate
+
+  def decreaseRate(self):
+    """Halves the rate after a quota error."""
+    with self._lock:
+      now = time.time()
+      if now - self.decreasedAt < DECREASE_INTERVAL:
+        return
+      self.decreasedAt = now
+      self.rate = max(MIN_QPS, self.rate / 2)
+
+  def increaseRate(self):
+    """Raises the rate a little after a successful request."""
+    with self._lock:
+      self.rate = min(self.maxRate, self.rate + RATE_INCREASE)
+
+
+_lock = threading.Lock()
+# Project id -> TokenBucket. Requests outside any project share the bucket of
+# the None key.
+_buckets = {}
+
+
+def getBucket(projectId):
+  """Returns the token bucket of a project, creating it if needed."""
+  with _lock:
+    bucket = _buckets.get(projectId)
+    if not bucket:
+      maxRate = (settings.read('gmeconnector/MAX_QPS', object_type=float) or
+                 DEFAULT_MAX_QPS)
+      burst = (settings.read('gmeconnector/MAX_BURST', object_type=int) or
+               DEFAULT_BURST)
+      bucket = TokenBucket(maxRate, burst)
+      _buckets[projectId] = bucket
+    return bucket
+
+
+def acquire(projectId, waitCallback=None):
+  """Waits until a request to the project may be sent.
+
+  Args:
+    projectId: str, id of the project, or None.
+    waitCallback: callable, called periodically while waiting, e.g.
+        QCoreApplication.processEvents to keep the GUI responsive.
+  """
+  delay = getBucket(projectId).reserve()
+  metrics.recordTime('ratelimit.wait', delay)
+  if delay > 0:
+    metrics.increment('ratelimit.delayed')
+    retry_policy.wait(delay, waitCallback)
+
+
+def reportResult(projectId, error=None):
+  """Adapts the rate of a project to the outcome of a request.
+
+  Args:
+    projectId: str, id of the project, or None.
+    error: urllib2.URLError or urllib2.HTTPError if the request failed.
+  """
+  bucket = getBucket(projectId)
+  if error is None:
+    bucket.increaseRate()
+  elif retry_policy.isRateLimitError(error):
+    metrics.increment('ratelimit.quotaErrors')
+    bucket.decreaseRate()
+
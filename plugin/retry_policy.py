@@ -0,0 +1,209 @@
+"""Decides whether failed requests are retried and how long to wait first.
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import email.utils
+import json
+import random
+import time
+import urllib2
+import settings
+
+# Call types with their own retry policy.
+READ = 'read'
+WRITE = 'write'
+OAUTH = 'oauth'
+
+# Status codes of transient server errors.
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+# Reasons of 403 errors that clear up once the request rate drops.
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+# Requests are not retried if the server asks to wait longer than this many
+# seconds in a Retry-After header.
+MAX_RETRY_AFTER = 120
+# Seconds between calls to the wait callback while backing off.
+WAIT_INTERVAL = 0.05
+
+
+def getErrorReasons(error):
+  """Returns the reasons listed in the JSON body of an API error response.
+
+  The body can only be read once, so the reasons are kept on the error.
+
+  Args:
+    error: urllib2.URLError or urllib2.HTTPError.
+  Returns:
+    list of str, e.g. ['rateLimitExceeded'].
+  """
+  if not isinstance(error, urllib2.HTTPError):
+    return []
+  if not hasattr(error, 'apiReasons'):
+    reasons = []
+    try:
+      body = json.loads(error.read())
+      reasons = [x.get('reason') for x in body['error']['errors']]
+    except Exception:
+      pass
+    error.apiReasons = reasons
+  return error.apiReasons
+
+
+def isRateLimitError(error):
+  """Returns True if the error reports that a quota or rate was exceeded."""
+  if not isinstance(error, urllib2.HTTPError):
+    return False
+  if error.code == 429:
+    return True
+  return error.code == 403 and any(
+      x in RATE_LIMIT_REASONS for x in getErrorReasons(error))
+
+
+def getRetryAfter(error):
+  """Returns the delay requested by the server in a Retry-After header.
+
+  Args:
+    error: urllib2.URLError or urllib2.HTTPError.
+  Returns:
+    float, seconds to wait, or None if the server did not ask for a delay.
+  """
+  if not isinstance(error, urllib2.HTTPError) or not error.hdrs:
+    return None
+  value = error.hdrs.getheader('retry-after')
+  if not value:
+    return None
+  try:
+    return max(0.0, float(value))
+  except ValueError:
+    pass
+  # The value may also be an HTTP date.
+  date = email.utils.parsedate_tz(value)
+  if not date:
+    return None
+  return max(0.0, email.utils.mktime_tz(date) - time.time())
+
+
+class RetryPolicy(object):
+  """Retry rules for one type of call."""
+
+  def __init__(self, maxAttempts=3, baseDelay=1.0, maxDelay=32.0,
+               retryNetworkErrors=True, retryStatus=RETRYABLE_STATUS):
+    """Class constructor.
+
+    Args:
+      maxAttempts: int, number of attempts including the first one.
+      baseDelay: float, seconds to wait before the first retry.
+      maxDelay: float, upper bound of the wait in seconds.
+      retryNetworkErrors: bool, whether to retry when no response arrived.
+      retryStatus: tuple, of http status codes worth retrying.
+    """
+    self.maxAttempts = maxAttempts
+    self.baseDelay = baseDelay
+    self.maxDelay = maxDelay
+    self.retryNetworkErrors = retryNetworkErrors
+    self.retryStatus = retryStatus
+
+  def isRetryable(self, error):
+    """Returns True if the request may succeed when sent again.
+
+    Args:
+      error: urllib2.URLError or urllib2.HTTPError.
+    """
+    if isinstance(error, urllib2.HTTPError):
+      return error.code in self.retryStatus or isRateLimitError(error)
+    return self.retryNetworkErrors
+
+  def shouldRetry(self, error, attempt):
+    """Returns True if another attempt should be made.
+
+    Args:
+      error: urllib2.URLError or urllib2.HTTPError of the failed attempt.
+      attempt: int, number of attempts made so far.
+    """
+    if attempt >= self.maxAttempts or not self.isRetryable(error):
+      return False
+    retryAfter = getRetryAfter(error)
+    return retryAfter is None or retryAfter <= MAX_RETRY_AFTER
+
+  def getDelay(self, error, attempt):
+    """Returns the seconds to wait before the next attempt.
+
+    A Retry-After header sent by the server is honored in full, see
+    shouldRetry for the upper bound. Otherwise the delay grows exponentially
+    with the number of attempts, and half of it is random so that clients
+    failing together do not retry together.
+
+    Args:
+      error: urllib2.URLError or urllib2.HTTPError of the failed attempt.
+      attempt: int, number of attempts made so far.
+    Returns:
+      float, seconds to wait.
+    """
+    retryAfter = getRetryAfter(error)
+    if retryAfter is not None:
+      return retryAfter
+    delay = min(self.baseDelay * 2 ** (attempt - 1), self.maxDelay)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+# Default policies. Writes are only retried when the server certainly did
+# not act on the request, so that assets are not created twice.
+POLICIES = {
+    READ: RetryPolicy(maxAttempts=4),
+    WRITE: RetryPolicy(maxAttempts=3, retryNetworkErrors=False,
+                       retryStatus=(429, 503)),
+    OAUTH: RetryPolicy(maxAttempts=3, baseDelay=0.5, maxDelay=8.0),
+}
+
+
+def getPolicy(callType):
+  """Returns the retry policy of a call type.
+
+  The number of attempts can be changed with the
+  gmeconnector/RETRY_ATTEMPTS_<TYPE> setting, e.g. RETRY_ATTEMPTS_READ.
+
+  Args:
+    callType: str, one of READ, WRITE or OAUTH.
+  Returns:
+    RetryPolicy instance.
+  """
+  policy = POLICIES[callType]
+  maxAttempts = settings.read(
+      'gmeconnector/RETRY_ATTEMPTS_%s' % callType.upper(), object_type=int)
+  if maxAttempts:
+    return RetryPolicy(maxAttempts, policy.baseDelay, policy.maxDelay,
+                       policy.retryNetworkErrors, policy.retryStatus)
+  return policy
+
+
+def wait(seconds, waitCallback=None):
+  """Waits before a retry.
+
+  Args:
+    seconds: float, time to wait.
+    waitCallback: callable, called periodically while waiting, e.g.
+        QCoreApplication.processEvents to keep the GUI responsive.
+  """
+  if not waitCallback:
+    time.sleep(seconds)
+    return
+  end = time.time() + seconds
+  while True:
+    waitCallback()
+    remaining = end - time.time()
+    if remaining <= 0:
+      return
+    time.sleep(min(remaining, WAIT_INTERVAL))
@@ -16,18 +16,26 @@ You should have received a copy of the GNU General Public License
 along with this program; if not, write to the Free Software
 Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
+import catalog_cache
 import codecs
 import cStringIO
 import csv
 import gme_api
+import http_pool
+import map_table_model
+import metrics
 import oauth2_utils
+import search_index
+import time
+from PyQt4.QtCore import pyqtSignal
 from PyQt4.QtCore import QCoreApplication
+from PyQt4.QtCore import QThread
+from PyQt4.QtCore import QTimer
 from PyQt4.QtCore import QVariant
 from PyQt4.QtGui import QAbstractItemView
 from PyQt4.QtGui import QApplication
 from PyQt4.QtGui import QDialog
 from PyQt4.QtGui import QDialogButtonBox
-from PyQt4.QtGui import QTableWidgetItem
 from qgis.core import QgsFeature
 from qgis.core import QgsField
 from qgis.core import QgsGeometry
@@ -38,6 +46,16 @@ from qgis.core import QgsVectorLayer
 from qgis.gui import QgsMessageBar
 from search_gme_dialog_base import Ui_Dialog
 import settings
+import workers
+
+# Number of layers fetched at the same time when a map is opened.
+DEFAULT_FETCH_WORKERS = 8
+# Pause in typing, in milliseconds, after which the search is run.
+DEFAULT_SEARCH_DEBOUNCE_MS = 250
+# Number of project listings fetched at the same time in all projects mode.
+DEFAULT_PROJECT_FETCH_WORKERS = 4
+# Item data of the comboBox entry that searches every project.
+ALL_PROJECTS = '*'
 
 worldGeom = QgsGeometry.fromPolygon(
     [[QgsPoint(-180, -90), QgsPoint(-180, 90),
@@ -61,13 +79,31 @@ class Dialog(QDialog, Ui_Dialog):
     self.copyButton.setEnabled(False)
     self.copyButton.clicked.connect(self.copyToClipBoard)
 
+    # The table shows the maps through a proxy model that applies the search.
+    self.mapModel = map_table_model.MapTableModel(self)
+    self.proxyModel = map_table_model.MapFilterProxyModel(self)
+    self.proxyModel.setSourceModel(self.mapModel)
+    self.tableView.setModel(self.proxyModel)
+    self.tableView.setSortingEnabled(True)
+
     # When any cell in the table is clicked, select the entire row.
-    self.tableWidget.setSelectionBehavior(QAbstractItemView.SelectRows)
-    self.tableWidget.itemSelectionChanged.connect(
+    self.tableView.setSelectionBehavior(QAbstractItemView.SelectRows)
+    self.tableView.selectionModel().selectionChanged.connect(
         self.handleSelectionChanged)
 
-    # Trigger search on every keystroke.
-    self.lineEdit.textChanged.connect(self.searchLocalDirectory)
+    # Search once typing pauses. Each search started gets a new generation,
+    # and results of older generations are discarded when they arrive.
+    debounce = settings.read('gmeconnector/SEARCH_DEBOUNCE_MS',
+                             object_type=int)
+    if not debounce:
+      debounce = DEFAULT_SEARCH_DEBOUNCE_MS
+    self.searchGeneration = 0
+    self.searchRequestedAt = None
+    self.searchTimer = QTimer(self)
+    self.searchTimer.setSingleShot(True)
+    self.searchTimer.setInterval(debounce)
+    self.searchTimer.timeout.connect(self.startSearch)
+    self.lineEdit.textChanged.connect(self.scheduleSearch)
 
     self.loadInitialMaps()
     self.iface.messageBar().clearWidgets()
@@ -75,11 +111,14 @@ class Dialog(QDialog, Ui_Dialog):
   def loadInitialMaps(self):
     """Populates the dialog with maps."""
     self.projectDict = settings.read('gmeconnector/PROJECTS')
+    self.mapModel.projectNames = self.projectDict
     self.comboBox.clear()
     for key, val in self.projectDict.items():
       projectId = key
       projectName = val
       self.comboBox.addItem(projectName, projectId)
+    if len(self.projectDict) > 1:
+      self.comboBox.addItem('All projects', ALL_PROJECTS)
 
     defaultProjectId = settings.read('gmeconnector/DEFAULT_PROJECT')
     lastUsedProjectId = settings.read('gmeconnector/LAST_USED_PROJECT')
@@ -93,56 +132,117 @@ class Dialog(QDialog, Ui_Dialog):
     else:
       self.loadMapsForProject(self.projectDict.iterkeys().next())
 
+  def scheduleSearch(self):
+    """Restarts the search timer after a keystroke."""
+    self.searchRequestedAt = time.time()
+    self.searchTimer.start()
+
+  def startSearch(self):
+    """Searches for the current term in a background thread."""
+    self.searchGeneration += 1
+    search_term = unicode(self.lineEdit.text())
+    if not search_term:
+      self.handleSearchDone(self.searchGeneration, search_term, None)
+      return
+    thread = SearchThread(self.searchGeneration, self.searchIndex, search_term)
+    thread.searched.connect(self.handleSearchDone)
+    _searchThreads.add(thread)
+    thread.finished.connect(lambda: _forgetSearchThread(thread))
+    thread.start()
+
+  def handleSearchDone(self, generation, search_term, filtered_maps):
+    """Shows the result of a search unless a newer one has been started.
+
+    Args:
+      generation: int, generation of the search.
+      search_term: str, term that was searched for.
+      filtered_maps: list, of gme_map.Map objects matching the term, or None
+          if the term is empty.
+    """
+    if generation != self.searchGeneration:
+      metrics.increment('search.discarded')
+      return
+    with metrics.timed('search.apply'):
+      self.showSearchResult(unicode(search_term), filtered_maps)
+    if self.searchRequestedAt:
+      metrics.recordTime('search.latency',
+                         time.time() - self.searchRequestedAt)
+      self.searchRequestedAt = None
+
   def searchLocalDirectory(self):
-    """Simple search implementation based on substring match."""
+    """Searches for the current term right away, e.g. after maps changed."""
+    self.searchTimer.stop()
+    self.searchRequestedAt = None
+    self.searchGeneration += 1
     search_term = unicode(self.lineEdit.text())
-    currentIndex = self.comboBox.currentIndex()
-    currentProjectId = unicode(self.comboBox.itemData(currentIndex))
     if search_term:
-      filtered_maps = []
-      for gmeMap in self.maps:
-        if (gmeMap.id.lower() == search_term.lower() or
-            search_term.lower() in gmeMap.name.lower()):
-          filtered_maps.append(gmeMap)
-      self.populateTable(filtered_maps)
-      labelText = 'Displaying %d results from account %s' % (
-          len(filtered_maps), self.projectDict[currentProjectId])
+      filtered_maps = self.searchIndex.search(search_term)
+    else:
+      filtered_maps = None
+    self.showSearchResult(search_term, filtered_maps)
+
+  def showSearchResult(self, search_term, filtered_maps):
+    """Filters the table and updates the result label.
+
+    Args:
+      search_term: str, term that was searched for.
+      filtered_maps: list, of gme_map.Map objects matching the term, or None
+          if the term is empty.
+    """
+    account = self.describeAccount(self.currentProjectId)
+    if search_term:
+      self.proxyModel.setFilterMaps(filtered_maps)
+      labelText = 'Displaying %d results from %s' % (
+          len(filtered_maps), account)
       self.resultLabel.setText(labelText)
     else:
       # This is needed to return to original state after a search term is
       # deleted.
-      self.populateTable(self.maps)
-      labelText = 'Displaying %d maps from account %s' % (
-          len(self.maps), self.projectDict[currentProjectId])
+      self.proxyModel.setFilterMaps(None)
+      labelText = 'Displaying %d maps from %s' % (len(self.maps), account)
       self.resultLabel.setText(labelText)
 
+  def describeAccount(self, projectId):
+    """Returns the text naming the given project in the result label."""
+    if projectId == ALL_PROJECTS:
+      return 'all accounts'
+    return 'account %s' % self.projectDict[projectId]
+
+  def showProjectColumn(self, show):
+    """Shows the project column, used when maps of every project are listed.
+
+    Args:
+      show: bool, whether to show the column.
+    """
+    self.tableView.setColumnHidden(map_table_model.PROJECT_COLUMN, not show)
+    if show:
+      self.tableView.setColumnWidth(0, 300)
+      self.tableView.setColumnWidth(1, 400)
+      self.tableView.setColumnWidth(map_table_model.PROJECT_COLUMN, 200)
+    else:
+      self.tableView.setColumnWidth(0, 400)
+      self.tableView.setColumnWidth(1, 500)
+
   def populateTable(self, maps):
-    """Populates the table widget with map information.
+    """Populates the table with map information.
+
+    Args:
+      maps: list, of gme_map.Map objects.
+    """
+    self.mapModel.setMaps(maps)
+
+  def appendRows(self, maps):
+    """Adds rows for the given maps to the table.
 
     Args:
       maps: list, of gme_map.Map objects.
     """
-    numrows = len(maps)
-    numcols = 2
-    self.tableWidget.setSortingEnabled(True)
-    self.tableWidget.setRowCount(numrows)
-    self.tableWidget.setColumnCount(numcols)
-    row_index = 0
-    self.tableWidget.setColumnWidth(0, 400)
-    self.tableWidget.setColumnWidth(1, 500)
-    header2 = QTableWidgetItem('Map Identifier')
-    self.tableWidget.setHorizontalHeaderItem(0, header2)
-    header1 = QTableWidgetItem('Name')
-    self.tableWidget.setHorizontalHeaderItem(1, header1)
-    for gmeMap in maps:
-      col1 = gmeMap.id
-      item1 = QTableWidgetItem('%s' % col1)
-      col2 = gmeMap.name
-      item2 = QTableWidgetItem('%s' % col2)
-
-      self.tableWidget.setItem(row_index, 0, item1)
-      self.tableWidget.setItem(row_index, 1, item2)
-      row_index += 1
+    self.mapModel.appendMaps(maps)
+
+  def selectedMaps(self):
+    """Returns the gme_map.Map objects of the selected rows."""
+    selection = self.tableView.selectionModel()
+    return [self.proxyModel.mapAt(x.row()) for x in selection.selectedRows()]
 
   def loadMapsForIndex(self, index):
     """Loads map for thegiven index.
@@ -151,31 +251,194 @@ class Dialog(QDialog, Ui_Dialog):
       index: int, index of the comboBox widget.
     """
     projectId = unicode(self.comboBox.itemData(index))
-    self.loadMapsForProject(projectId)
+    if projectId == ALL_PROJECTS:
+      self.loadMapsForAllProjects()
+    else:
+      self.loadMapsForProject(projectId)
 
   def loadMapsForProject(self, projectId):
     """Loads maps for the given project id.
 
+    A cached listing is shown immediately and refreshed in the background if
+    it is older than catalog_cache.refreshAfter(). Without a cached listing,
+    the maps are fetched from the server.
+
     Args:
       projectId: str, id of the maps engine project.
     """
     index = self.comboBox.findData(projectId)
     self.comboBox.setCurrentIndex(index)
     settings.write('gmeconnector/LAST_USED_PROJECT', projectId)
+    self.currentProjectId = projectId
+    # Results of searches still running refer to the previous project.
+    self.searchGeneration += 1
+    self.showProjectColumn(False)
+
+    cachedMaps, fetchedAt = catalog_cache.load(projectId)
+    if cachedMaps is not None:
+      self.maps = cachedMaps
+      self.searchIndex = search_index.MapSearchIndex(self.maps)
+      self.populateTable(self.maps)
+      self.searchLocalDirectory()
+      if time.time() - fetchedAt > catalog_cache.refreshAfter():
+        thread = catalog_cache.refreshInBackground(self.iface, projectId)
+        thread.refreshed.connect(self.handleCatalogRefreshed)
+      return
+
+    # Rows are added as each page of the listing arrives. self.maps grows with
+    # them so that a search typed in the meantime sees the maps loaded so far.
+    statsBefore = metrics.snapshot()
     api = gme_api.GoogleMapsEngineAPI(self.iface)
     token = oauth2_utils.getToken()
-    self.maps = api.getMapsByProjectId(projectId, token)
+    self.maps = []
+    self.searchIndex = search_index.MapSearchIndex()
     self.populateTable(self.maps)
+    complete = True
+    for page in api.iterMapPagesByProjectId(projectId, token):
+      if page is None:
+        complete = False
+        break
+      if projectId != self.currentProjectId:
+        # Another project was chosen while this one was loading.
+        return
+      self.maps.extend(page)
+      self.searchIndex.add(page)
+      self.appendRows(page)
+      if unicode(self.lineEdit.text()):
+        self.searchLocalDirectory()
+      else:
+        self.resultLabel.setText('Loading maps from %s: %d so far' % (
+            self.describeAccount(projectId), len(self.maps)))
+      QCoreApplication.processEvents()
+    QgsMessageLog.logMessage(
+        'Fetched maps for project %s: %s' % (
+            projectId, http_pool.describeStats(statsBefore)),
+        'GMEConnector', QgsMessageLog.INFO)
+    if complete:
+      catalog_cache.store(projectId, self.maps)
     if not self.maps:
-      labelText = 'No maps found from account %s' % self.projectDict[projectId]
-    else:
-      labelText = 'Displaying %d maps from account %s' % (
-          len(self.maps), self.projectDict[projectId])
-    self.resultLabel.setText(labelText)
+      labelText = 'No maps found from %s' % self.describeAccount(projectId)
+      self.resultLabel.setText(labelText)
+    elif not unicode(self.lineEdit.text()):
+      labelText = 'Displaying %d maps from %s' % (
+          len(self.maps), self.describeAccount(projectId))
+      self.resultLabel.setText(labelText)
+
+  def loadMapsForAllProjects(self):
+    """Loads the maps of every project into a single list.
+
+    Cached listings that are still fresh are shown immediately. The other
+    listings are fetched concurrently, and the maps of each project are added
+    to the table as soon as its listing is complete.
+    """
+    self.comboBox.setCurrentIndex(self.comboBox.findData(ALL_PROJECTS))
+    self.currentProjectId = ALL_PROJECTS
+    self.searchGeneration += 1
+    self.showProjectColumn(True)
+    self.maps = []
+    self.searchIndex = search_index.MapSearchIndex()
+    self.populateTable(self.maps)
+
+    projectIds = []
+    for projectId in self.projectDict:
+      cachedMaps, fetchedAt = catalog_cache.load(projectId)
+      if (cachedMaps is not None and
+          time.time() - fetchedAt <= catalog_cache.refreshAfter()):
+        self.addProjectMaps(cachedMaps)
+      else:
+        projectIds.append(projectId)
+    self.searchLocalDirectory()
+    if not projectIds:
+      return
+
+    statsBefore = metrics.snapshot()
+    api = gme_api.GoogleMapsEngineAPI(self.iface)
+    token = oauth2_utils.getToken()
+    maxWorkers = settings.read('gmeconnector/PROJECT_FETCH_WORKERS',
+                               object_type=int)
+    if not maxWorkers:
+      maxWorkers = DEFAULT_PROJECT_FETCH_WORKERS
+
+    def fetchProject(projectId):
+      # An exception would end the iteration and drop the other projects.
+      try:
+        maps = api.getMapsByProjectId(projectId, token)
+      except Exception as e:
+        QgsMessageLog.logMessage(
+            'Error while fetching the maps of %s: %s' % (
+                self.projectDict[projectId], e),
+            'GMEConnector', QgsMessageLog.CRITICAL)
+        maps = None
+      if maps is not None:
+        catalog_cache.store(projectId, maps)
+      return projectId, maps
+
+    done = 0
+    failed = []
+    for projectId, maps in workers.iterConcurrently(
+        fetchProject, projectIds, maxWorkers,
+        waitCallback=QCoreApplication.processEvents):
+      if self.currentProjectId != ALL_PROJECTS:
+        # Another project was chosen while the listings were loading.
+        return
+      done += 1
+      if maps is None:
+        failed.append(self.projectDict[projectId])
+      else:
+        self.addProjectMaps(maps)
+      if unicode(self.lineEdit.text()):
+        self.searchLocalDirectory()
+      else:
+        self.resultLabel.setText(
+            'Loading maps from all accounts: %d of %d accounts, %d maps' % (
+                done, len(projectIds), len(self.maps)))
+    QgsMessageLog.logMessage(
+        'Fetched maps for %d projects: %s' % (
+            len(projectIds), http_pool.describeStats(statsBefore)),
+        'GMEConnector', QgsMessageLog.INFO)
+    if failed:
+      api.reportError('Could not load the maps of %s.' % ', '.join(
+          sorted(failed)))
+    self.searchLocalDirectory()
+
+  def addProjectMaps(self, maps):
+    """Adds the maps of one project to the list, index and table.
+
+    Args:
+      maps: list, of gme_map.Map objects.
+    """
+    self.maps.extend(maps)
+    self.searchIndex.add(maps)
+    self.appendRows(maps)
+
+  def handleCatalogRefreshed(self, projectId, maps):
+    """Applies a refreshed listing to the table.
+
+    Only the differences to the listing on display are applied to the model,
+    so the selection and scroll position are kept.
+
+    Args:
+      projectId: str, id of the project that was refreshed.
+      maps: list, of gme_map.Map objects, or None if the refresh failed.
+    """
+    projectId = unicode(projectId)
+    if maps is None or projectId != self.currentProjectId:
+      return
+    added, removed, renamed = catalog_cache.diff(self.maps, maps)
+    if not (added or removed or renamed):
+      return
+    self.maps = maps
+    self.searchIndex = search_index.MapSearchIndex(self.maps)
+    self.mapModel.removeMaps(removed)
+    self.mapModel.replaceMaps(
+        dict((x.id, x) for x in maps if x.id in renamed))
+    self.mapModel.appendMaps(added)
+    # The differences may change which maps match, search again.
+    self.searchLocalDirectory()
 
   def handleSelectionChanged(self):
     """Enables the OK button when a row is selected."""
-    selection = self.tableWidget.selectionModel()
+    selection = self.tableView.selectionModel()
     selectionList = selection.selectedRows()
     if selectionList:
       self.copyButton.setEnabled(True)
@@ -189,15 +452,10 @@ class Dialog(QDialog, Ui_Dialog):
 
   def copyToClipBoard(self):
     """Copies the selection to clipboard."""
-    selection = self.tableWidget.selectionModel()
-    selectionList = selection.selectedRows()
     copyText = cStringIO.StringIO()
     csvWriter = UnicodeWriter(copyText)
-    for selection in selectionList:
-      row = selection.row()
-      mapId = self.tableWidget.item(row, 0).text()
-      mapName = self.tableWidget.item(row, 1).text()
-      csvWriter.writerow([unicode(mapId), unicode(mapName)])
+    for gmeMap in self.selectedMaps():
+      csvWriter.writerow([unicode(gmeMap.id), unicode(gmeMap.name)])
     clipboard = QApplication.clipboard()
     clipboard.setText(copyText.getvalue())
 
@@ -212,11 +470,9 @@ class Dialog(QDialog, Ui_Dialog):
     self.close()
 
     # Get the map identifier
-    selection = self.tableWidget.selectionModel()
-    selectionList = selection.selectedRows()
-    row = selectionList[0].row()
-    selectedMapId = self.tableWidget.item(row, 0).text()
-    selectedMapName = self.tableWidget.item(row, 1).text()
+    selectedMap = self.selectedMaps()[0]
+    selectedMapId = selectedMap.id
+    selectedMapName = selectedMap.name
 
     dislayText = ('Fetching map and layer extents: %s. '
                   'Please wait...') % selectedMapName
@@ -224,10 +480,15 @@ class Dialog(QDialog, Ui_Dialog):
         'Google Maps Engine Connector', dislayText, level=QgsMessageBar.INFO)
     QCoreApplication.processEvents()
 
+    statsBefore = metrics.snapshot()
     api = gme_api.GoogleMapsEngineAPI(self.iface)
     token = oauth2_utils.getToken()
     gmeMap = api.getMapById(selectedMapId, token)
     gmeLayers = self.getLayers(gmeMap)
+    QgsMessageLog.logMessage(
+        'Fetched extents for map %s: %s' % (
+            selectedMapId, http_pool.describeStats(statsBefore)),
+        'GMEConnector', QgsMessageLog.INFO)
     self.iface.messageBar().clearWidgets()
     self.iface.messageBar().pushMessage(
         'Google Maps Engine Connector',
@@ -327,30 +588,67 @@ class Dialog(QDialog, Ui_Dialog):
     Returns:
       list of gme_layer.Layer objects
     """
-    gmeLayers = []
-    layers = [x for x in gmeMap.contents if x.type == 'layer']
-    for layer in layers:
-      gmeLayer = self.fetchFullLayer(layer)
-      if gmeLayer:
-        gmeLayers.append(gmeLayer)
-
-    folders = [x for x in gmeMap.contents if x.type == 'folder']
+    return self.fetchFullLayers(self.getLayerItems(gmeMap.contents))
+
+  def getLayerItems(self, contents):
+    """Collects the layer items from a content tree.
+
+    Layers at the current level come first, followed by the layers of each
+    folder in turn.
+
+    Args:
+      contents: list, of gme_item.Item objects.
+    Returns:
+      list of gme_item.Item objects of type layer.
+    """
+    layers = [x for x in contents if x.type == 'layer']
+    # Recursive call to collect layers within the folders at this level
+    folders = [x for x in contents if x.type == 'folder']
     for folder in folders:
-      childLayers = self.fetchLayersInFolder(folder)
-      gmeLayers.extend(childLayers)
-    return gmeLayers
+      layers.extend(self.getLayerItems(folder.contents))
+    return layers
+
+  def fetchFullLayers(self, layers):
+    """Fetch full layer information for several layers concurrently.
 
-  def fetchFullLayer(self, layer):
+    The number of simultaneous requests is read from the
+    gmeconnector/FETCH_WORKERS setting.
+
+    Args:
+      layers: list, of gme_item.Item objects
+    Returns:
+      list of gme_layer.Layer objects, in the same order as layers.
+    """
+    api = gme_api.GoogleMapsEngineAPI(self.iface)
+    token = oauth2_utils.getToken()
+    maxWorkers = settings.read('gmeconnector/FETCH_WORKERS', object_type=int)
+    if not maxWorkers:
+      maxWorkers = DEFAULT_FETCH_WORKERS
+    return workers.mapConcurrently(
+        lambda layer: self.fetchFullLayer(layer, api, token), layers,
+        maxWorkers, waitCallback=QCoreApplication.processEvents)
+
+  def fetchFullLayer(self, layer, api=None, token=None):
     """Fetch full layer information.
 
     Args:
       layer: gme_item.Item object
+      api: gme_api.GoogleMapsEngineAPI object to use.
+      token: OAuth2Token object, authentication token.
     Returns:
       gme_layer.Layer object if successful, same object if failed.
     """
-    api = gme_api.GoogleMapsEngineAPI(self.iface)
-    token = oauth2_utils.getToken()
-    gmeLayer = api.getLayerById(layer.id, token)
+    if not api:
+      api = gme_api.GoogleMapsEngineAPI(self.iface)
+    if not token:
+      token = oauth2_utils.getToken()
+    try:
+      gmeLayer = api.getLayerById(layer.id, token)
+    except Exception as e:
+      errorMsg = 'Error while fetching layer %s: %s' % (layer.id, e)
+      QgsMessageLog.logMessage(errorMsg, 'GMEConnector',
+                               QgsMessageLog.WARNING)
+      gmeLayer = None
     if not gmeLayer:
       return layer
     else:
@@ -364,17 +662,7 @@ class Dialog(QDialog, Ui_Dialog):
     Returns:
       list of gme_layer.Layer objects
     """
-    gmeLayers = []
-    layers = [x for x in gmeFolder.contents if x.type == 'layer']
-    for layer in layers:
-      gmeLayer = self.fetchFullLayer(layer)
-      gmeLayers.append(gmeLayer)
-    # Recursive call to populate folders within the current folder
-    folders = [x for x in gmeFolder.contents if x.type == 'folder']
-    if folders:
-      for folder in folders:
-        gmeLayers.extend(self.fetchLayersInFolder(folder))
-    return gmeLayers
+    return self.fetchFullLayers(self.getLayerItems(gmeFolder.contents))
 
   def getGeomFromBbox(self, bbox):
     """Creates a QgsGeometry object from the given bbox.
@@ -393,6 +681,48 @@ class Dialog(QDialog, Ui_Dialog):
     return geom
 
 
+# SearchThread instances currently running. Keeps the threads alive until
+# they finish, even if the dialog is closed.
+_searchThreads = set()
+
+
+def _forgetSearchThread(thread):
+  """Drops a finished search thread from _searchThreads."""
+  # finished may arrive before run() has returned. The thread must not be
+  # destroyed while it is still running.
+  thread.wait()
+  _searchThreads.discard(thread)
+
+
+class SearchThread(QThread):
+  """Searches a MapSearchIndex outside the GUI thread.
+
+  Signals:
+    searched(int, str, object): emitted with the generation, the search term
+        and the list of matching gme_map.Map objects.
+  """
+  searched = pyqtSignal(int, str, object)
+
+  def __init__(self, generation, index, searchTerm):
+    """Class constructor.
+
+    Args:
+      generation: int, generation of the search in the dialog.
+      index: search_index.MapSearchIndex instance to search.
+      searchTerm: str, term to search for.
+    """
+    QThread.__init__(self)
+    self.generation = generation
+    self.index = index
+    self.searchTerm = searchTerm
+
+  def run(self):
+    """Runs the search and emits the result."""
+    with metrics.timed('search.filter'):
+      maps = self.index.search(self.searchTerm)
+    self.searched.emit(self.generation, self.searchTerm, maps)
+
+
 # Drop-in code from pydoc example.
 class UnicodeWriter:
 
@@ -0,0 +1,131 @@
+"""In-memory index for searching the maps of a project as the user types.
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import threading
+
+# Length of the substrings used as index keys.
+GRAM_SIZE = 3
+
+
+def grams(text):
+  """Returns the set of GRAM_SIZE long substrings of the given text."""
+  return set(text[i:i + GRAM_SIZE]
+             for i in range(len(text) - GRAM_SIZE + 1))
+
+
+class MapSearchIndex(object):
+  """Trigram index over the names of maps, with exact lookup by map id.
+
+  A map matches a search term if its id equals the term or its name contains
+  the term, ignoring case in both cases. The index may be searched from a
+  background thread while pages are still being added to it.
+  """
+
+  def __init__(self, maps=None):
+    """Class constructor.
+
+    Args:
+      maps: list, of gme_map.Map objects to index.
+    """
+    self._lock = threading.Lock()
+    self.maps = []
+    # Lower-cased names, by position in self.maps.
+    self._names = []
+    # Lower-cased map id -> list of positions.
+    self._ids = {}
+    # Trigram -> set of positions of the maps whose name contains it.
+    self._postings = {}
+    # Term of the previous search and the positions whose names matched it.
+    self._lastTerm = None
+    self._lastNameMatches = None
+    if maps:
+      self.add(maps)
+
+  def __len__(self):
+    with self._lock:
+      return len(self.maps)
+
+  def add(self, maps):
+    """Adds maps to the index, e.g. as the pages of a listing arrive.
+
+    Args:
+      maps: list, of gme_map.Map objects.
+    """
+    with self._lock:
+      for gmeMap in maps:
+        position = len(self.maps)
+        name = (gmeMap.name or '').lower()
+        self.maps.append(gmeMap)
+        self._names.append(name)
+        self._ids.setdefault((gmeMap.id or '').lower(), []).append(position)
+        for gram in grams(name):
+          self._postings.setdefault(gram, set()).add(position)
+      self._lastTerm = None
+      self._lastNameMatches = None
+
+  def search(self, term):
+    """Returns the maps matching the given search term.
+
+    If the term contains the term of the previous search, only the maps that
+    matched the previous search are considered.
+
+    Args:
+      term: str, search term.
+    Returns:
+      list of gme_map.Map objects, in the order they were added.
+    """
+    term = term.lower()
+    with self._lock:
+      if not term:
+        return list(self.maps)
+
+      if self._lastTerm is not None and self._lastTerm in term:
+        candidates = self._lastNameMatches
+      elif len(term) >= GRAM_SIZE:
+        candidates = self._lookupGrams(term)
+      else:
+        candidates = xrange(len(self.maps))
+      # Posting lists only show that every trigram occurs somewhere in the name,
+      # so the candidates are checked against the whole term.
+      nameMatches = sorted(x for x in candidates if term in self._names[x])
+      self._lastTerm = term
+      self._lastNameMatches = nameMatches
+
+      positions = set(nameMatches)
+      positions.update(self._ids.get(term, ()))
+      return [self.maps[x] for x in sorted(positions)]
+
+  def _lookupGrams(self, term):
+    """Returns the positions whose names contain every trigram of the term.
+
+    Must be called with _lock held.
+    """
+    postings = []
+    for gram in grams(term):
+      posting = self._postings.get(gram)
+      if not posting:
+        return []
+      postings.append(posting)
+    # Intersecting the shortest lists first keeps the intermediate sets small.
+    postings.sort(key=len)
+    result = set(postings[0])
+    for posting in postings[1:]:
+      result.intersection_update(posting)
+      if not result:
+        break
+    return result
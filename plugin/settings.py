@@ -16,7 +16,9 @@ You should have received a copy of the GNU General Public License
 along with this program; if not, write to the Free Software
 Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
+import os
 from PyQt4.QtCore import QSettings
+from qgis.core import QgsApplication
 
 
 def read(key, object_type=str):
@@ -53,3 +55,23 @@ def clear():
   s.remove('gmeconnector/REFRESH_TOKEN')
   s.remove('gmeconnector/EXPIRES_AT')
   s.remove('gmeconnector/PROJECTS')
+
+
+def dataDir():
+  """Returns the directory where the plugin keeps its local data.
+
+  The directory is created inside the QGIS profile if it does not exist.
+
+  Returns:
+    str, path of the directory.
+  """
+  path = os.path.join(
+      unicode(QgsApplication.qgisSettingsDirPath()), 'gmeconnector')
+  if not os.path.isdir(path):
+    try:
+      os.makedirs(path)
+    except OSError:
+      # Another thread may have created it in the meantime.
+      if not os.path.isdir(path):
+        raise
+  return path
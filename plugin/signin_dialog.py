@@ -16,21 +16,75 @@ You should have received a copy of the GNU General Public License
 along with this program; if not, write to the Free Software
 Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
+import time
 from PyQt4.QtCore import pyqtSignal
+from PyQt4.QtCore import QThread
 from PyQt4.QtCore import QUrl
 from PyQt4.QtGui import QDialog
 from PyQt4.QtNetwork import QNetworkCookieJar
 from qgis.gui import QgsMessageBar
 
 import gme_api
+import metrics
 import oauth2_utils
 import settings
 from signin_dialog_base import Ui_Dialog
 
+# Milliseconds to wait for user name lookups when the plugin is unloaded.
+STOP_TIMEOUT_MS = 3000
+
+
+class UserNameThread(QThread):
+  """Looks up the name of the signed-in user in the background.
+
+  Signals:
+    fetched(str): emitted with the user name, empty if it is not known.
+  """
+  fetched = pyqtSignal(str)
+
+  def __init__(self, token):
+    """Class constructor.
+
+    Args:
+      token: OAuth2Token instance.
+    """
+    QThread.__init__(self)
+    self.token = token
+    self.userName = None
+
+  def run(self):
+    """Queries the user profile."""
+    try:
+      self.userName = oauth2_utils.getUserName(self.token)
+    except Exception:
+      self.userName = ''
+    self.fetched.emit(self.userName)
+
+
+# UserNameThread instances still running. Keeps a thread alive after a newer
+# sign-in replaced it in the dialog.
+_userNameThreads = set()
+
+
+def _forgetUserNameThread(thread):
+  """Drops a finished thread from _userNameThreads."""
+  # finished may arrive before run() has returned. The thread must not be
+  # destroyed while it is still running.
+  thread.wait()
+  _userNameThreads.discard(thread)
+
 
 class Dialog(QDialog, Ui_Dialog):
-  """Dialog implementation class for the Sign-in dialog."""
+  """Dialog implementation class for the Sign-in dialog.
+
+  Signals:
+    authStateChange(bool, object, str): emitted when sign-in succeeds or
+        fails, with the token and the user name if it is already known.
+    userNameChanged(str): emitted when the user name becomes known after a
+        successful authStateChange.
+  """
   authStateChange = pyqtSignal(bool, object, str)
+  userNameChanged = pyqtSignal(str)
 
   def __init__(self, iface):
     """Constructor for the dialog.
@@ -42,6 +96,9 @@ class Dialog(QDialog, Ui_Dialog):
     self.setupUi(self)
     self.iface = iface
     self.webView.loadFinished.connect(self.webBrowserNavigated)
+    self.userNameThread = None
+    # Whether a user name arriving after the sign-in should be reported.
+    self.userNamePending = False
 
   def setInitialUrl(self):
     """Set the url to go to when the dialog is loaded.
@@ -76,9 +133,22 @@ class Dialog(QDialog, Ui_Dialog):
       return
 
     oauth2_utils.setToken(token)
+    # The user name is only needed for display, so it is looked up while the
+    # projects are fetched and reported whenever it arrives.
+    bootstrapStart = time.time()
+    userNameThread = UserNameThread(token)
+    userNameThread.fetched.connect(self.handleUserNameFetched)
+    userNameThread.finished.connect(
+        lambda: _forgetUserNameThread(userNameThread))
+    _userNameThreads.add(userNameThread)
+    self.userNameThread = userNameThread
+    self.userNamePending = False
+    userNameThread.start()
     api = gme_api.GoogleMapsEngineAPI(self.iface)
-    userName = oauth2_utils.getUserName(token)
     results = api.getProjects(token)
+    metrics.recordTime('signin.projects', time.time() - bootstrapStart)
+    # The name is passed along with the sign-in result if it already arrived.
+    userName = userNameThread.userName or ''
     if not results:
       self.authStateChange.emit(False, token, userName)
       return
@@ -92,8 +162,33 @@ class Dialog(QDialog, Ui_Dialog):
           level=QgsMessageBar.INFO, duration=6)
       return
 
-    self.authStateChange.emit(True, token, userName)
     projectDict = {}
     for project in results['projects']:
       projectDict[project['id']] = project['name']
+    # Store the projects before announcing the sign-in, since the tools
+    # enabled in response read them.
     settings.write('gmeconnector/PROJECTS', projectDict)
+    self.userNamePending = not userName
+    self.authStateChange.emit(True, token, userName)
+
+  def handleUserNameFetched(self, userName):
+    """Reports a user name that arrived after the sign-in completed.
+
+    Args:
+      userName: str, name of the user, empty if it could not be fetched.
+    """
+    if self.sender() is not self.userNameThread or not self.userNamePending:
+      return
+    self.userNamePending = False
+    if userName:
+      self.userNameChanged.emit(userName)
+
+  def stop(self):
+    """Stops reporting the user name, e.g. when the plugin is unloaded.
+
+    Waits up to STOP_TIMEOUT_MS in total for the lookups in progress.
+    """
+    self.userNamePending = False
+    deadline = time.time() + STOP_TIMEOUT_MS / 1000.0
+    for thread in list(_userNameThreads):
+      thread.wait(int(max(0, deadline - time.time()) * 1000))
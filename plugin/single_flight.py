@@ -0,0 +1,85 @@
+"""Shares one call between concurrent callers asking for the same thing.
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import threading
+import metrics
+
+# Seconds between calls to the wait callback while waiting for a call.
+WAIT_INTERVAL = 0.05
+
+
+class _Flight(object):
+  """A call in progress and its result."""
+
+  def __init__(self):
+    self.thread = threading.current_thread()
+    self.done = threading.Event()
+    self.result = None
+
+
+_lock = threading.Lock()
+# Key -> _Flight in progress.
+_flights = {}
+
+
+def call(key, func, waitCallback=None):
+  """Calls func, unless a call with the same key is already in progress.
+
+  Callers arriving while the call is in progress wait for it and get the same
+  result. Results are not kept once the call is over.
+
+  Args:
+    key: hashable, identifies what func computes, e.g. a request url.
+    func: callable taking no arguments.
+    waitCallback: callable, called periodically while waiting for another
+        caller's call, e.g. QCoreApplication.processEvents to keep the GUI
+        responsive.
+  Returns:
+    the return value of func.
+  """
+  with _lock:
+    flight = _flights.get(key)
+    if flight is None:
+      flight = _Flight()
+      _flights[key] = flight
+      leader = True
+    elif flight.thread is threading.current_thread():
+      # Reentered from the event loop run by the waiting caller, which can not
+      # finish before this call returns.
+      leader = None
+    else:
+      leader = False
+
+  if leader is None:
+    return func()
+  if leader:
+    try:
+      flight.result = func()
+    finally:
+      with _lock:
+        del _flights[key]
+      flight.done.set()
+    return flight.result
+
+  metrics.increment('singleflight.shared')
+  if waitCallback:
+    while not flight.done.wait(WAIT_INTERVAL):
+      waitCallback()
+  else:
+    flight.done.wait()
+  return flight.result
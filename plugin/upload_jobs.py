@@ -0,0 +1,662 @@
+"""Background jobs that export layers and upload them to Google Maps Engine.
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import itertools
+import os
+import threading
+import time
+import webbrowser
+from PyQt4.QtCore import pyqtSignal
+from PyQt4.QtCore import QObject
+from PyQt4.QtCore import QThread
+from qgis.core import QgsCoordinateReferenceSystem
+from qgis.core import QgsCoordinateTransform
+from qgis.core import QgsMapLayer
+from qgis.core import QgsMessageLog
+from qgis.core import QgsRasterFileWriter
+from qgis.core import QgsRasterLayer
+from qgis.core import QgsRasterPipe
+from qgis.core import QgsVectorFileWriter
+from qgis.core import QgsVectorLayer
+from qgis.gui import QgsMessageBar
+import gme_api
+import oauth2_utils
+import settings
+import upload_session
+import workers
+
+# Number of layers uploaded at the same time.
+DEFAULT_MAX_JOBS = 2
+# Number of files of an asset uploaded at the same time.
+DEFAULT_UPLOAD_WORKERS = 4
+# Milliseconds cancelAll waits for the running jobs to stop.
+CANCEL_TIMEOUT_MS = 3000
+
+QUEUED = 'Queued'
+EXTRACTING = 'Extracting'
+UPLOADING = 'Uploading'
+DONE = 'Done'
+FAILED = 'Failed'
+CANCELLED = 'Cancelled'
+
+_jobIds = itertools.count(1)
+
+
+class UploadJob(object):
+  """Parameters and progress of the upload of a single layer."""
+
+  def __init__(self, layerName, layerType, source=None, providerType=None,
+               subsetString=None, data=None, dataType=None):
+    """Class constructor.
+
+    Args:
+      layerName: str, name of the layer, also used for the extracted files.
+      layerType: int, QgsMapLayer.VectorLayer or QgsMapLayer.RasterLayer.
+      source: str, data source of the layer, None if the job was extracted
+          from the layer object and can not be extracted again.
+      providerType: str, data provider key of the layer.
+      subsetString: str, filter applied to a vector layer.
+      data: dict, metadata of the asset to create.
+      dataType: str, either 'tables' or 'rasters'.
+    """
+    self.jobId = next(_jobIds)
+    self.layerName = layerName
+    self.layerType = layerType
+    self.source = source
+    self.providerType = providerType
+    self.subsetString = subsetString
+    self.data = data
+    self.dataType = dataType
+    self.stagingDir = None
+    # File name -> path of the files to upload, set once extracted.
+    self.filesToUpload = None
+    self.completedFiles = set()
+    self.assetId = None
+    self.state = QUEUED
+    self.error = None
+    # File name -> bytes sent, updated from the upload threads.
+    self.sentByFile = {}
+    self.bytesTotal = 0
+    self.uploadStarted = None
+    # File name -> bytes sent when the current attempt started on the file.
+    self.sentAtStart = {}
+    self.cancelEvent = threading.Event()
+
+  def bytesSent(self):
+    """Returns the number of bytes sent for all files."""
+    return sum(self.sentByFile.values())
+
+  def throughput(self):
+    """Returns the upload speed in bytes per second, or None if unknown.
+
+    Only bytes sent by the current attempt count, not those of files
+    completed before a retry or a restart.
+    """
+    if not self.uploadStarted or self.state != UPLOADING:
+      return None
+    elapsed = time.time() - self.uploadStarted
+    if elapsed <= 0:
+      return None
+    sent = sum(self.sentByFile.get(fileName, 0) - start
+               for fileName, start in self.sentAtStart.items())
+    return max(0, sent) / elapsed
+
+  def eta(self):
+    """Returns the estimated seconds left for the upload, or None."""
+    speed = self.throughput()
+    if not speed:
+      return None
+    return (self.bytesTotal - self.bytesSent()) / speed
+
+  def isActive(self):
+    """Returns True if the job is queued or running."""
+    return self.state in (QUEUED, EXTRACTING, UPLOADING)
+
+
+def extractVectorLayer(layer, layerName, tempDir, cancelEvent=None):
+  """Extract the features from a layer to a temporary shapefile.
+
+  Extracts a shapefile that can be uploaded to maps engine. This approach
+  ensures that we are able to upload any layer that QGIS has ability to read,
+  including CSV files, databases etc.
+
+  Args:
+    layer: QgsVectorLayer to extract.
+    layerName: str, name of the layer.
+    tempDir: str, path of directory where to extract the shapefile.
+    cancelEvent: threading.Event, the extraction stops as soon as it is set.
+  Returns:
+    a dictionary with file names as keys and file path as values or None
+    if there is error.
+  """
+  tempShpPath = os.path.join(tempDir, layerName + '.shp')
+  outputCrs = QgsCoordinateReferenceSystem(
+      4326, QgsCoordinateReferenceSystem.EpsgCrsId)
+  # Features are written one at a time, unlike with writeAsVectorFormat, so
+  # that a cancelled job does not have to wait for the whole layer.
+  writer = QgsVectorFileWriter(tempShpPath, 'utf-8', layer.pendingFields(),
+                               layer.wkbType(), outputCrs, 'ESRI Shapefile')
+  error = writer.hasError()
+  if error != QgsVectorFileWriter.NoError:
+    QgsMessageLog.logMessage(
+        'Extraction failed with error %s: %s' % (error, writer.errorMessage()),
+        'GMEConnector', QgsMessageLog.CRITICAL)
+    return
+
+  transform = QgsCoordinateTransform(layer.crs(), outputCrs)
+  try:
+    for feature in layer.getFeatures():
+      if cancelEvent and cancelEvent.is_set():
+        return
+      geometry = feature.geometry()
+      if geometry:
+        geometry.transform(transform)
+      writer.addFeature(feature)
+  finally:
+    # Flushes and closes the files.
+    del writer
+
+  filesToUpload = {}
+  for ext in ('shp', 'shx', 'dbf', 'prj'):
+    fileName = '%s.%s' % (layerName, ext)
+    filePath = os.path.join(tempDir, fileName)
+    filesToUpload[fileName] = filePath
+  return filesToUpload
+
+
+def extractRasterLayer(layer, layerName, tempDir):
+  """Extract the raster from a layer to a temporary GeoTiff file.
+
+  Extracts a geotiff file that can be uploaded to maps engine. This approach
+  ensures that we are able to upload any layer that QGIS has ability to read.
+
+  Args:
+    layer: QgsRasterLayer to extract.
+    layerName: str, name of the layer.
+    tempDir: str, path of directory where to extract the shapefile.
+  Returns:
+    a dictionary with file names as keys and file path as values or None
+    if there is error.
+  """
+  fileName = layerName + '.tif'
+  tempTifPath = os.path.join(tempDir, fileName)
+
+  pipe = QgsRasterPipe()
+  provider = layer.dataProvider()
+  pipe.set(provider.clone())
+
+  rasterWriter = QgsRasterFileWriter(tempTifPath)
+  xSize = provider.xSize()
+  ySize = provider.ySize()
+  if not xSize or not ySize:
+    return
+  error = rasterWriter.writeRaster(
+      pipe, xSize, ySize, provider.extent(), layer.crs())
+  if error != QgsRasterFileWriter.NoError:
+    QgsMessageLog.logMessage('Extraction failed with error %s' % error,
+                             'GMEConnector', QgsMessageLog.CRITICAL)
+    return
+  return {fileName: tempTifPath}
+
+
+def canExtractInBackground(layer):
+  """Returns True if a copy of the layer can be opened outside the GUI thread.
+
+  The copy is opened from the data source, so it only has what the provider
+  has. Memory layers, uncommitted edits, a CRS set by the user, joins and
+  virtual fields only exist inside the layer object itself, so such layers
+  have to be extracted before the job is queued.
+
+  Args:
+    layer: QgsMapLayer
+  """
+  if layer.crs() != layer.dataProvider().crs():
+    return False
+  if layer.type() == QgsMapLayer.RasterLayer:
+    return True
+  if layer.type() != QgsMapLayer.VectorLayer:
+    return False
+  if layer.providerType() == 'memory':
+    return False
+  if layer.isEditable() or layer.isModified():
+    return False
+  if layer.vectorJoins():
+    return False
+  # Joined and virtual fields are not provided by the data source.
+  return layer.pendingFields().count() == layer.dataProvider().fields().count()
+
+
+def createJob(layer, data, dataType):
+  """Creates an upload job for the given layer.
+
+  Layers that can not be opened again from a worker thread are extracted
+  immediately. Such jobs can not be extracted again on retry.
+
+  Args:
+    layer: QgsMapLayer to upload.
+    data: dict, metadata of the asset to create.
+    dataType: str, either 'tables' or 'rasters'.
+  Returns:
+    UploadJob instance, or None if the extraction failed.
+  """
+  if canExtractInBackground(layer):
+    subsetString = None
+    if layer.type() == QgsMapLayer.VectorLayer:
+      subsetString = layer.subsetString()
+    return UploadJob(unicode(layer.name()), layer.type(),
+                     source=unicode(layer.source()),
+                     providerType=unicode(layer.providerType()),
+                     subsetString=subsetString, data=data, dataType=dataType)
+
+  job = UploadJob(unicode(layer.name()), layer.type(), data=data,
+                  dataType=dataType)
+  job.stagingDir = upload_session.stagingDir()
+  if layer.type() == QgsMapLayer.VectorLayer:
+    job.filesToUpload = extractVectorLayer(
+        layer, job.layerName, job.stagingDir)
+  else:
+    job.filesToUpload = extractRasterLayer(
+        layer, job.layerName, job.stagingDir)
+  if not job.filesToUpload:
+    upload_session.removeStagingDir(job.stagingDir)
+    return None
+  return job
+
+
+class AnyEvent(object):
+  """Read-only view of several threading.Event objects, set if any is set."""
+
+  def __init__(self, *events):
+    self.events = events
+
+  def is_set(self):
+    return any(x.is_set() for x in self.events)
+
+
+class UploadWorker(QThread):
+  """Thread that runs the extraction and upload of one job."""
+  progress = pyqtSignal(int)
+
+  def __init__(self, job, iface):
+    """Class constructor.
+
+    Args:
+      job: UploadJob to run.
+      iface: QgsInterface instance, passed on to GoogleMapsEngineAPI.
+    """
+    QThread.__init__(self)
+    self.job = job
+    self.iface = iface
+
+  def run(self):
+    """Runs the job and records the outcome in its state."""
+    job = self.job
+    try:
+      self.runJob()
+    except Exception as e:
+      job.error = str(e)
+      job.state = FAILED
+      QgsMessageLog.logMessage(
+          'Upload of %s failed: %s' % (job.layerName, e), 'GMEConnector',
+          QgsMessageLog.CRITICAL)
+    if job.state != DONE and job.cancelEvent.is_set():
+      job.state = CANCELLED
+    self.progress.emit(job.jobId)
+
+  def runJob(self):
+    """Extracts the layer if needed, creates the asset and uploads files."""
+    job = self.job
+    if not job.filesToUpload:
+      job.state = EXTRACTING
+      self.progress.emit(job.jobId)
+      if job.stagingDir:
+        # Left over from an earlier attempt.
+        upload_session.removeStagingDir(job.stagingDir)
+      job.stagingDir = upload_session.stagingDir()
+      job.filesToUpload = self.extract()
+      if not job.filesToUpload:
+        job.error = 'Extraction failed.'
+        job.state = FAILED
+        return
+    if job.cancelEvent.is_set():
+      return
+
+    token = oauth2_utils.getToken()
+    api = gme_api.GoogleMapsEngineAPI(self.iface)
+    if not job.assetId:
+      job.data['files'] = [{'filename': x} for x in job.filesToUpload]
+      job.assetId = api.postCreateAsset(job.dataType, job.data, token)
+      if not job.assetId:
+        job.error = 'Asset creation failed.'
+        job.state = FAILED
+        return
+      QgsMessageLog.logMessage(
+          'Asset creation successful. Asset ID: %s' % job.assetId,
+          'GMEConnector', QgsMessageLog.INFO)
+      # Files that never got an upload session must be found after a restart.
+      upload_session.saveJob(job.assetId, job.dataType, job.layerName,
+                             job.filesToUpload)
+
+    job.state = UPLOADING
+    job.bytesTotal = sum(
+        os.path.getsize(x) for x in job.filesToUpload.itervalues())
+    for fileName in job.completedFiles:
+      job.sentByFile[fileName] = os.path.getsize(job.filesToUpload[fileName])
+    job.sentAtStart = {}
+    job.uploadStarted = time.time()
+    self.progress.emit(job.jobId)
+
+    if self.uploadFiles(api, token):
+      upload_session.removeJob(job.assetId)
+      job.state = DONE
+    elif not job.cancelEvent.is_set():
+      job.error = 'Upload failed.'
+      job.state = FAILED
+
+  def extract(self):
+    """Extracts a private copy of the job's layer to its staging directory.
+
+    Returns:
+      dict of file names to paths, or None if the extraction failed.
+    """
+    job = self.job
+    if job.layerType == QgsMapLayer.VectorLayer:
+      layer = QgsVectorLayer(job.source, job.layerName, job.providerType)
+      if job.subsetString:
+        layer.setSubsetString(job.subsetString)
+      if layer.isValid():
+        return extractVectorLayer(layer, job.layerName, job.stagingDir,
+                                  job.cancelEvent)
+    else:
+      layer = QgsRasterLayer(job.source, job.layerName, job.providerType)
+      if layer.isValid():
+        return extractRasterLayer(layer, job.layerName, job.stagingDir)
+    return None
+
+  def uploadFiles(self, api, token):
+    """Uploads the remaining files of the job concurrently.
+
+    The number of simultaneous uploads is read from the
+    gmeconnector/UPLOAD_WORKERS setting. If one file fails, the uploads of the
+    other files are cancelled.
+
+    Args:
+      api: gme_api.GoogleMapsEngineAPI instance.
+      token: OAuth2Token object, authentication token.
+    Returns:
+      True if all files were uploaded.
+    """
+    job = self.job
+    maxWorkers = settings.read('gmeconnector/UPLOAD_WORKERS', object_type=int)
+    if not maxWorkers:
+      maxWorkers = DEFAULT_UPLOAD_WORKERS
+    # Cancels the other files of this attempt when one of them fails.
+    failedEvent = threading.Event()
+    stopEvent = AnyEvent(job.cancelEvent, failedEvent)
+
+    def uploadFile(fileName):
+      def progress(sent, unused_total):
+        # The first call reports where a resumed upload continues from.
+        job.sentAtStart.setdefault(fileName, sent)
+        job.sentByFile[fileName] = sent
+      try:
+        response = api.postUploadFile(
+            job.assetId, job.dataType, fileName, job.filesToUpload[fileName],
+            token, progressCallback=progress, cancelEvent=stopEvent)
+      except Exception as e:
+        QgsMessageLog.logMessage(
+            'Error while uploading %s: %s' % (fileName, e), 'GMEConnector',
+            QgsMessageLog.CRITICAL)
+        response = None
+      if response:
+        job.completedFiles.add(fileName)
+        upload_session.markFileDone(job.assetId, fileName)
+      else:
+        failedEvent.set()
+      return response
+
+    def waitCallback():
+      self.progress.emit(job.jobId)
+
+    remaining = [x for x in job.filesToUpload if x not in job.completedFiles]
+    results = workers.mapConcurrently(uploadFile, remaining, maxWorkers,
+                                      waitCallback=waitCallback)
+    return all(results)
+
+
+# Workers that did not stop within CANCEL_TIMEOUT_MS. A QThread must not be
+# destroyed while it is running, so they are referenced until they finish.
+_stoppingWorkers = set()
+
+
+def _keepUntilFinished(worker):
+  """Keeps a reference to a worker until its thread has finished."""
+  _stoppingWorkers.add(worker)
+
+  def forget():
+    worker.wait()
+    _stoppingWorkers.discard(worker)
+  worker.finished.connect(forget)
+  if worker.isFinished():
+    _stoppingWorkers.discard(worker)
+
+
+class UploadJobManager(QObject):
+  """Queue of upload jobs, run in background threads.
+
+  Signals:
+    jobChanged(int): the state or progress of the job with the id changed.
+  """
+  jobChanged = pyqtSignal(int)
+
+  def __init__(self, iface):
+    """Class constructor.
+
+    Args:
+      iface: QgsInterface instance.
+    """
+    QObject.__init__(self)
+    self.iface = iface
+    self.jobs = []
+    # Job id -> UploadWorker running it.
+    self.running = {}
+
+  def maxJobs(self):
+    """Returns the number of jobs allowed to run at the same time."""
+    maxJobs = settings.read('gmeconnector/MAX_UPLOAD_JOBS', object_type=int)
+    return maxJobs or DEFAULT_MAX_JOBS
+
+  def job(self, jobId):
+    """Returns the job with the given id, or None."""
+    for job in self.jobs:
+      if job.jobId == jobId:
+        return job
+    return None
+
+  def submit(self, job):
+    """Adds a job to the queue.
+
+    Args:
+      job: UploadJob instance.
+    """
+    self.jobs.append(job)
+    self.jobChanged.emit(job.jobId)
+    self.startQueuedJobs()
+
+  def cancel(self, jobId):
+    """Cancels a queued or running job.
+
+    A running job stops at its next chunk. Its upload sessions are kept so
+    that it can be retried later.
+
+    Args:
+      jobId: int, id of the job.
+    """
+    job = self.job(jobId)
+    if not job or not job.isActive():
+      return
+    job.cancelEvent.set()
+    if job.state == QUEUED:
+      job.state = CANCELLED
+      self.jobChanged.emit(jobId)
+
+  def retry(self, jobId):
+    """Queues a failed or cancelled job again.
+
+    Files that were already uploaded are skipped, and partially uploaded
+    files continue from where they stopped.
+
+    Args:
+      jobId: int, id of the job.
+    """
+    job = self.job(jobId)
+    if not job or job.state not in (FAILED, CANCELLED):
+      return
+    job.cancelEvent = threading.Event()
+    job.error = None
+    job.state = QUEUED
+    if job.filesToUpload and not all(
+        os.path.exists(x) for x in job.filesToUpload.itervalues()):
+      if not job.source:
+        job.error = 'The extracted files are no longer available.'
+        job.state = FAILED
+        self.jobChanged.emit(jobId)
+        return
+      job.filesToUpload = None
+    self.jobChanged.emit(jobId)
+    self.startQueuedJobs()
+
+  def cancelAll(self):
+    """Cancels every job and waits a limited time for the running ones.
+
+    Workers still busy after CANCEL_TIMEOUT_MS, e.g. writing a raster, are
+    left to stop in the background.
+    """
+    for job in self.jobs:
+      self.cancel(job.jobId)
+    deadline = time.time() + CANCEL_TIMEOUT_MS / 1000.0
+    for jobId, worker in self.running.items():
+      remaining = int(max(0, deadline - time.time()) * 1000)
+      if not worker.wait(remaining):
+        QgsMessageLog.logMessage(
+            'Upload of %s is still stopping.' % self.job(jobId).layerName,
+            'GMEConnector', QgsMessageLog.WARNING)
+        _keepUntilFinished(worker)
+    # Staged files are kept only for uploads that can be resumed.
+    for job in self.jobs:
+      if job.stagingDir and job.jobId not in self.running:
+        upload_session.removeStagingDir(job.stagingDir)
+
+  def startQueuedJobs(self):
+    """Starts queued jobs while fewer than maxJobs() are running."""
+    for job in self.jobs:
+      if len(self.running) >= self.maxJobs():
+        return
+      if job.state != QUEUED or job.jobId in self.running:
+        continue
+      worker = UploadWorker(job, self.iface)
+      worker.progress.connect(self.jobChanged)
+      worker.finished.connect(
+          lambda jobId=job.jobId: self.handleWorkerFinished(jobId))
+      self.running[job.jobId] = worker
+      worker.start(QThread.LowPriority)
+
+  def handleWorkerFinished(self, jobId):
+    """Reports the outcome of a job and starts the next one.
+
+    Args:
+      jobId: int, id of the job that finished.
+    """
+    worker = self.running.pop(jobId, None)
+    if worker:
+      # finished may arrive before run() has returned. The thread must not
+      # be destroyed while it is still running.
+      worker.wait()
+    job = self.job(jobId)
+    if job.state == DONE:
+      upload_session.removeStagingDir(job.stagingDir)
+      msg = 'Uploaded %s. Asset ID: %s' % (job.layerName, job.assetId)
+      self.iface.messageBar().pushMessage(
+          'Google Maps Engine Connector', msg,
+          level=QgsMessageBar.INFO, duration=6)
+      openAssetInBrowser(job.assetId)
+    elif job.state == FAILED:
+      msg = 'Upload of %s failed: %s' % (job.layerName, job.error)
+      self.iface.messageBar().pushMessage(
+          'Google Maps Engine Connector', msg,
+          level=QgsMessageBar.CRITICAL, duration=6)
+    self.jobChanged.emit(jobId)
+    self.startQueuedJobs()
+
+  def resumePendingUploads(self):
+    """Queues jobs for uploads that were interrupted, e.g. by closing QGIS."""
+    resumed = set()
+    for record in upload_session.pendingJobs():
+      if not record['files']:
+        # Nothing to upload or to find the staging directory from.
+        upload_session.removeJob(record['assetId'])
+        continue
+      job = UploadJob(record['layerName'], None, dataType=record['dataType'])
+      job.assetId = record['assetId']
+      job.filesToUpload = record['files']
+      job.completedFiles = set(record['completedFiles'])
+      job.stagingDir = os.path.dirname(record['files'].values()[0])
+      resumed.add(job.assetId)
+      self.submit(job)
+
+    # Sessions saved without the files of their asset.
+    sessionsByAsset = {}
+    for session in upload_session.pending():
+      if session.assetId not in resumed:
+        sessionsByAsset.setdefault(session.assetId, []).append(session)
+    for assetId, sessions in sessionsByAsset.iteritems():
+      job = UploadJob(', '.join(x.fileName for x in sessions), None,
+                      dataType=sessions[0].dataType)
+      job.assetId = assetId
+      job.stagingDir = os.path.dirname(sessions[0].filePath)
+      job.filesToUpload = dict((x.fileName, x.filePath) for x in sessions)
+      self.submit(job)
+
+
+def discardPendingUploads():
+  """Forgets interrupted uploads and deletes their staged files."""
+  stagingDirs = set()
+  for record in upload_session.pendingJobs():
+    upload_session.removeJob(record['assetId'])
+    stagingDirs.update(os.path.dirname(x) for x in record['files'].values())
+  for session in upload_session.pending():
+    upload_session.remove(session.assetId, session.fileName)
+    stagingDirs.add(os.path.dirname(session.filePath))
+  for path in stagingDirs:
+    upload_session.removeStagingDir(path)
+
+
+def openAssetInBrowser(assetId):
+  """Opens the given asset in the Maps Engine UI.
+
+  Args:
+    assetId: str, id of the maps engine asset.
+  """
+  url = ('https://mapsengine.google.com/admin/'
+         '#RepositoryPlace:cid=%s&'
+         'v=DETAIL_INFO&aid=%s')
+  # The assetId returned by the API in a globally unique id of the form
+  # 'project_id-asset_id'. Split the assetId to get the project_id
+  # parameter (cid) in the url.
+  gmeUrl = url % (assetId.split('-')[0], assetId)
+  webbrowser.open(gmeUrl)
@@ -0,0 +1,164 @@
+"""Dock widget listing background upload jobs.
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+from PyQt4.QtCore import Qt
+from PyQt4.QtGui import QAbstractItemView
+from PyQt4.QtGui import QDockWidget
+from PyQt4.QtGui import QHBoxLayout
+from PyQt4.QtGui import QProgressBar
+from PyQt4.QtGui import QPushButton
+from PyQt4.QtGui import QTableWidget
+from PyQt4.QtGui import QTableWidgetItem
+from PyQt4.QtGui import QVBoxLayout
+from PyQt4.QtGui import QWidget
+import upload_jobs
+
+COLUMNS = ('Layer', 'Status', 'Progress', 'Speed', 'Time left')
+
+
+def formatBytes(value):
+  """Formats a number of bytes for display, e.g. '1.5 MB'."""
+  for unit in ('B', 'KB', 'MB'):
+    if value < 1024:
+      return '%.1f %s' % (value, unit)
+    value /= 1024.0
+  return '%.1f GB' % value
+
+
+def formatDuration(seconds):
+  """Formats a duration in seconds for display, e.g. '3m 20s'."""
+  seconds = int(seconds)
+  if seconds < 60:
+    return '%ds' % seconds
+  if seconds < 3600:
+    return '%dm %02ds' % (seconds / 60, seconds % 60)
+  return '%dh %02dm' % (seconds / 3600, seconds % 3600 / 60)
+
+
+class UploadJobsDock(QDockWidget):
+  """Shows the progress of upload jobs and lets the user cancel or retry."""
+
+  def __init__(self, manager, parent=None):
+    """Class constructor.
+
+    Args:
+      manager: upload_jobs.UploadJobManager instance.
+      parent: QWidget, parent widget.
+    """
+    QDockWidget.__init__(self, 'Google Maps Engine Uploads', parent)
+    self.setObjectName('GMEConnectorUploads')
+    self.manager = manager
+    # Job id -> row index
+    self.rows = {}
+
+    self.tableWidget = QTableWidget(0, len(COLUMNS))
+    self.tableWidget.setHorizontalHeaderLabels(COLUMNS)
+    self.tableWidget.setSelectionBehavior(QAbstractItemView.SelectRows)
+    self.tableWidget.setEditTriggers(QAbstractItemView.NoEditTriggers)
+    self.tableWidget.verticalHeader().hide()
+    self.tableWidget.itemSelectionChanged.connect(self.updateButtons)
+
+    self.cancelButton = QPushButton('Cancel')
+    self.cancelButton.clicked.connect(self.cancelSelected)
+    self.retryButton = QPushButton('Retry')
+    self.retryButton.clicked.connect(self.retrySelected)
+    buttonLayout = QHBoxLayout()
+    buttonLayout.addStretch()
+    buttonLayout.addWidget(self.cancelButton)
+    buttonLayout.addWidget(self.retryButton)
+
+    layout = QVBoxLayout()
+    layout.addWidget(self.tableWidget)
+    layout.addLayout(buttonLayout)
+    widget = QWidget()
+    widget.setLayout(layout)
+    self.setWidget(widget)
+
+    self.manager.jobChanged.connect(self.updateJob)
+    for job in self.manager.jobs:
+      self.updateJob(job.jobId)
+    self.updateButtons()
+
+  def updateJob(self, jobId):
+    """Refreshes the row of the given job, adding it if needed.
+
+    Args:
+      jobId: int, id of the job.
+    """
+    job = self.manager.job(jobId)
+    if not job:
+      return
+    if jobId not in self.rows:
+      row = self.tableWidget.rowCount()
+      self.tableWidget.insertRow(row)
+      self.rows[jobId] = row
+      self.tableWidget.setItem(row, 0, QTableWidgetItem(job.layerName))
+      progressBar = QProgressBar()
+      progressBar.setMaximum(100)
+      self.tableWidget.setCellWidget(row, 2, progressBar)
+    row = self.rows[jobId]
+
+    status = job.state
+    if job.error:
+      status = '%s: %s' % (status, job.error)
+    speed = job.throughput()
+    eta = job.eta()
+    self.tableWidget.setItem(row, 1, QTableWidgetItem(status))
+    self.tableWidget.setItem(row, 3, QTableWidgetItem(
+        speed and '%s/s' % formatBytes(speed) or ''))
+    self.tableWidget.setItem(row, 4, QTableWidgetItem(
+        eta is not None and formatDuration(eta) or ''))
+    if job.bytesTotal:
+      self.tableWidget.cellWidget(row, 2).setValue(
+          int(100 * job.bytesSent() / job.bytesTotal))
+    self.updateButtons()
+
+  def selectedJobs(self):
+    """Returns the jobs of the selected rows."""
+    selectedRows = set(
+        x.row() for x in self.tableWidget.selectionModel().selectedRows())
+    return [self.manager.job(jobId) for jobId, row in self.rows.iteritems()
+            if row in selectedRows]
+
+  def updateButtons(self):
+    """Enables the buttons that apply to the selected jobs."""
+    jobs = self.selectedJobs()
+    self.cancelButton.setEnabled(any(x.isActive() for x in jobs))
+    self.retryButton.setEnabled(any(
+        x.state in (upload_jobs.FAILED, upload_jobs.CANCELLED) for x in jobs))
+
+  def cancelSelected(self):
+    """Cancels the selected jobs."""
+    for job in self.selectedJobs():
+      self.manager.cancel(job.jobId)
+
+  def retrySelected(self):
+    """Retries the selected jobs."""
+    for job in self.selectedJobs():
+      self.manager.retry(job.jobId)
+
+  def showAndRaise(self, iface):
+    """Adds the dock to the main window if needed and shows it.
+
+    Args:
+      iface: QgsInterface instance.
+    """
+    if not self.parent():
+      iface.addDockWidget(Qt.BottomDockWidgetArea, self)
+    self.show()
+    self.raise_()
@@ -0,0 +1,273 @@
+"""Persistent state of resumable uploads.
+
+Each file upload to Maps Engine uses a resumable upload session. The session
+url is saved on disk together with the path of the file being uploaded, so
+that an interrupted upload can continue from the last committed byte, even
+after QGIS is restarted. The files of each asset are saved as well, so that
+files whose upload had not started yet are not forgotten.
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from qgis.core import QgsMessageLog
+import settings
+
+SESSIONS_FILE = 'upload_sessions.json'
+JOBS_FILE = 'upload_jobs.json'
+STAGING_DIR = 'uploads'
+# Maps Engine discards upload sessions that have been idle for about a week.
+SESSION_MAX_AGE = 7 * 24 * 3600
+
+_lock = threading.Lock()
+
+
+class UploadSession(object):
+  """State of a single resumable file upload."""
+
+  def __init__(self, assetId=None, dataType=None, fileName=None,
+               filePath=None, sessionUri=None, size=None, mtime=None,
+               created=None, **kwargs):
+    self.assetId = assetId
+    self.dataType = dataType
+    self.fileName = fileName
+    self.filePath = filePath
+    self.sessionUri = sessionUri
+    self.size = size
+    self.mtime = mtime
+    self.created = created
+
+  def key(self):
+    """Returns the key identifying this upload."""
+    return makeKey(self.assetId, self.fileName)
+
+  def matchesFile(self):
+    """Returns True if the file on disk is unchanged since the upload began."""
+    try:
+      stat = os.stat(self.filePath)
+    except OSError:
+      return False
+    return stat.st_size == self.size and int(stat.st_mtime) == self.mtime
+
+
+def makeKey(assetId, fileName):
+  """Returns the key used to store the session of a file upload.
+
+  Args:
+    assetId: str, id of the maps engine asset.
+    fileName: str, name of the uploaded file.
+  Returns:
+    str, session key.
+  """
+  return '%s/%s' % (assetId, fileName)
+
+
+def _load(fileName=SESSIONS_FILE):
+  """Reads all sessions from disk. Must be called with _lock held."""
+  path = os.path.join(settings.dataDir(), fileName)
+  if not os.path.exists(path):
+    return {}
+  try:
+    with open(path, 'rb') as sessionsFile:
+      return json.load(sessionsFile)
+  except (IOError, ValueError) as e:
+    QgsMessageLog.logMessage(
+        'Could not read upload sessions: %s' % e, 'GMEConnector',
+        QgsMessageLog.WARNING)
+    return {}
+
+
+def _store(sessions, fileName=SESSIONS_FILE):
+  """Writes all sessions to disk. Must be called with _lock held."""
+  path = os.path.join(settings.dataDir(), fileName)
+  tempPath = path + '.tmp'
+  with open(tempPath, 'wb') as sessionsFile:
+    json.dump(sessions, sessionsFile)
+  if os.path.exists(path):
+    os.remove(path)
+  os.rename(tempPath, path)
+
+
+def find(assetId, fileName):
+  """Returns the saved session for a file upload, if it is still usable.
+
+  Sessions for files that were modified or that are too old to be resumed are
+  discarded.
+
+  Args:
+    assetId: str, id of the maps engine asset.
+    fileName: str, name of the uploaded file.
+  Returns:
+    UploadSession instance, or None if there is no usable session.
+  """
+  key = makeKey(assetId, fileName)
+  with _lock:
+    sessions = _load()
+    if key not in sessions:
+      return None
+    session = UploadSession(**sessions[key])
+    if (session.matchesFile() and
+        time.time() - (session.created or 0) < SESSION_MAX_AGE):
+      return session
+    del sessions[key]
+    _store(sessions)
+    return None
+
+
+def save(assetId, dataType, fileName, filePath, sessionUri):
+  """Saves the session of a file upload.
+
+  Args:
+    assetId: str, id of the maps engine asset.
+    dataType: str, either 'tables' or 'rasters'.
+    fileName: str, name of the uploaded file.
+    filePath: str, path of the file on disk.
+    sessionUri: str, url of the resumable upload session.
+  Returns:
+    UploadSession instance.
+  """
+  stat = os.stat(filePath)
+  session = UploadSession(
+      assetId=assetId, dataType=dataType, fileName=fileName,
+      filePath=filePath, sessionUri=sessionUri, size=stat.st_size,
+      mtime=int(stat.st_mtime), created=int(time.time()))
+  with _lock:
+    sessions = _load()
+    sessions[session.key()] = session.__dict__
+    _store(sessions)
+  return session
+
+
+def remove(assetId, fileName):
+  """Removes the session of a file upload once it has finished.
+
+  Args:
+    assetId: str, id of the maps engine asset.
+    fileName: str, name of the uploaded file.
+  """
+  key = makeKey(assetId, fileName)
+  with _lock:
+    sessions = _load()
+    if key in sessions:
+      del sessions[key]
+      _store(sessions)
+
+
+def pending():
+  """Returns the sessions of all unfinished uploads.
+
+  Returns:
+    list of UploadSession instances.
+  """
+  with _lock:
+    sessions = _load()
+  return [UploadSession(**x) for x in sessions.itervalues()]
+
+
+def saveJob(assetId, dataType, layerName, filesToUpload):
+  """Saves the files to upload to an asset, before their uploads start.
+
+  Args:
+    assetId: str, id of the maps engine asset.
+    dataType: str, either 'tables' or 'rasters'.
+    layerName: str, name of the uploaded layer.
+    filesToUpload: dict, of file names to paths on disk.
+  """
+  with _lock:
+    jobs = _load(JOBS_FILE)
+    jobs[assetId] = {'assetId': assetId, 'dataType': dataType,
+                     'layerName': layerName, 'files': filesToUpload,
+                     'completedFiles': [], 'created': int(time.time())}
+    _store(jobs, JOBS_FILE)
+
+
+def markFileDone(assetId, fileName):
+  """Records that a file of a saved job has been uploaded.
+
+  Args:
+    assetId: str, id of the maps engine asset.
+    fileName: str, name of the uploaded file.
+  """
+  with _lock:
+    jobs = _load(JOBS_FILE)
+    job = jobs.get(assetId)
+    if job and fileName not in job['completedFiles']:
+      job['completedFiles'].append(fileName)
+      _store(jobs, JOBS_FILE)
+
+
+def removeJob(assetId):
+  """Removes a saved job once all of its files have been uploaded.
+
+  Args:
+    assetId: str, id of the maps engine asset.
+  """
+  with _lock:
+    jobs = _load(JOBS_FILE)
+    if assetId in jobs:
+      del jobs[assetId]
+      _store(jobs, JOBS_FILE)
+
+
+def pendingJobs():
+  """Returns the saved jobs of all unfinished assets.
+
+  Returns:
+    list of dicts with assetId, dataType, layerName, files (file names to
+    paths), completedFiles and created keys.
+  """
+  with _lock:
+    jobs = _load(JOBS_FILE)
+  return jobs.values()
+
+
+def stagingDir():
+  """Creates a directory for files that are about to be uploaded.
+
+  Files in this directory survive a restart of QGIS, so an interrupted upload
+  can be resumed later.
+
+  Returns:
+    str, path of the new directory.
+  """
+  parent = os.path.join(settings.dataDir(), STAGING_DIR)
+  if not os.path.isdir(parent):
+    os.makedirs(parent)
+  return tempfile.mkdtemp(dir=parent)
+
+
+def removeStagingDir(path):
+  """Removes a staging directory unless it holds files of pending uploads.
+
+  Args:
+    path: str, path of the directory.
+  Returns:
+    True if the directory was removed.
+  """
+  path = os.path.abspath(path)
+  filePaths = [x.filePath for x in pending()]
+  for job in pendingJobs():
+    filePaths.extend(job['files'].itervalues())
+  for filePath in filePaths:
+    if os.path.abspath(filePath).startswith(path + os.sep):
+      return False
+  shutil.rmtree(path, ignore_errors=True)
+  return True
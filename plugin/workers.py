@@ -0,0 +1,94 @@
+"""Helpers to run independent blocking calls concurrently.
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+# Seconds to wait between calls to the wait callback.
+POLL_INTERVAL = 0.05
+
+
+def mapConcurrently(func, items, maxWorkers, waitCallback=None):
+  """Applies func to every item using a bounded pool of threads.
+
+  func must not touch Qt widgets, since it runs outside the GUI thread.
+
+  Args:
+    func: callable taking a single item.
+    items: list, of items to process.
+    maxWorkers: int, maximum number of calls to run at the same time.
+    waitCallback: callable, called periodically on the calling thread while
+        waiting for the results, e.g. QCoreApplication.processEvents.
+  Returns:
+    list of results in the same order as items.
+  """
+  items = list(items)
+  if not items:
+    return []
+  numWorkers = max(1, min(maxWorkers, len(items)))
+  if numWorkers == 1:
+    return [func(item) for item in items]
+
+  pool = ThreadPool(numWorkers)
+  try:
+    result = pool.map_async(func, items, chunksize=1)
+    while not result.ready():
+      if waitCallback:
+        waitCallback()
+      result.wait(POLL_INTERVAL)
+    return result.get()
+  finally:
+    pool.close()
+    pool.join()
+
+
+def iterConcurrently(func, items, maxWorkers, waitCallback=None):
+  """Applies func to every item and yields the results as they complete.
+
+  Unlike mapConcurrently, the caller can handle each result as soon as it is
+  available. func must not touch Qt widgets, since it runs outside the GUI
+  thread. If the caller stops iterating early, calls already running are left
+  to finish in the background.
+
+  Args:
+    func: callable taking a single item.
+    items: list, of items to process.
+    maxWorkers: int, maximum number of calls to run at the same time.
+    waitCallback: callable, called periodically on the calling thread while
+        waiting for the results, e.g. QCoreApplication.processEvents.
+  Yields:
+    results in the order in which they complete.
+  """
+  items = list(items)
+  if not items:
+    return
+  numWorkers = max(1, min(maxWorkers, len(items)))
+  pool = ThreadPool(numWorkers)
+  try:
+    results = pool.imap_unordered(func, items)
+    for unused_i in range(len(items)):
+      while True:
+        try:
+          result = results.next(POLL_INTERVAL)
+          break
+        except TimeoutError:
+          if waitCallback:
+            waitCallback()
+      yield result
+  finally:
+    pool.close()
@@ -0,0 +1,130 @@
+"""Stand-ins for the PyQt4 and QGIS modules, to run the tests outside QGIS.
+
+Every name imported from the fake modules is a class that accepts any
+arguments, and whose attributes and calls return further fakes. Signals can
+be connected and emitted but do nothing, and QCoreApplication.instance() is
+never the GUI thread's application, so the plugin behaves as on a worker
+thread. QSettings keeps its values in memory and the QGIS profile directory
+is a temporary directory.
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import types
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PLUGIN_DIR = os.path.join(ROOT_DIR, 'plugin')
+MODULES = ('PyQt4', 'PyQt4.QtCore', 'PyQt4.QtGui', 'PyQt4.QtNetwork',
+           'PyQt4.QtWebKit', 'qgis', 'qgis.core', 'qgis.gui')
+
+
+class _FakeType(type):
+  """Makes class attributes of fakes, e.g. QgsMessageLog.CRITICAL, fakes."""
+
+  def __getattr__(cls, name):
+    if name.startswith('__'):
+      raise AttributeError(name)
+    return Fake()
+
+
+class Fake(object):
+  """Object standing in for any Qt or QGIS class, instance or function."""
+  __metaclass__ = _FakeType
+
+  def __init__(self, *args, **kwargs):
+    pass
+
+  def __call__(self, *args, **kwargs):
+    return Fake()
+
+  def __getattr__(self, name):
+    if name.startswith('__'):
+      raise AttributeError(name)
+    return Fake()
+
+  def __iter__(self):
+    return iter([])
+
+
+class QSettings(object):
+  """In-memory QSettings shared by all instances."""
+  values = {}
+
+  def contains(self, key):
+    return key in QSettings.values
+
+  def value(self, key, type=None):
+    return QSettings.values[key]
+
+  def setValue(self, key, value):
+    QSettings.values[key] = value
+
+  def remove(self, key):
+    QSettings.values.pop(key, None)
+
+
+class QgsApplication(Fake):
+  """QgsApplication whose profile is a temporary directory."""
+  settingsDir = None
+
+  @staticmethod
+  def qgisSettingsDirPath():
+    if not QgsApplication.settingsDir:
+      QgsApplication.settingsDir = tempfile.mkdtemp(prefix='gmeconnector')
+      atexit.register(shutil.rmtree, QgsApplication.settingsDir, True)
+    return QgsApplication.settingsDir
+
+
+class _FakeModule(types.ModuleType):
+  """Module whose missing names are new Fake subclasses."""
+
+  def __getattr__(self, name):
+    if name.startswith('__'):
+      raise AttributeError(name)
+    fake = _FakeType(name, (Fake,), {})
+    setattr(self, name, fake)
+    return fake
+
+
+def install():
+  """Replaces PyQt4 and QGIS with fakes and puts the plugin on sys.path.
+
+  Plugin modules import each other by their bare names, as QGIS loads them
+  from the plugin directory.
+  """
+  if isinstance(sys.modules.get('qgis'), _FakeModule):
+    return
+  for name in MODULES:
+    module = _FakeModule(name)
+    sys.modules[name] = module
+    if '.' in name:
+      package, child = name.split('.')
+      setattr(sys.modules[package], child, module)
+  sys.modules['PyQt4.QtCore'].QSettings = QSettings
+  sys.modules['qgis.core'].QgsApplication = QgsApplication
+  for path in (ROOT_DIR, PLUGIN_DIR):
+    if path not in sys.path:
+      sys.path.insert(0, path)
+
+
+def clearSettings():
+  """Removes all values written to QSettings."""
+  QSettings.values.clear()
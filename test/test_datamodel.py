@@ -0,0 +1,117 @@
+"""Tests for the datamodel objects built from the JSON responses.
+
+Run from the repository root with:
+  python -m unittest discover -s test
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'plugin'))
+from datamodel import gme_datasource
+from datamodel import gme_folder
+from datamodel import gme_item
+from datamodel import gme_layer
+from datamodel import gme_map
+from datamodel import gme_maplist
+
+CONTENTS = [
+    {'type': 'layer', 'id': '123-1', 'name': 'Parcels'},
+    {'type': 'folder', 'name': 'Zoning', 'contents': [
+        {'type': 'layer', 'id': '123-2', 'name': 'Zones'},
+        {'type': 'folder', 'name': 'Historic', 'contents': [
+            {'type': 'layer', 'id': '123-3', 'name': 'Districts'}]}]}]
+
+
+class SlotsTest(unittest.TestCase):
+
+  def checkSlots(self, obj):
+    self.assertFalse(hasattr(obj, '__dict__'))
+    self.assertRaises(AttributeError, setattr, obj, 'unknown', 1)
+
+  def testSlots(self):
+    self.checkSlots(gme_map.Map(id='123-10', contents=CONTENTS))
+    self.checkSlots(gme_layer.Layer(id='123-1', datasources=[{'id': '1'}]))
+    self.checkSlots(gme_item.Item(id='123-1', type='layer'))
+    self.checkSlots(gme_folder.Folder(name='Zoning', contents=CONTENTS))
+    self.checkSlots(gme_datasource.DataSource(id='1'))
+    self.checkSlots(gme_maplist.MapList(maps=[{'id': '123-10'}]))
+
+  def testUnknownFieldsIgnored(self):
+    gmeMap = gme_map.Map(id='123-10', etag='"1"', projectId='123')
+    self.assertEqual(gmeMap.id, '123-10')
+    self.assertRaises(AttributeError, getattr, gmeMap, 'etag')
+
+  def testDataSourceProperties(self):
+    dataSource = gme_datasource.DataSource(id='1', name='Parcels')
+    self.assertEqual(dataSource.name, 'Parcels')
+    self.assertEqual(dataSource.properties, {'name': 'Parcels'})
+    self.assertRaises(AttributeError, getattr, dataSource, 'description')
+
+
+class LazyContentsTest(unittest.TestCase):
+
+  def testParsedOnFirstUse(self):
+    gmeMap = gme_map.Map(id='123-10', contents=CONTENTS)
+    self.assertTrue(gmeMap._rawContents is CONTENTS)
+    self.assertEqual(gmeMap._contents, None)
+    contents = gmeMap.contents
+    self.assertEqual(gmeMap._rawContents, None)
+    self.assertTrue(gmeMap.contents is contents)
+    self.assertEqual([x.name for x in contents], ['Parcels', 'Zoning'])
+
+  def testNestedFolders(self):
+    folder = gme_folder.Folder(name='Map', contents=CONTENTS)
+    zoning = folder.contents[1]
+    self.assertEqual(zoning.type, 'folder')
+    self.assertEqual([x.id for x in zoning.contents], ['123-2', None])
+    self.assertEqual(zoning.contents[1].contents[0].id, '123-3')
+    self.assertEqual(folder.contents[0].contents, [])
+
+  def testMapListDefersContents(self):
+    mapList = gme_maplist.MapList(
+        maps=[{'id': '123-%d' % i, 'contents': CONTENTS} for i in range(3)])
+    self.assertTrue(all(x._contents is None for x in mapList.maps))
+    self.assertEqual(len(mapList.maps[0].contents), 2)
+    self.assertTrue(mapList.maps[1]._contents is None)
+
+  def testConcurrentFirstUse(self):
+    for _ in range(50):
+      gmeMap = gme_map.Map(id='123-10', contents=CONTENTS)
+      start = threading.Event()
+      results = []
+
+      def read():
+        start.wait()
+        results.append(gmeMap.contents)
+
+      threads = [threading.Thread(target=read) for _ in range(8)]
+      for thread in threads:
+        thread.start()
+      start.set()
+      for thread in threads:
+        thread.join()
+      self.assertEqual(len(results), 8)
+      self.assertTrue(all(x is results[0] for x in results))
+      self.assertEqual(len(results[0]), 2)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,242 @@
+"""Tests for the partial response field masks sent by plugin/gme_api.py.
+
+A fake server answers the requests with full Maps Engine resources, trimmed
+to the requested field mask as the API does, so that the tests can check both
+what is requested and how many bytes the masks save.
+
+Run from the repository root with:
+  python -m unittest discover -s test
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import cStringIO
+import json
+import mimetools
+import unittest
+import urllib
+import urlparse
+
+import fake_qgis
+fake_qgis.install()
+import gme_api
+import metadata_cache
+
+
+def parseFieldMask(mask, start=0):
+  """Parses a field mask such as 'maps(id,name),nextPageToken'.
+
+  Returns:
+    tuple of (tree, end). tree maps field names to the tree of their
+    sub-fields, or None for whole fields. end is the index of the closing
+    parenthesis of a nested mask.
+  """
+  tree = {}
+  name = ''
+  i = start
+  while i < len(mask):
+    c = mask[i]
+    if c == '(':
+      tree[name], i = parseFieldMask(mask, i + 1)
+      name = ''
+    elif c in ',)':
+      if name:
+        tree[name] = None
+      name = ''
+      if c == ')':
+        return tree, i
+    else:
+      name += c
+    i += 1
+  if name:
+    tree[name] = None
+  return tree, i
+
+
+def applyFieldMask(value, tree):
+  """Returns the parts of a decoded JSON value selected by a mask tree."""
+  if tree is None:
+    return value
+  if isinstance(value, list):
+    return [applyFieldMask(x, tree) for x in value]
+  return dict((k, applyFieldMask(v, tree[k]))
+              for k, v in value.iteritems() if k in tree)
+
+
+def makeLayer(layerId):
+  """Returns a layer resource with the fields the API sends by default."""
+  return {
+      'id': layerId,
+      'name': 'Layer %s' % layerId,
+      'description': 'Parcels surveyed in 2013, updated every quarter.',
+      'bbox': [-122.5, 37.7, -122.3, 37.8],
+      'datasourceType': 'table',
+      'datasources': [{'id': '%s1' % layerId}],
+      'projectId': '123',
+      'etag': '"1413"',
+      'creationTime': '2013-10-01T12:00:00.000Z',
+      'creatorEmail': 'someone@example.com',
+      'lastModifiedTime': '2013-11-01T12:00:00.000Z',
+      'lastModifierEmail': 'someone@example.com',
+      'processingStatus': 'complete',
+      'publishingStatus': 'published',
+      'tags': ['parcels', 'survey'],
+      'draftAccessList': 'Map Editors',
+      'style': {
+          'type': 'displayRule',
+          'displayRules': [
+              {'name': 'Rule %d' % i,
+               'zoomLevels': {'min': 0, 'max': 24},
+               'polygonOptions': {
+                   'fill': {'color': '#ff0000', 'opacity': 0.5},
+                   'stroke': {'color': '#000000', 'width': 1}}}
+              for i in range(10)]},
+  }
+
+
+def makeMap(mapId):
+  """Returns a map resource with the fields the API sends by default."""
+  return {
+      'id': mapId,
+      'name': 'Map %s' % mapId,
+      'description': 'Land use and zoning of the city and its surroundings.',
+      'bbox': [-122.5, 37.7, -122.3, 37.8],
+      'contents': [
+          {'type': 'layer', 'id': '123-1', 'name': 'Parcels',
+           'visibility': 'defaultOn', 'key': 'parcels'},
+          {'type': 'folder', 'name': 'Zoning', 'visibility': 'defaultOff',
+           'expandable': True,
+           'contents': [{'type': 'layer', 'id': '123-2', 'name': 'Zones',
+                         'visibility': 'defaultOn'}]}],
+      'defaultViewport': [-122.5, 37.7, -122.3, 37.8],
+      'versions': ['published'],
+      'projectId': '123',
+      'etag': '"2718"',
+      'creationTime': '2013-10-01T12:00:00.000Z',
+      'creatorEmail': 'someone@example.com',
+      'lastModifiedTime': '2013-11-01T12:00:00.000Z',
+      'lastModifierEmail': 'someone@example.com',
+      'processingStatus': 'complete',
+      'publishingStatus': 'published',
+      'tags': ['zoning', 'land use'],
+      'draftAccessList': 'Map Editors',
+      'publishedAccessList': 'Map Viewers',
+  }
+
+
+class FakeServer(object):
+  """Replaces http_pool.urlopen with canned Maps Engine responses.
+
+  Attributes:
+    requests: list, of (path, fields) tuples of the requests received.
+    bytesSent: int, size of the response bodies sent.
+    bytesFull: int, size the same responses would have had without masks.
+  """
+
+  def __init__(self):
+    self.requests = []
+    self.bytesSent = 0
+    self.bytesFull = 0
+
+  def resource(self, path, query):
+    """Returns the full resource for a request path."""
+    collection, resourceId = path.split('/')[-2:]
+    if resourceId == 'maps':
+      return {'maps': [makeMap('123-%d' % i) for i in range(50)]}
+    if collection == 'maps':
+      return makeMap(resourceId)
+    return makeLayer(resourceId)
+
+  def urlopen(self, request, progressCallback=None):
+    url = request.get_full_url()
+    parts = urlparse.urlsplit(url)
+    query = urlparse.parse_qs(parts.query)
+    fields = query.get('fields', [None])[0]
+    self.requests.append((parts.path, fields))
+    full = self.resource(parts.path, query)
+    body = json.dumps(full)
+    self.bytesFull += len(body)
+    if fields:
+      body = json.dumps(applyFieldMask(full, parseFieldMask(fields)[0]))
+    self.bytesSent += len(body)
+    headers = mimetools.Message(cStringIO.StringIO('\r\n'))
+    return urllib.addinfourl(cStringIO.StringIO(body), headers, url, 200)
+
+
+class Token(object):
+  access_token = 'token'
+
+
+class FieldMaskTest(unittest.TestCase):
+
+  def setUp(self):
+    self.server = FakeServer()
+    self.urlopen = gme_api.http_pool.urlopen
+    gme_api.http_pool.urlopen = self.server.urlopen
+    metadata_cache.clear()
+    self.api = gme_api.GoogleMapsEngineAPI(None)
+
+  def tearDown(self):
+    gme_api.http_pool.urlopen = self.urlopen
+
+  def testParseFieldMask(self):
+    self.assertEqual(parseFieldMask('maps(id,name),nextPageToken')[0],
+                     {'maps': {'id': None, 'name': None},
+                      'nextPageToken': None})
+
+  def testMapListing(self):
+    maps = self.api.getMapsByProjectId('123', Token())
+    self.assertEqual(self.server.requests,
+                     [('/mapsengine/v1/maps', gme_api.MAP_LIST_FIELDS)])
+    self.assertEqual(len(maps), 50)
+    self.assertEqual((maps[0].id, maps[0].name), ('123-0', 'Map 123-0'))
+
+  def testMap(self):
+    gmeMap = self.api.getMapById('123-10', Token())
+    self.assertEqual(self.server.requests,
+                     [('/mapsengine/v1/maps/123-10', gme_api.MAP_FIELDS)])
+    self.assertEqual(gmeMap.bbox, [-122.5, 37.7, -122.3, 37.8])
+    self.assertEqual([x.name for x in gmeMap.contents], ['Parcels', 'Zoning'])
+    self.assertEqual(gmeMap.contents[1].contents[0].id, '123-2')
+
+  def testLayer(self):
+    layer = self.api.getLayerById('123-1', Token())
+    self.assertEqual(self.server.requests,
+                     [('/mapsengine/v1/layers/123-1', gme_api.LAYER_FIELDS)])
+    self.assertEqual(layer.name, 'Layer 123-1')
+    self.assertEqual(layer.datasourceType, 'table')
+    self.assertEqual(layer.bbox, [-122.5, 37.7, -122.3, 37.8])
+
+  def testFullResource(self):
+    layer = self.api.getLayerById('123-3', Token(), fields=None)
+    self.assertEqual(self.server.requests,
+                     [('/mapsengine/v1/layers/123-3', None)])
+    self.assertEqual(layer.dataSources[0].id, '123-31')
+    self.assertEqual(self.server.bytesSent, self.server.bytesFull)
+
+  def testByteSavings(self):
+    self.api.getMapsByProjectId('123', Token())
+    self.api.getMapById('123-10', Token())
+    for i in range(8):
+      self.api.getLayerById('123-%d' % i, Token())
+    # The map listing only keeps ids and names, and layers leave out their
+    # styles, so the masked responses are a fraction of the full ones.
+    self.assertTrue(self.server.bytesSent < self.server.bytesFull / 4,
+                    (self.server.bytesSent, self.server.bytesFull))
+
+
+if __name__ == '__main__':
+  unittest.main()
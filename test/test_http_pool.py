@@ -0,0 +1,81 @@
+"""Tests for the response bodies of plugin/http_pool.py.
+
+Run from the repository root with:
+  python -m unittest discover -s test
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import json
+import os
+import sys
+import unittest
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'plugin'))
+import http_pool
+
+
+def gzipChunks(data, chunkSize=1024):
+  """Returns data gzip encoded and split into blocks, as read from a socket."""
+  encoder = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+  encoded = encoder.compress(data) + encoder.flush()
+  return [encoded[i:i + chunkSize]
+          for i in range(0, len(encoded), chunkSize)]
+
+
+class GzipBodyTest(unittest.TestCase):
+
+  def setUp(self):
+    self.data = json.dumps(
+        [{'id': str(i), 'name': 'Map %d' % i} for i in range(5000)])
+
+  def testReadAll(self):
+    body = http_pool.GzipBody(gzipChunks(self.data))
+    self.assertEqual(json.load(body), json.loads(self.data))
+    self.assertEqual(body.read(), '')
+
+  def testReadInBlocks(self):
+    body = http_pool.GzipBody(gzipChunks(self.data))
+    blocks = list(iter(lambda: body.read(1000), ''))
+    self.assertTrue(all(len(x) == 1000 for x in blocks[:-1]))
+    self.assertEqual(''.join(blocks), self.data)
+
+  def testDecompressesOnlyWhatIsRead(self):
+    chunks = gzipChunks(self.data)
+    body = http_pool.GzipBody(chunks)
+    body.read(10)
+    self.assertTrue(len(body._chunks) < len(chunks))
+    self.assertTrue(len(body._buffer) < len(self.data))
+
+  def testLines(self):
+    data = ''.join('line %d\n' % i for i in range(1000)) + 'last'
+    body = http_pool.GzipBody(gzipChunks(data, 100))
+    self.assertEqual(body.readline(), 'line 0\n')
+    self.assertEqual(body.readline(3), 'lin')
+    self.assertEqual(body.readline(), 'e 1\n')
+    lines = body.readlines()
+    self.assertEqual(len(lines), 999)
+    self.assertEqual(lines[-1], 'last')
+
+  def testInvalidData(self):
+    body = http_pool.GzipBody(['not gzip data'])
+    self.assertRaises(IOError, body.read)
+    self.assertEqual(body.read(), '')
+
+
+if __name__ == '__main__':
+  unittest.main()
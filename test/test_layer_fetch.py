@@ -0,0 +1,151 @@
+"""Tests for the concurrent layer fetches of plugin/search_gme_dialog.py.
+
+The layers of a map are fetched with a stubbed API whose calls take varying
+times, to check that the results keep the order of the map contents and that
+a layer that cannot be fetched falls back to its item.
+
+Run from the repository root with:
+  python -m unittest discover -s test
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import threading
+import time
+import unittest
+import urllib2
+
+import fake_qgis
+fake_qgis.install()
+import gme_api
+import oauth2_utils
+import search_gme_dialog
+from datamodel import gme_item
+from datamodel import gme_layer
+
+
+class Fetcher(object):
+  """Carries the layer fetching methods of the dialog without its widgets."""
+  iface = None
+  getLayerItems = search_gme_dialog.Dialog.getLayerItems.im_func
+  fetchFullLayers = search_gme_dialog.Dialog.fetchFullLayers.im_func
+  fetchFullLayer = search_gme_dialog.Dialog.fetchFullLayer.im_func
+
+
+def makeContents():
+  """Returns map contents with layers nested in folders."""
+  return gme_item.parseContents([
+      {'type': 'layer', 'id': 'a'},
+      {'type': 'folder', 'name': 'Roads', 'contents': [
+          {'type': 'layer', 'id': 'c'},
+          {'type': 'folder', 'name': 'Bridges', 'contents': [
+              {'type': 'layer', 'id': 'e'}]},
+          {'type': 'layer', 'id': 'd'}]},
+      {'type': 'layer', 'id': 'b'},
+      {'type': 'folder', 'name': 'Empty'}])
+
+
+class FakeApi(object):
+  """Replaces GoogleMapsEngineAPI.getLayerById.
+
+  Attributes:
+    delays: dict, of seconds each layer id takes to fetch.
+    missing: set, of layer ids for which None is returned.
+    failing: set, of layer ids for which an error is raised.
+    fetched: list, of the layer ids requested.
+    maxActive: int, largest number of simultaneous requests.
+  """
+
+  def __init__(self):
+    self.delays = {}
+    self.missing = set()
+    self.failing = set()
+    self.fetched = []
+    self.maxActive = 0
+    self._active = 0
+    self._lock = threading.Lock()
+
+  def getLayerById(self, layerId, token):
+    with self._lock:
+      self.fetched.append(layerId)
+      self._active += 1
+      self.maxActive = max(self.maxActive, self._active)
+    try:
+      time.sleep(self.delays.get(layerId, 0))
+      if layerId in self.failing:
+        raise urllib2.URLError('timed out')
+      if layerId in self.missing:
+        return None
+      return gme_layer.Layer(id=layerId, name='Layer %s' % layerId)
+    finally:
+      with self._lock:
+        self._active -= 1
+
+
+class LayerFetchTest(unittest.TestCase):
+
+  def setUp(self):
+    self.api = FakeApi()
+    self.getLayerById = gme_api.GoogleMapsEngineAPI.getLayerById
+    self.getToken = oauth2_utils.getToken
+    gme_api.GoogleMapsEngineAPI.getLayerById = (
+        lambda _, layerId, token: self.api.getLayerById(layerId, token))
+    oauth2_utils.getToken = lambda: 'token'
+    fake_qgis.clearSettings()
+    self.fetcher = Fetcher()
+
+  def tearDown(self):
+    gme_api.GoogleMapsEngineAPI.getLayerById = self.getLayerById
+    oauth2_utils.getToken = self.getToken
+    fake_qgis.clearSettings()
+
+  def testLayerItemsOrder(self):
+    layers = self.fetcher.getLayerItems(makeContents())
+    # Layers at each level come before the layers of its folders.
+    self.assertEqual([x.id for x in layers], ['a', 'b', 'c', 'd', 'e'])
+
+  def testOrderKeptWithVaryingDelays(self):
+    self.api.delays = {'a': 0.2, 'b': 0.0, 'c': 0.15, 'd': 0.05, 'e': 0.1}
+    layers = self.fetcher.fetchFullLayers(
+        self.fetcher.getLayerItems(makeContents()))
+    self.assertEqual([x.id for x in layers], ['a', 'b', 'c', 'd', 'e'])
+    self.assertTrue(all(isinstance(x, gme_layer.Layer) for x in layers))
+    self.assertEqual(sorted(self.api.fetched), ['a', 'b', 'c', 'd', 'e'])
+    self.assertTrue(self.api.maxActive > 1)
+
+  def testWorkersSetting(self):
+    fake_qgis.QSettings.values['gmeconnector/FETCH_WORKERS'] = 2
+    self.api.delays = dict((x, 0.05) for x in 'abcde')
+    self.fetcher.fetchFullLayers(self.fetcher.getLayerItems(makeContents()))
+    self.assertEqual(self.api.maxActive, 2)
+
+  def testFallbackToItem(self):
+    self.api.missing = set(['b'])
+    self.api.failing = set(['d'])
+    items = self.fetcher.getLayerItems(makeContents())
+    layers = self.fetcher.fetchFullLayers(items)
+    self.assertEqual([x.id for x in layers], ['a', 'b', 'c', 'd', 'e'])
+    self.assertTrue(layers[1] is items[1])
+    self.assertTrue(layers[3] is items[3])
+    self.assertTrue(isinstance(layers[4], gme_layer.Layer))
+
+  def testNoLayers(self):
+    self.assertEqual(self.fetcher.fetchFullLayers([]), [])
+    self.assertEqual(self.api.fetched, [])
+
+
+if __name__ == '__main__':
+  unittest.main()
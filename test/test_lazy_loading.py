@@ -0,0 +1,72 @@
+"""Tests that starting the plugin does not load its dialogs.
+
+googlemapsengineconnector.py only imports the dialogs and the Qt resources
+when they are first used, so that QGIS starts faster. The plugin is started
+in a fresh interpreter to see which modules it loaded.
+
+Run from the repository root with:
+  python -m unittest discover -s test
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+# Modules that must only be imported when the user opens a dialog.
+LAZY_MODULES = ('plugin.search_gme_dialog', 'plugin.signin_dialog',
+                'plugin.wms_dialog', 'plugin.more_dialog',
+                'plugin.upload_dialog', 'plugin.upload_jobs_dock',
+                'resources_rc')
+
+# Starts the plugin as QGIS does and prints the loaded modules as JSON.
+START_PLUGIN = """
+import json
+import sys
+import fake_qgis
+fake_qgis.install()
+import googlemapsengineconnector
+connector = googlemapsengineconnector.GoogleMapsEngineConnector(
+    fake_qgis.Fake())
+connector.initGui()
+loaded = [name for name, module in sys.modules.items() if module]
+print json.dumps({'modules': loaded,
+                  'signInDlg': connector.signInDlg is not None})
+connector.unload()
+"""
+
+
+class LazyLoadingTest(unittest.TestCase):
+
+  def testStartupSkipsDialogs(self):
+    process = subprocess.Popen(
+        [sys.executable, '-c', START_PLUGIN],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    self.assertEqual(process.returncode, 0, err)
+    result = json.loads(out.splitlines()[0])
+    self.assertTrue('googlemapsengineconnector' in result['modules'])
+    self.assertEqual(
+        [x for x in LAZY_MODULES if x in result['modules']], [])
+    self.assertFalse(result['signInDlg'])
+
+
+if __name__ == '__main__':
+  unittest.main()
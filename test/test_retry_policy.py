@@ -0,0 +1,126 @@
+"""Tests for plugin/retry_policy.py.
+
+Run from the repository root with:
+  python -m unittest discover -s test
+
+Copyright 2013 Google Inc.
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+import cStringIO
+import email.utils
+import json
+import mimetools
+import time
+import unittest
+import urllib2
+
+import fake_qgis
+fake_qgis.install()
+import retry_policy
+
+
+def makeHttpError(code, reasons=None, retryAfter=None):
+  """Returns an HTTPError as raised by http_pool.urlopen."""
+  headers = ''
+  if retryAfter is not None:
+    headers = 'Retry-After: %s\r\n' % retryAfter
+  hdrs = mimetools.Message(cStringIO.StringIO(headers + '\r\n'))
+  body = ''
+  if reasons:
+    body = json.dumps(
+        {'error': {'errors': [{'reason': x} for x in reasons]}})
+  return urllib2.HTTPError('https://www.googleapis.com/mapsengine/v1/maps',
+                           code, 'error', hdrs, cStringIO.StringIO(body))
+
+
+class RetryAfterTest(unittest.TestCase):
+
+  def testSeconds(self):
+    self.assertEqual(
+        retry_policy.getRetryAfter(makeHttpError(503, retryAfter='7')), 7.0)
+
+  def testHttpDate(self):
+    date = email.utils.formatdate(time.time() + 30, usegmt=True)
+    delay = retry_policy.getRetryAfter(makeHttpError(503, retryAfter=date))
+    self.assertTrue(28 <= delay <= 30, delay)
+
+  def testPastDate(self):
+    date = email.utils.formatdate(time.time() - 30, usegmt=True)
+    self.assertEqual(
+        retry_policy.getRetryAfter(makeHttpError(503, retryAfter=date)), 0.0)
+
+  def testMissingOrInvalid(self):
+    self.assertIsNone(retry_policy.getRetryAfter(makeHttpError(503)))
+    self.assertIsNone(
+        retry_policy.getRetryAfter(makeHttpError(503, retryAfter='soon')))
+    self.assertIsNone(
+        retry_policy.getRetryAfter(urllib2.URLError('timed out')))
+
+
+class ShouldRetryTest(unittest.TestCase):
+
+  def setUp(self):
+    self.read = retry_policy.RetryPolicy(maxAttempts=3)
+    self.write = retry_policy.POLICIES[retry_policy.WRITE]
+
+  def testTransientErrors(self):
+    for code in retry_policy.RETRYABLE_STATUS:
+      self.assertTrue(self.read.shouldRetry(makeHttpError(code), 1), code)
+    self.assertTrue(self.read.shouldRetry(urllib2.URLError('reset'), 1))
+
+  def testPermanentErrors(self):
+    for code in (400, 401, 404):
+      self.assertFalse(self.read.shouldRetry(makeHttpError(code), 1), code)
+    self.assertFalse(
+        self.read.shouldRetry(makeHttpError(403, ['forbidden']), 1))
+
+  def testRateLimitReasons(self):
+    for reason in retry_policy.RATE_LIMIT_REASONS:
+      self.assertTrue(self.read.shouldRetry(makeHttpError(403, [reason]), 1))
+
+  def testAttemptsExhausted(self):
+    self.assertTrue(self.read.shouldRetry(makeHttpError(503), 2))
+    self.assertFalse(self.read.shouldRetry(makeHttpError(503), 3))
+
+  def testWritesAreNotRetriedAfterNetworkErrors(self):
+    self.assertFalse(self.write.shouldRetry(urllib2.URLError('reset'), 1))
+    self.assertFalse(self.write.shouldRetry(makeHttpError(500), 1))
+    self.assertTrue(self.write.shouldRetry(makeHttpError(503), 1))
+
+  def testRetryAfterAboveCeiling(self):
+    error = makeHttpError(
+        503, retryAfter=str(retry_policy.MAX_RETRY_AFTER + 1))
+    self.assertFalse(self.read.shouldRetry(error, 1))
+
+
+class GetDelayTest(unittest.TestCase):
+
+  def setUp(self):
+    self.policy = retry_policy.RetryPolicy(baseDelay=1.0, maxDelay=8.0)
+
+  def testExponentialBackoffWithJitter(self):
+    for attempt, delay in ((1, 1.0), (2, 2.0), (3, 4.0), (4, 8.0), (6, 8.0)):
+      for unused_i in range(20):
+        value = self.policy.getDelay(makeHttpError(503), attempt)
+        self.assertTrue(delay / 2 <= value <= delay, (attempt, value))
+
+  def testRetryAfterIsHonoredInFull(self):
+    error = makeHttpError(429, retryAfter='30')
+    self.assertEqual(self.policy.getDelay(error, 1), 30.0)
+
+
+if __name__ == '__main__':
+  unittest.main()